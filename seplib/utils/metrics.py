@@ -0,0 +1,170 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _RollingWindow(ABC):
+    """
+    Splits a rolling time window into fixed slots. Each slot is reset the first time it is used in a new period,
+    so old data ages out without any background task.
+    """
+
+    def __init__(self, window: float, slots: int):
+        self.window = window
+        self.slots = slots
+        self.slot_length = window / slots
+        self._slot_ids = [-1] * slots
+
+    def _current_index(self, now: Optional[float]) -> int:
+        slot_id = int((time.monotonic() if now is None else now) // self.slot_length)
+        index = slot_id % self.slots
+        if self._slot_ids[index] != slot_id:
+            self._slot_ids[index] = slot_id
+            self._reset_slot(index)
+        return index
+
+    def _live_indexes(self, now: Optional[float]) -> Iterable[int]:
+        current_id = int((time.monotonic() if now is None else now) // self.slot_length)
+        for index, slot_id in enumerate(self._slot_ids):
+            if current_id - self.slots < slot_id <= current_id:
+                yield index
+
+    @abstractmethod
+    def _reset_slot(self, index: int):
+        pass
+
+
+class RollingCounter(_RollingWindow):
+    """
+    Counter which tracks both its lifetime total and the count over the last `window` seconds.
+    """
+
+    def __init__(self, window: float = 300, slots: int = 30):
+        super(RollingCounter, self).__init__(window=window, slots=slots)
+        self.total = 0
+        self.__counts = [0] * slots
+
+    def _reset_slot(self, index: int):
+        self.__counts[index] = 0
+
+    def add(self, amount: int = 1, now: Optional[float] = None):
+        self.__counts[self._current_index(now)] += amount
+        self.total += amount
+
+    def recent(self, now: Optional[float] = None) -> int:
+        return sum(self.__counts[index] for index in self._live_indexes(now))
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """
+        :return: Average per second over the rolling window.
+        """
+        return self.recent(now) / self.window
+
+
+class RollingHistogram(_RollingWindow):
+    """
+    Fixed-bucket histogram of observed values (eg. latencies in seconds). Keeps lifetime cumulative buckets for
+    export, and a rolling window of buckets for percentiles over the last `window` seconds.
+    """
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BOUNDS, window: float = 300, slots: int = 30):
+        super(RollingHistogram, self).__init__(window=window, slots=slots)
+        self.bounds = tuple(bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.__buckets = [0] * (len(self.bounds) + 1)
+        self.__slot_buckets = [[0] * (len(self.bounds) + 1) for _ in range(slots)]
+
+    def _reset_slot(self, index: int):
+        self.__slot_buckets[index] = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float, now: Optional[float] = None):
+        bucket = bisect.bisect_left(self.bounds, value)
+        self.__buckets[bucket] += 1
+        self.__slot_buckets[self._current_index(now)][bucket] += 1
+        self.count += 1
+        self.sum += value
+
+    def recent_buckets(self, now: Optional[float] = None) -> List[int]:
+        totals = [0] * (len(self.bounds) + 1)
+        for index in self._live_indexes(now):
+            for bucket, count in enumerate(self.__slot_buckets[index]):
+                totals[bucket] += count
+        return totals
+
+    def percentile(self, percent: float, now: Optional[float] = None) -> Optional[float]:
+        """
+        Estimate a percentile over the rolling window as the upper bound of the bucket it falls in.
+        :return: The estimate in the observed unit, infinity if it falls above the last bound, or None with no data.
+        """
+        buckets = self.recent_buckets(now)
+        total = sum(buckets)
+        if not total:
+            return None
+
+        threshold = total * percent / 100.0
+        cumulative = 0
+        for bucket, count in enumerate(buckets):
+            cumulative += count
+            if cumulative >= threshold:
+                return self.bounds[bucket] if bucket < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        """
+        :return: Lifetime (le, cumulative count) pairs in the Prometheus histogram format.
+        """
+        pairs = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.__buckets):
+            cumulative += count
+            pairs.append((repr(float(bound)), cumulative))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+class PrometheusWriter(object):
+    """
+    Builds a Prometheus text exposition format document.
+    """
+
+    def __init__(self):
+        self.__lines = []  # type: List[str]
+        self.__declared = set()
+
+    @staticmethod
+    def __labels(labels: Optional[Dict[str, object]]) -> str:
+        if not labels:
+            return ""
+        escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items())
+        return "{" + ",".join(escaped) + "}"
+
+    def __declare(self, name: str, metric_type: str, help_text: str):
+        if name not in self.__declared:
+            self.__declared.add(name)
+            self.__lines.append(f"# HELP {name} {help_text}")
+            self.__lines.append(f"# TYPE {name} {metric_type}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, object]] = None):
+        self.__declare(name, "counter", help_text)
+        self.__lines.append(f"{name}{self.__labels(labels)} {value}")
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, object]] = None):
+        self.__declare(name, "gauge", help_text)
+        self.__lines.append(f"{name}{self.__labels(labels)} {value}")
+
+    def histogram(self, name: str, help_text: str, histogram: RollingHistogram,
+                  labels: Optional[Dict[str, object]] = None):
+        self.__declare(name, "histogram", help_text)
+        for le, count in histogram.cumulative_buckets():
+            bucket_labels = dict(labels or {})
+            bucket_labels['le'] = le
+            self.__lines.append(f"{name}_bucket{self.__labels(bucket_labels)} {count}")
+        self.__lines.append(f"{name}_sum{self.__labels(labels)} {histogram.sum}")
+        self.__lines.append(f"{name}_count{self.__labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.__lines) + "\n"
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+
+class TokenBucket(object):
+    """
+    Async token bucket. Holds up to `capacity` tokens and refills at `rate` tokens per second.
+    Waiters are served in the order they called acquire().
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+
+        self.__updated = time.monotonic()
+        self.__lock = asyncio.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.capacity), self.tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    @property
+    def idle(self) -> bool:
+        """
+        :return: True if the bucket is full and nobody is waiting, ie. it can be dropped without losing state.
+        """
+        self.__refill()
+        return self.tokens >= self.capacity and not self.__lock.locked()
+
+    async def acquire(self, tokens: float = 1):
+        async with self.__lock:
+            self.__refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self.__refill()
+            self.tokens -= tokens
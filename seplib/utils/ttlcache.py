@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class TTLCache(object):
+    """
+    Bounded LRU cache whose entries expire `ttl` seconds after they were set.
+    Once it holds more than `maxsize` entries, the least recently used ones are dropped.
+    Any value can be cached, including None, eg. to remember that a lookup found nothing.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.__entries = OrderedDict()  # type: OrderedDict[Hashable, Tuple[float, Any]]
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        :param key: Key of the entry
+        :return: Tuple of (cached, value). The value is None if the key is not cached or has expired.
+        """
+        entry = self.__entries.get(key)
+        if entry is None:
+            return False, None
+
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.__entries[key]
+            return False, None
+
+        self.__entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any):
+        self.__entries[key] = (time.monotonic() + self.ttl, value)
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """
+        Remove an entry, if it is cached.
+        :param key: Key of the entry
+        :return: None
+        """
+        self.__entries.pop(key, None)
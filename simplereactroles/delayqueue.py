@@ -0,0 +1,52 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, List, Tuple
+
+
+class DelayQueue(object):
+    """
+    asyncio queue which only releases an item once its delay has elapsed.
+    Items are kept in a heap ordered by their due time, so a single consumer can wait on all of them.
+    """
+
+    def __init__(self):
+        self.__heap = []  # type: List[Tuple[float, int, Any]]
+        self.__counter = itertools.count()
+        self.__changed = asyncio.Event()
+
+    def put(self, item: Any, delay: float):
+        """
+        Add an item to the queue.
+        :param item: Item to add.
+        :param delay: Seconds to wait before the item is released by get().
+        :return: None
+        """
+        heapq.heappush(self.__heap, (time.monotonic() + delay, next(self.__counter), item))
+        self.__changed.set()
+
+    async def get(self) -> Any:
+        """
+        Wait for the next item whose delay has elapsed.
+        :return: The item.
+        """
+        while True:
+            self.__changed.clear()
+
+            if not self.__heap:
+                await self.__changed.wait()
+                continue
+
+            remaining = self.__heap[0][0] - time.monotonic()
+            if remaining <= 0:
+                return heapq.heappop(self.__heap)[2]
+
+            try:
+                # wake up early if an item with a shorter delay is added
+                await asyncio.wait_for(self.__changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def qsize(self) -> int:
+        return len(self.__heap)
@@ -0,0 +1,108 @@
+import asyncio
+from logging import Logger
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from cog_shared.seplib.utils.ttlcache import TTLCache
+
+
+class MemberResolver(object):
+    """
+    Resolves guild members, including members which are not in the bot's member cache.
+
+    Members missing from the cache are fetched from Discord with one REST request each, since discord.py 1.0 has
+    no request for several members by ID. Concurrent lookups of the same member share one request, and at most
+    MAX_CONCURRENT_FETCHES requests are made at once. A failed request is retried for that member only.
+    Fetched members are held in a bounded LRU cache for CACHE_TTL seconds, so the bot does not need to cache every
+    member of every guild to handle reactions.
+    """
+
+    MAX_CONCURRENT_FETCHES = 10
+    CACHE_SIZE = 5000
+    CACHE_TTL = 60
+    MAX_FETCH_ATTEMPTS = 3
+    FETCH_RETRY_DELAY = 0.5
+
+    def __init__(self, bot, logger: Logger):
+        self.bot = bot
+        self.logger = logger
+
+        self.__cache = TTLCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self.__futures = {}  # type: Dict[Tuple[int, int], asyncio.Future]
+        self.__fetch_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_FETCHES)
+
+    async def resolve(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        """
+        Resolve a member of a guild by their user ID.
+        :param guild: discord.py Guild the member belongs to.
+        :param user_id: Integer ID of the user.
+        :return: discord.py Member, or None if the user is not a member of the guild or could not be fetched.
+        """
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        # join a lookup which is already in flight, so that events for the same member resume in order
+        future = self.__futures.get((guild.id, user_id))
+        if future is not None:
+            if future.done():
+                # let the callers already woken up by this lookup run first
+                await asyncio.sleep(0)
+            return await future
+
+        cached, member = self.__cache.get((guild.id, user_id))
+        if cached:
+            return member
+
+        future = self.__futures[(guild.id, user_id)] = asyncio.get_event_loop().create_future()
+        asyncio.ensure_future(self.__fetch(guild, user_id, future))
+        return await future
+
+    def invalidate(self, guild_id: int, user_id: int):
+        """
+        Remove a member from the LRU cache, eg. after their roles were edited.
+        :param guild_id: Integer ID of the guild.
+        :param user_id: Integer ID of the user.
+        :return: None
+        """
+        self.__cache.pop((guild_id, user_id))
+
+    async def __fetch(self, guild: discord.Guild, user_id: int, future: asyncio.Future):
+        member = None
+        for attempt in range(1, self.MAX_FETCH_ATTEMPTS + 1):
+            try:
+                member = await self.__fetch_member(guild, user_id)
+                break
+            except Exception as e:
+                self.logger.error(f"Error fetching uncached member {user_id} for guild {guild.id}. "
+                                  f"Attempt {attempt} of {self.MAX_FETCH_ATTEMPTS}. Exception: {e}")
+                if attempt < self.MAX_FETCH_ATTEMPTS:
+                    await asyncio.sleep(self.FETCH_RETRY_DELAY * attempt)
+
+        if member is not None:
+            self.__cache.set((guild.id, member.id), member)
+
+        if not future.done():
+            future.set_result(member)
+        # forget the lookup only after the callers woken up by set_result have run
+        asyncio.get_event_loop().call_soon(self.__futures.pop, (guild.id, user_id), None)
+
+    async def __fetch_member(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        """
+        Fetch a member from Discord with a REST request.
+        :param guild: discord.py Guild to fetch the member from.
+        :param user_id: Integer ID of the user to fetch.
+        :raises discord.HTTPException: if the request failed for another reason than the user not being a member.
+        :return: discord.py Member, or None if the user is not a member of the guild.
+        """
+        async with self.__fetch_semaphore:
+            try:
+                data = await self.bot.http.get_member(guild.id, user_id)
+            except discord.NotFound:
+                return None
+        return self._member_from_data(guild, data)
+
+    @staticmethod
+    def _member_from_data(guild: discord.Guild, data: dict) -> discord.Member:
+        return discord.Member(data=data, guild=guild, state=guild._state)
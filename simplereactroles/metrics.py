@@ -0,0 +1,96 @@
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from cog_shared.seplib.utils.metrics import RollingCounter, RollingHistogram, PrometheusWriter
+
+
+class GuildPipelineMetrics(object):
+    """
+    Rolling counters and latency histograms of the role pipeline for a single guild.
+    """
+
+    COUNTERS = {
+        'events': "Reaction events which matched an activated reaction role.",
+        'coalesced': "Reaction events merged into a role action which was already pending.",
+        'edits': "Member edits applied.",
+        'skipped': "Pending role actions which needed no member edit.",
+        'retries': "Member edits which failed and were scheduled for a retry.",
+        'dead_lettered': "Pending role actions dropped to the dead letter list.",
+    }
+
+    HISTOGRAMS = {
+        'wait_latency': "Seconds from the first reaction of a pending role action until its member edit applied.",
+        'edit_latency': "Seconds taken by the member edit API call.",
+    }
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, RollingCounter())
+        for name in self.HISTOGRAMS:
+            setattr(self, name, RollingHistogram())
+
+    def coalesced_percent(self) -> float:
+        events = self.events.recent()
+        return (self.coalesced.recent() / events) * 100 if events else 0.0
+
+
+class PipelineMetrics(object):
+    """
+    Operational metrics of the reaction role pipeline, kept per guild.
+    """
+
+    PROMETHEUS_PREFIX = "simplereactroles"
+
+    def __init__(self):
+        self.guilds = defaultdict(GuildPipelineMetrics)  # type: Dict[int, GuildPipelineMetrics]
+
+    def guild(self, guild_id: int) -> GuildPipelineMetrics:
+        return self.guilds[guild_id]
+
+    def export(self, gauges: Dict[str, Tuple[str, float]]) -> dict:
+        """
+        Structured snapshot of every metric, suitable for JSON serialization.
+        :param gauges: dict of gauge name -> (help text, value) of point in time values, eg. the queue depth.
+        :return: dict of the gauges and per guild counters and latency percentiles.
+        """
+        guilds = {}
+        for guild_id, metrics in self.guilds.items():
+            guild_export = {}
+            for name in GuildPipelineMetrics.COUNTERS:
+                counter = getattr(metrics, name)  # type: RollingCounter
+                guild_export[name] = {'total': counter.total, 'recent': counter.recent(), 'window': counter.window}
+            for name in GuildPipelineMetrics.HISTOGRAMS:
+                histogram = getattr(metrics, name)  # type: RollingHistogram
+                guild_export[name] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.percentile(50),
+                    'p95': histogram.percentile(95),
+                    'p99': histogram.percentile(99),
+                }
+            guilds[str(guild_id)] = guild_export
+
+        return {'gauges': {name: value for name, (_, value) in gauges.items()}, 'guilds': guilds}
+
+    def render_prometheus(self, gauges: Dict[str, Tuple[str, float]]) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        :param gauges: dict of gauge name -> (help text, value)
+        :return: Prometheus text document.
+        """
+        writer = PrometheusWriter()
+
+        for name, (help_text, value) in gauges.items():
+            writer.gauge(f"{self.PROMETHEUS_PREFIX}_{name}", help_text, value)
+
+        for name, help_text in GuildPipelineMetrics.COUNTERS.items():
+            for guild_id, metrics in self.guilds.items():
+                writer.counter(f"{self.PROMETHEUS_PREFIX}_{name}_total", help_text, getattr(metrics, name).total,
+                               labels={'guild': guild_id})
+
+        for name, help_text in GuildPipelineMetrics.HISTOGRAMS.items():
+            for guild_id, metrics in self.guilds.items():
+                writer.histogram(f"{self.PROMETHEUS_PREFIX}_{name}_seconds", help_text, getattr(metrics, name),
+                                 labels={'guild': guild_id})
+
+        return writer.render()
@@ -0,0 +1,106 @@
+import asyncio
+from logging import Logger
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+from redbot.core import Config
+
+
+class PendingJournal(object):
+    """
+    Persists the role tracker's pending add/remove actions so they survive a restart of the bot.
+
+    Entries are stored per member in a compact form of role IDs: {"a": [add_role_ids], "r": [remove_role_ids]}.
+    Changes are only marked dirty in memory and written every FLUSH_DELAY seconds, and only the members whose
+    pending actions changed since the last flush are written.
+    """
+
+    FLUSH_DELAY = 1.0
+
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+
+        # tracker key -> (member, compact entry or None to clear it)
+        self.__dirty = {}  # type: Dict[str, Tuple[discord.Member, Optional[dict]]]
+        self.__flush_scheduled = False
+        self.__flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def compact(member: discord.Member, add_roles: Iterable[discord.Role],
+                remove_roles: Iterable[discord.Role]) -> dict:
+        """
+        Convert a set of pending role actions into the compact form stored in the Config.
+        :param member: discord.py Member the actions apply to.
+        :param add_roles: Roles which will be added to the member.
+        :param remove_roles: Roles which will be removed from the member.
+        :return: dict of role ID lists. The guild's default role is never stored.
+        """
+        default_role = member.guild.default_role
+        return {
+            'a': [role.id for role in add_roles if role != default_role],
+            'r': [role.id for role in remove_roles if role != default_role]
+        }
+
+    def record(self, tracker_key: str, member: discord.Member, entry: dict):
+        """
+        Mark the pending actions of a member as changed.
+        :param tracker_key: Role tracker key of the member.
+        :param member: discord.py Member the actions apply to.
+        :param entry: Compact entry generated by compact().
+        :return: None
+        """
+        self.__dirty[tracker_key] = (member, entry)
+        self.__schedule_flush()
+
+    def clear(self, tracker_key: str, member: discord.Member):
+        """
+        Mark the pending actions of a member as applied or dropped.
+        :param tracker_key: Role tracker key of the member.
+        :param member: discord.py Member the actions applied to.
+        :return: None
+        """
+        self.__dirty[tracker_key] = (member, None)
+        self.__schedule_flush()
+
+    def __schedule_flush(self):
+        if not self.__flush_scheduled:
+            self.__flush_scheduled = True
+            asyncio.ensure_future(self.__delayed_flush())
+
+    async def __delayed_flush(self):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        """
+        Write every changed entry to the Config.
+        :return: None
+        """
+        async with self.__flush_lock:
+            self.__flush_scheduled = False
+            dirty, self.__dirty = self.__dirty, {}
+
+            for member, entry in dirty.values():
+                try:
+                    if entry is None:
+                        await self.config.member(member).pending.clear()
+                    else:
+                        await self.config.member(member).pending.set(entry)
+                except Exception as e:
+                    self.logger.error(f"Error persisting pending role actions. Member: {member} | Exception: {e}")
+
+    async def load(self) -> Dict[int, Dict[int, dict]]:
+        """
+        Retrieve every persisted pending entry from the Config.
+        :return: dict of guild ID -> member ID -> compact entry
+        """
+        members = await self.config.all_members()
+
+        pending = {}
+        for guild_id, guild_members in members.items():
+            for member_id, member_dict in guild_members.items():
+                entry = member_dict.get('pending')
+                if entry:
+                    pending.setdefault(int(guild_id), {})[int(member_id)] = entry
+        return pending
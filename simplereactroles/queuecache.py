@@ -0,0 +1,100 @@
+import asyncio
+from collections import defaultdict
+from copy import deepcopy
+from logging import Logger
+from typing import Callable, Dict, TypeVar
+
+import discord
+from redbot.core import Config
+
+T = TypeVar('T')
+
+
+class QueueCache(object):
+    """
+    In memory cache of every guild's reaction role queues.
+
+    Reads are served from memory. Mutations are applied under a per-guild lock, and the resulting state is
+    written back to the Config at most once every FLUSH_DELAY seconds, so a burst of commands results
+    in a single write.
+    """
+
+    FLUSH_DELAY = 1.0
+
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+
+        self.__queues = {}  # type: Dict[int, Dict[str, dict]]
+        self.__locks = defaultdict(asyncio.Lock)  # type: Dict[int, asyncio.Lock]
+        self.__write_locks = defaultdict(asyncio.Lock)  # type: Dict[int, asyncio.Lock]
+        self.__pending_flushes = {}  # type: Dict[int, discord.Guild]
+        self.__loaded = asyncio.Event()
+
+    async def load(self):
+        """
+        Populate the cache from the Config database. Readers and writers wait until this has completed.
+        :return: None
+        """
+        guilds = await self.config.all_guilds()
+
+        for guild_id, guild_dict in guilds.items():
+            self.__queues[int(guild_id)] = guild_dict.get('queues', {})
+
+        self.__loaded.set()
+
+    async def get_queue(self, guild: discord.Guild, queue_name: str) -> dict:
+        """
+        Retrieve a queue from the cache. The returned dict is owned by the cache and must not be modified;
+        use update() to make changes.
+        :param guild: discord.py Guild which owns the queue.
+        :param queue_name: String name of the queue to retrieve.
+        :return: The object for the queue, or an empty dict if it doesn't exist.
+        """
+        await self.__loaded.wait()
+        return self.__queues.get(guild.id, {}).get(queue_name, {})
+
+    async def update(self, guild: discord.Guild, mutator: Callable[[Dict[str, dict]], T]) -> T:
+        """
+        Atomically apply a mutation to a guild's queues and schedule a coalesced write to the Config.
+        :param guild: discord.py Guild which owns the queues.
+        :param mutator: Function which receives the guild's queues dict, modifies it in place and returns a result.
+        :return: The result of the mutator.
+        """
+        await self.__loaded.wait()
+
+        async with self.__locks[guild.id]:
+            result = mutator(self.__queues.setdefault(guild.id, {}))
+
+            if guild.id not in self.__pending_flushes:
+                self.__pending_flushes[guild.id] = guild
+                asyncio.ensure_future(self.__delayed_flush(guild))
+
+        return result
+
+    async def __delayed_flush(self, guild: discord.Guild):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        await self.flush(guild)
+
+    async def flush(self, guild: discord.Guild):
+        """
+        Write a guild's cached queues to the Config.
+        :param guild: discord.py Guild to flush.
+        :return: None
+        """
+        async with self.__write_locks[guild.id]:
+            async with self.__locks[guild.id]:
+                self.__pending_flushes.pop(guild.id, None)
+                snapshot = deepcopy(self.__queues.get(guild.id, {}))
+            try:
+                await self.config.guild(guild).queues.set(snapshot)
+            except Exception as e:
+                self.logger.error(f"Error writing queues to the Config for guild {guild.id}. Exception: {e}")
+
+    async def flush_all(self):
+        """
+        Write every guild with pending changes to the Config. Used when the cog is unloaded.
+        :return: None
+        """
+        for guild in list(self.__pending_flushes.values()):
+            await self.flush(guild)
@@ -1,8 +1,12 @@
 import asyncio
 import datetime
+import io
+import json
 import re
-from collections import defaultdict
-from typing import Tuple, Union, Optional, Dict, Set
+import time
+from collections import defaultdict, deque
+from copy import deepcopy
+from typing import Tuple, Union, Optional, Dict, Set, List
 
 import discord
 from discord import RawReactionActionEvent, RawMessageDeleteEvent, RawBulkMessageDeleteEvent
@@ -11,7 +15,13 @@ from redbot.core.bot import Red
 from redbot.core.commands import Context
 
 from cog_shared.seplib.classes.basesepcog import BaseSepCog
-from cog_shared.seplib.responses.embeds import ErrorReply, SuccessReply
+from cog_shared.seplib.responses.embeds import ErrorReply, SuccessReply, InfoReply
+from cog_shared.seplib.utils.metrics import RollingHistogram
+from .delayqueue import DelayQueue
+from .memberresolver import MemberResolver
+from .metrics import PipelineMetrics
+from .pendingjournal import PendingJournal
+from .queuecache import QueueCache
 from .strings import ErrorStrings, MiscStrings, DateTimeStrings, SuccessStrings
 from .utils import Utils
 
@@ -20,21 +30,40 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
 
     EMOJI_REGEX = re.compile("<a?:[a-zA-Z0-9_]{2,32}:(\d{1,20})>")
     ADD_REMOVE_INTERVAL = 0.2
+    MAX_EDIT_ATTEMPTS = 5
+    RETRY_BASE_DELAY = 2.0
+    RETRY_MAX_DELAY = 60.0
+    DEAD_LETTER_SIZE = 20
+    EMBED_DESCRIPTION_LIMIT = 2000
 
     def __init__(self, bot: Red):
 
         super(SimpleReactRoles, self).__init__(bot=bot)
 
         self.activated_cache = {}
+        self.group_cache = {}  # type: Dict[str, Dict[str, Dict[int, List[Tuple[str, int, Set[int]]]]]]
+        self.queue_cache = QueueCache(config=self.config, logger=self.logger)
+        self.channel_locks = defaultdict(asyncio.Lock)  # type: Dict[str, asyncio.Lock]
         self.role_tracker = {}
+        self.in_flight_items = {}  # type: Dict[str, dict]
         self.role_queue = asyncio.Queue()
+        self.queued_keys = set()  # type: Set[str]
+        self.pending_journal = PendingJournal(config=self.config, logger=self.logger)
+        self.member_resolver = MemberResolver(bot=self.bot, logger=self.logger)
+        self.retry_queue = DelayQueue()
+        self.backoff_keys = set()  # type: Set[str]
+        self.dead_letters = defaultdict(lambda: deque(maxlen=self.DEAD_LETTER_SIZE))  # type: Dict[int, deque]
+        self.metrics = PipelineMetrics()
 
         self._add_future(self.edit_role_loop())
+        self._add_future(self.retry_role_loop())
         self._ensure_futures()
 
     def _register_config_entities(self, config: Config):
         config.register_channel(activated={})
+        config.register_channel(groups={})
         config.register_guild(queues={})
+        config.register_member(pending={})
 
     async def _init_cache(self):
         """
@@ -45,13 +74,174 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
         channels = await self.config.all_channels()
 
         activated_map = defaultdict(dict)
+        group_map = defaultdict(dict)
 
         for channel_id, channel_dict in channels.items():
             chan_active = channel_dict.get("activated", {})
             for message_id, emoji_map in chan_active.items():
                 activated_map[str(channel_id)][str(message_id)] = emoji_map
 
+            chan_groups = channel_dict.get("groups", {})
+            for message_id, groups in chan_groups.items():
+                group_map[str(channel_id)][str(message_id)] = self.__index_groups(groups)
+
         self.activated_cache = activated_map
+        self.group_cache = group_map
+
+        await self.queue_cache.load()
+        await self.__replay_pending_actions()
+
+    def __unload(self):
+        asyncio.ensure_future(self.queue_cache.flush_all())
+        asyncio.ensure_future(self.pending_journal.flush())
+
+    async def __replay_pending_actions(self):
+        """
+        Re-queue role actions which were persisted by the pending journal but never applied,
+        eg. because the bot restarted while the role queue was still being worked through.
+        :return: None
+        """
+        pending = await self.pending_journal.load()
+
+        replayed = 0
+        for guild_id, members in pending.items():
+            guild = self.bot.get_guild(guild_id)  # type: discord.Guild
+            if guild is None:
+                continue
+
+            # resolve the guild's members concurrently rather than waiting on each fetch in turn
+            member_ids = list(members)
+            resolved = await asyncio.gather(*(self.member_resolver.resolve(guild, member_id)
+                                              for member_id in member_ids))
+
+            for member_id, member in zip(member_ids, resolved):
+                entry = members[member_id]
+                if member is None:
+                    self.logger.info(f"Skipping replay of pending role actions, member not found. "
+                                     f"g:{guild_id}|mem:{member_id}")
+                    continue
+
+                tracker_key = self.__get_tracker_key(member)
+                if tracker_key in self.role_tracker:
+                    # a newer reaction already queued an action for this member, which takes precedence
+                    continue
+
+                self.role_tracker[tracker_key] = {
+                    'member': member,
+                    'add': {guild.get_role(role_id) for role_id in entry.get('a', [])} - {None},
+                    'remove': {guild.get_role(role_id) for role_id in entry.get('r', [])} - {None} |
+                              {guild.default_role},
+                    'queued_at': time.monotonic()
+                }
+                await self.__enqueue(tracker_key)
+                replayed += 1
+
+        if replayed:
+            self.logger.info(f"Replayed {replayed} pending role actions from the previous session.")
+
+    @staticmethod
+    def __get_tracker_key(member: discord.Member) -> str:
+        return "{}|{}".format(member.guild.id, member.id)
+
+    def __pipeline_gauges(self) -> Dict[str, Tuple[str, float]]:
+        """
+        Point in time depths of the role pipeline, shared by every guild.
+        :return: dict of gauge name -> (help text, value)
+        """
+        return {
+            'queue_depth': ("Member keys waiting on the role queue.", self.role_queue.qsize()),
+            'pending_members': ("Members with pending role actions.", len(self.role_tracker)),
+            'retry_depth': ("Member edits waiting out a retry backoff.", self.retry_queue.qsize()),
+            'in_flight': ("Member edits currently being applied.", len(self.in_flight_items)),
+        }
+
+    async def __enqueue(self, tracker_key: str):
+        """
+        Puts a tracker key on the role queue, unless it is already waiting on the queue or in a retry backoff.
+        Actions for the key are merged in the tracker, so one queue entry per key is enough.
+        :param tracker_key: Role tracker key to queue.
+        :return: None
+        """
+        if tracker_key in self.queued_keys or tracker_key in self.backoff_keys:
+            return
+        self.queued_keys.add(tracker_key)
+        await self.role_queue.put(tracker_key)
+
+    @staticmethod
+    def __index_groups(groups: Dict[str, dict]) -> Dict[int, List[Tuple[str, int, Set[int]]]]:
+        """
+        Converts the stored groups of an activated message into a lookup of role ID -> groups containing the role.
+        :param groups: dict of group name -> {"limit": int, "roles": [role_ids]}
+        :return: dict of role ID -> list of (group name, limit, set of the group's role IDs)
+        """
+        index = defaultdict(list)
+        for group_name, group in groups.items():
+            role_ids = {int(role_id) for role_id in group.get('roles', [])}
+            for role_id in role_ids:
+                index[role_id].append((group_name, int(group.get('limit', 1)), role_ids))
+        return dict(index)
+
+    def __apply_group_constraints(self, tracker_key: str, current_actions: dict, role: discord.Role,
+                                  groups: List[Tuple[str, int, Set[int]]]):
+        """
+        Enforces the group constraints of a newly added role on the pending actions of a member, so the single
+        member edit for the pending actions already satisfies every group.
+
+        Exclusive groups (limit of 1) replace any other role of the group with the new role. Groups with a higher
+        limit reject the new role if the member would end up with more roles of the group than the limit.
+        :param tracker_key: Role tracker key of the member.
+        :param current_actions: Role tracker item of the member, which is modified in place.
+        :param role: The role being added.
+        :param groups: Groups which contain the role, from __index_groups().
+        :return: None
+        """
+        member = current_actions.get('member')
+
+        # the member's roles once an edit which is currently being applied for them has finished
+        base_roles = set(member.roles)
+        in_flight = self.in_flight_items.get(tracker_key)
+        if in_flight:
+            base_roles = (base_roles | in_flight['add']) - in_flight['remove']
+
+        # plan the swaps of the exclusive groups first, and only apply them if no group rejects the role. Otherwise
+        # the member would lose their other group roles without getting the new one.
+        replaced = set()
+        swapped_groups = []
+        for group_name, limit, role_ids in groups:
+            effective_roles = (base_roles | current_actions['add']) - current_actions['remove'] - replaced
+            group_roles = {r for r in effective_roles if r.id in role_ids}
+
+            if len(group_roles) <= limit:
+                continue
+
+            if limit == 1:
+                replaced |= group_roles - {role}
+                swapped_groups.append(group_name)
+            else:
+                current_actions['add'].discard(role)
+                self.logger.info(f"Group {group_name}: Member {member} is at the limit of {limit} roles. "
+                                 f"Not adding {role}.")
+                return
+
+        if replaced:
+            current_actions['add'] -= replaced
+            current_actions['remove'] |= replaced
+            self.logger.info(f"Groups {', '.join(swapped_groups)}: replacing roles {replaced} with {role} for "
+                             f"Member {member}.")
+
+    def __sync_pending_journal(self, tracker_key: str, member: discord.Member):
+        """
+        Update the pending journal to reflect the current role tracker state for a member.
+        :param tracker_key: Role tracker key of the member.
+        :param member: discord.py Member for the tracker key.
+        :return: None
+        """
+        tracker_item = self.role_tracker.get(tracker_key)
+        if tracker_item:
+            entry = self.pending_journal.compact(member, tracker_item.get('add'), tracker_item.get('remove'))
+            self.pending_journal.record(tracker_key, member, entry)
+        else:
+            self.pending_journal.clear(tracker_key, member)
 
     async def edit_role_loop(self):
         """
@@ -64,38 +254,205 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
         while self == self.bot.get_cog(self.__class__.__name__):
 
             tracker_key = await self.role_queue.get()
+            self.queued_keys.discard(tracker_key)
+
+            # items waiting out a retry backoff are re-queued by retry_role_loop once their delay has passed
+            if tracker_key in self.backoff_keys:
+                self.role_queue.task_done()
+                continue
 
             # get get an item out of the tracker
             tracker_item = self.role_tracker.pop(tracker_key, None)
 
             if tracker_item and tracker_item.get('member'):
                 member = tracker_item.get('member')
-
-                current_roles = set(member.roles)
-                add_roles = tracker_item.get('add')
-                remove_roles = tracker_item.get('remove', {member.guild.default_role})
-
-                new_roles = (current_roles | add_roles) - remove_roles
-                add_diff = add_roles - remove_roles
-                remove_diff = remove_roles - add_roles
+                self.in_flight_items[tracker_key] = tracker_item
                 try:
-                    await member.edit(roles=new_roles)
-                    self.logger.info(f"Edited Roles on Member: {member}, Guild: {member.guild.id} | "
-                                     f"Removed: {remove_diff} | Added: {add_diff}")
-                except (discord.Forbidden, discord.HTTPException) as de:
-                    self.logger.error(f"Error calling Discord member edit API. Member: {member} | Exception: {de}"
-                                      f"Will retry...")
-                    self.role_tracker[tracker_key] = tracker_item
-                    await self.role_queue.put(tracker_key)
-                except Exception as ue:
-                    self.logger.error(f"An unknown error occurred while attempting to add roles. Not re-queueing."
-                                      f"Member: {member} | Exception: {ue}.")
-                    self.role_queue.task_done()
-                else:
-                    self.role_queue.task_done()
+                    await self.__apply_tracker_item(tracker_key, tracker_item)
                 finally:
+                    self.in_flight_items.pop(tracker_key, None)
+                    self.__sync_pending_journal(tracker_key, member)
                     await asyncio.sleep(self.ADD_REMOVE_INTERVAL)
 
+            self.role_queue.task_done()
+
+    async def retry_role_loop(self):
+        """
+        Indefinitely running task which moves tracker items back onto the role queue once their retry
+        backoff delay has elapsed.
+        :return: None
+        """
+        await self.bot.wait_until_ready()
+
+        while self == self.bot.get_cog(self.__class__.__name__):
+            tracker_key = await self.retry_queue.get()
+            self.backoff_keys.discard(tracker_key)
+            await self.__enqueue(tracker_key)
+
+    async def __apply_tracker_item(self, tracker_key: str, tracker_item: dict):
+        """
+        Applies the pending role actions of a single tracker item with one member edit.
+
+        Roles which the bot can never manage are dropped to the dead letter list up front. Permanent API errors
+        drop the whole item to the dead letter list, transient ones schedule a retry with exponential backoff.
+        :param tracker_key: Role tracker key of the item.
+        :param tracker_item: Role tracker item which was popped off of the tracker.
+        :return: None
+        """
+        member = tracker_item.get('member')  # type: discord.Member
+        guild = member.guild
+
+        add_roles = tracker_item.get('add')
+        remove_roles = tracker_item.get('remove', {guild.default_role})
+
+        unmanageable = self.__get_unmanageable_roles(guild, (add_roles | remove_roles) - {guild.default_role})
+        for reason, roles in unmanageable.items():
+            self.__dead_letter(member, roles, reason)
+            add_roles = add_roles - roles
+            remove_roles = remove_roles - roles
+
+        current_roles = set(member.roles)
+        add_diff = (add_roles - remove_roles) - current_roles
+        remove_diff = (remove_roles - add_roles) & current_roles
+
+        metrics = self.metrics.guild(guild.id)
+
+        if not add_diff and not remove_diff:
+            self.logger.info(f"Member {member} on Guild {guild.id} already has the requested roles. Skipping edit.")
+            metrics.skipped.add()
+            return
+
+        new_roles = (current_roles | add_roles) - remove_roles
+
+        # the member's roles change with this edit, so a cached copy of an uncached member is stale either way
+        self.member_resolver.invalidate(guild.id, member.id)
+        edit_start = time.monotonic()
+        try:
+            await member.edit(roles=new_roles)
+            self.logger.info(f"Edited Roles on Member: {member}, Guild: {guild.id} | "
+                             f"Removed: {remove_diff} | Added: {add_diff}")
+            now = time.monotonic()
+            metrics.edits.add()
+            metrics.edit_latency.observe(now - edit_start)
+            metrics.wait_latency.observe(now - tracker_item.get('queued_at', edit_start))
+        except discord.HTTPException as de:
+            metrics.edit_latency.observe(time.monotonic() - edit_start)
+            permanent_reason = self.__classify_edit_error(de)
+            if permanent_reason:
+                self.__dead_letter(member, add_diff | remove_diff, permanent_reason)
+            else:
+                self.__schedule_retry(tracker_key, tracker_item, de)
+        except Exception as ue:
+            self.logger.error(f"An unknown error occurred while attempting to add roles. Not re-queueing."
+                              f"Member: {member} | Exception: {ue}.")
+
+    def __schedule_retry(self, tracker_key: str, tracker_item: dict, error: Exception):
+        """
+        Puts a failed tracker item back on the tracker and schedules it to be re-queued after an exponential backoff.
+        If the item has run out of attempts, it is dropped to the dead letter list instead.
+        :param tracker_key: Role tracker key of the item.
+        :param tracker_item: Role tracker item which failed to apply.
+        :param error: The exception raised by the member edit.
+        :return: None
+        """
+        member = tracker_item.get('member')
+        attempts = tracker_item.get('attempts', 0) + 1
+
+        if attempts >= self.MAX_EDIT_ATTEMPTS:
+            roles = tracker_item.get('add') | tracker_item.get('remove') - {member.guild.default_role}
+            return self.__dead_letter(member, roles, MiscStrings.dead_letter_retries_f.format(attempts, error))
+
+        tracker_item['attempts'] = attempts
+
+        # a reaction may have queued up newer actions for the member while the edit was in flight
+        newer_item = self.role_tracker.get(tracker_key)
+        if newer_item:
+            tracker_item = self.__merge_tracker_items(older=tracker_item, newer=newer_item)
+        self.role_tracker[tracker_key] = tracker_item
+
+        delay = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        self.backoff_keys.add(tracker_key)
+        self.retry_queue.put(tracker_key, delay)
+        self.metrics.guild(member.guild.id).retries.add()
+
+        self.logger.error(f"Error calling Discord member edit API. Member: {member} | Exception: {error} | "
+                          f"Attempt {attempts} of {self.MAX_EDIT_ATTEMPTS}, will retry in {delay}s...")
+
+    @staticmethod
+    def __merge_tracker_items(older: dict, newer: dict) -> dict:
+        """
+        Merges the actions of an older tracker item into a newer one for the same member.
+        Where both items have an action for the same role, the newer action wins.
+        :param older: The older tracker item.
+        :param newer: The newer tracker item, which is modified in place.
+        :return: The merged tracker item.
+        """
+        newer['add'] |= older.get('add', set()) - newer['remove']
+        newer['remove'] |= older.get('remove', set()) - newer['add']
+        newer['attempts'] = max(older.get('attempts', 0), newer.get('attempts', 0))
+        newer['queued_at'] = min(older.get('queued_at', time.monotonic()), newer.get('queued_at', time.monotonic()))
+        return newer
+
+    @staticmethod
+    def __get_unmanageable_roles(guild: discord.Guild, roles: Set[discord.Role]) -> Dict[str, Set[discord.Role]]:
+        """
+        Determines which of the given roles the bot will never be able to add or remove on the guild.
+        :param guild: discord.py Guild which owns the roles.
+        :param roles: Roles to check.
+        :return: dict of the reason the roles can't be managed -> set of the roles
+        """
+        bot_member = guild.me
+
+        if not bot_member.guild_permissions.manage_roles:
+            return {MiscStrings.dead_letter_no_manage_roles: set(roles)} if roles else {}
+
+        unmanageable = defaultdict(set)
+        for role in roles:
+            if role.managed:
+                unmanageable[MiscStrings.dead_letter_managed_role].add(role)
+            elif role >= bot_member.top_role:
+                unmanageable[MiscStrings.dead_letter_hierarchy].add(role)
+        return unmanageable
+
+    @staticmethod
+    def __classify_edit_error(error: discord.HTTPException) -> Optional[str]:
+        """
+        Classifies an error returned by the member edit API.
+        :param error: discord.py HTTPException raised by the edit.
+        :return: The reason the error is permanent, or None if the edit should be retried.
+        """
+        status = getattr(error, 'status', 0)
+
+        if status == 429 or status >= 500:
+            return None
+        elif isinstance(error, discord.Forbidden):
+            return MiscStrings.dead_letter_forbidden_f.format(error)
+        elif isinstance(error, discord.NotFound):
+            return MiscStrings.dead_letter_not_found_f.format(error)
+        return MiscStrings.dead_letter_rejected_f.format(error)
+
+    def __dead_letter(self, member: discord.Member, roles: Set[discord.Role], reason: str):
+        """
+        Drops role actions which can't be applied and records them on the guild's dead letter list.
+        :param member: discord.py Member the actions were for.
+        :param roles: Roles whose actions were dropped.
+        :param reason: Human readable reason the actions were dropped.
+        :return: None
+        """
+        if not roles:
+            return
+
+        self.dead_letters[member.guild.id].append({
+            'time': datetime.datetime.utcnow().strftime(DateTimeStrings.iso),
+            'member_id': member.id,
+            'member': str(member),
+            'roles': sorted(role.name for role in roles),
+            'reason': reason
+        })
+        self.metrics.guild(member.guild.id).dead_lettered.add()
+        self.logger.error(f"Dropped role actions for Member: {member}, Guild: {member.guild.id} | "
+                          f"Roles: {roles} | Reason: {reason}")
+
     async def queue_add_remove_role(self, payload: RawReactionActionEvent, add_or_remove: bool):
         """
         Adds a new add/remove role task to the queue.
@@ -119,17 +476,28 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
             self.logger.info(f"Matched Reaction Role | c:{channel_id}|m:{message_id}|r:{role_id}|a:{add_or_remove}")
 
             channel = self.bot.get_channel(int(payload.channel_id))  # type: discord.TextChannel
+            if payload.user_id == channel.guild.me.id:
+                return
+
             role = self.__get_role_by_id(channel.guild, role_id)
-            member = channel.guild.get_member(payload.user_id)  # type: discord.Member
+            # newer versions of discord.py include the member on reaction add events
+            member = getattr(payload, 'member', None) or \
+                await self.member_resolver.resolve(channel.guild, payload.user_id)  # type: discord.Member
+
+            if role and member:
+                tracker_key = self.__get_tracker_key(member)
+                metrics = self.metrics.guild(member.guild.id)
+                metrics.events.add()
 
-            if role and member and member != channel.guild.me:
-                tracker_key = "{}|{}".format(member.guild.id, member.id)
                 current_actions = self.role_tracker.get(tracker_key)
-                if not current_actions:
+                if current_actions:
+                    metrics.coalesced.add()
+                else:
                     current_actions = {
                         'member': member,
                         'add': set(),
-                        'remove': {member.guild.default_role}
+                        'remove': {member.guild.default_role},
+                        'queued_at': time.monotonic()
                     }
 
                 add_key = 'add' if add_or_remove else 'remove'
@@ -138,8 +506,13 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
                 current_actions[add_key].add(role)
                 current_actions[sub_key] -= {role}
 
+                if add_or_remove:
+                    groups = self.group_cache.get(channel_id, {}).get(message_id, {}).get(int(role_id), [])
+                    self.__apply_group_constraints(tracker_key, current_actions, role, groups)
+
                 self.role_tracker[tracker_key] = current_actions
-                await self.role_queue.put(tracker_key)
+                self.__sync_pending_journal(tracker_key, member)
+                await self.__enqueue(tracker_key)
                 self.logger.info(f'Queued up role "{add_key}" action for Member {member} on Guild {member.guild.id}.')
             else:
                 self.logger.info(f"Skipping role action queue put. r:{role}|mem:{member}|a:{add_or_remove}")
@@ -250,13 +623,13 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
 
     async def __get_queue(self, ctx: Context, queue_name: str) -> dict:
         """
-        Attempts to retrieve a queue object from the Config.
+        Attempts to retrieve a queue object from the in memory queue cache.
+        The returned object is owned by the cache and must not be modified.
         :param ctx: discord.py Context object (used to determine the guild)
         :param queue_name: String name of the queue to retrieve.
         :return: The object for the queue, or an empty dict if it doesn't exist.
         """
-        queues = await self.config.guild(ctx.guild).queues()
-        return queues.get(queue_name, {})
+        return await self.queue_cache.get_queue(ctx.guild, queue_name)
 
     async def __get_emojis_for_queue(self, ctx: Context, queue_name: str) -> Dict[str, int]:
         """
@@ -282,10 +655,10 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
             'created_by_username': "{}#{}".format(ctx.author.name, ctx.author.discriminator),
         }
 
-        await Utils.update_config_keys(
-            field_func=lambda: self.config.guild(ctx.guild).queues,
-            new_data={queue_name: queue_metadata}
-        )
+        def create(queues: dict):
+            queues[queue_name] = queue_metadata
+
+        await self.queue_cache.update(ctx.guild, create)
         self.logger.info(f'Created queue named "{queue_name}" in guild {ctx.guild.id}.')
 
     async def __delete_queue(self, ctx: Context, queue_name) -> Union[dict, None]:
@@ -295,10 +668,7 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
         :param queue_name: String name of the queue to delete.
         :return: Returns the dict object representation of the queue if it was found, or None if it didn't exist.
         """
-        removed_value = await Utils.delete_config_key(
-            field_func=lambda: self.config.guild(ctx.guild).queues,
-            key=queue_name
-        )
+        removed_value = await self.queue_cache.update(ctx.guild, lambda queues: queues.pop(queue_name, None))
         self.logger.info(f'Deleted queue "{queue_name}" for guild {ctx.guild.id}.')
         return removed_value
 
@@ -366,65 +736,76 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
         :param role: Role to be mapped to the emoji.
         :return: None
         """
-        emoji_dict = await self.__get_emojis_for_queue(ctx, queue_name)
-        emoji_dict[Utils.clean_animated_emoji(str(emoji))] = role.id
-        new_data = {
-            queue_name: {
-                "emojis": emoji_dict
-            }
-        }
-        await Utils.update_config_keys(
-            field_func=lambda: self.config.guild(ctx.guild).queues,
-            new_data=new_data,
-            update=True
-        )
+        emoji_key = Utils.clean_animated_emoji(str(emoji))
+
+        def map_emoji(queues: dict):
+            queues.setdefault(queue_name, {}).setdefault("emojis", {})[emoji_key] = role.id
+
+        await self.queue_cache.update(ctx.guild, map_emoji)
         self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | Added emoji "{emoji}" to the queue.')
 
     async def __unmap_emoji(self, ctx: Context, queue_name: str, emoji: Union[discord.Emoji, str]):
         """
         Updates a queue to unmap a specified emoji/reaction. This function does not perform any validation.
         Callers of this function should validate before calling.
+        The emoji's role is removed from the queue's groups, unless another emoji of the queue maps to it. Groups
+        which no longer constrain anything, ie. with fewer than two roles or a limit reaching their size, are deleted.
         :param ctx: Context of the map command.
         :param queue_name: Queue name to update.
         :param emoji: Emoji to be mapped.
         :return: Returns the deleted emoji otherwise None.
         """
-        queue = await self.__get_queue(ctx, queue_name)
-        deleted_emoji = queue.get("emojis", {}).pop(str(emoji), None)
-
-        new_data = {
-            queue_name: queue
-        }
-
-        await Utils.update_config_keys(
-            field_func=lambda: self.config.guild(ctx.guild).queues,
-            new_data=new_data,
-        )
-        self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | Removed emoji "{emoji}" from the queue.')
+        def unmap_emoji(queues: dict):
+            queue = queues.get(queue_name, {})
+            role_id = queue.get("emojis", {}).pop(str(emoji), None)
+            if role_id is None or role_id in queue.get("emojis", {}).values():
+                return role_id, []
+
+            groups = queue.get("groups", {})
+            deleted_groups = []
+            for group_name, group in list(groups.items()):
+                if role_id not in group["roles"]:
+                    continue
+                group["roles"] = [group_role_id for group_role_id in group["roles"] if group_role_id != role_id]
+                if len(group["roles"]) < 2 or group["limit"] >= len(group["roles"]):
+                    del groups[group_name]
+                    deleted_groups.append(group_name)
+            return role_id, deleted_groups
+
+        deleted_emoji, deleted_groups = await self.queue_cache.update(ctx.guild, unmap_emoji)
+        self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | Removed emoji "{emoji}" from the queue. '
+                         f'Deleted groups: {deleted_groups}')
         return deleted_emoji
 
     async def __add_activated_reactions(self, message_id: int, channel: discord.TextChannel,
-                                        emoji_map: Dict[str, int]):
+                                        emoji_map: Dict[str, int], groups: Dict[str, dict]):
         """
         Adds an activated emoji/roll map record to the Config. Does not perform any validation.
         :param message_id: Integer ID of the message to activate.
         :param channel: discord.py Channel object which contains the message.
         :param emoji_map: emoji/role map dict.
+        :param groups: group name -> group dict of the queue being activated.
         :return: None
         """
         key = str(message_id)
-        activated_data = {
-           key: emoji_map
-        }
 
         # update the cache
         self.activated_cache[str(channel.id)][key] = emoji_map
-
-        self.logger.info(f'c:{channel.id}|m:{message_id} Activated emoji map: {emoji_map}.')
-        return await Utils.update_config_keys(
-            field_func=lambda: self.config.channel(channel).activated,
-            new_data=activated_data
+        if groups:
+            self.group_cache.setdefault(str(channel.id), {})[key] = self.__index_groups(groups)
+
+        self.logger.info(f'c:{channel.id}|m:{message_id} Activated emoji map: {emoji_map}. Groups: {groups}')
+        await Utils.atomic_update(
+            value=self.config.channel(channel).activated,
+            mutator=lambda activated: activated.update({key: emoji_map}),
+            lock=self.channel_locks[str(channel.id)]
         )
+        if groups:
+            await Utils.atomic_update(
+                value=self.config.channel(channel).groups,
+                mutator=lambda channel_groups: channel_groups.update({key: groups}),
+                lock=self.channel_locks[str(channel.id)]
+            )
 
     async def __remove_activated_reactions(self, channel_id: int, message_id: int) -> Optional[Dict[str, int]]:
         """
@@ -447,18 +828,29 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
 
             # pop the message off the of the channel cache
             emojis = self.activated_cache.get(channel_key).pop(message_key)
+            had_groups = self.group_cache.get(channel_key, {}).pop(message_key, None) is not None
 
             # check if this is the last message in the channel
             if len(self.activated_cache.get(channel_key)) == 0:
                 self.logger.info(f"No remaining reaction messages are in channel {channel_id}. Clear channel config.")
                 # pop the channel off of the cache and delete the channel config
                 self.activated_cache.pop(channel_key)
-                await self.config.channel(channel).clear()
+                self.group_cache.pop(channel_key, None)
+                async with self.channel_locks[channel_key]:
+                    await self.config.channel(channel).clear()
             else:
-                db_activated = await self.config.channel(channel).activated()
                 # just remove message from the activated
-                db_activated.pop(message_key)
-                await self.config.channel(channel).activated.set(db_activated)
+                await Utils.atomic_update(
+                    value=self.config.channel(channel).activated,
+                    mutator=lambda activated: activated.pop(message_key, None),
+                    lock=self.channel_locks[channel_key]
+                )
+                if had_groups:
+                    await Utils.atomic_update(
+                        value=self.config.channel(channel).groups,
+                        mutator=lambda channel_groups: channel_groups.pop(message_key, None),
+                        lock=self.channel_locks[channel_key]
+                    )
         return emojis
 
     # Primary Commands
@@ -566,6 +958,69 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
 
         await SuccessReply(SuccessStrings.emoji_deleted_f.format(emoji, queue_name, unset_success)).send(ctx)
 
+    @_reactroles.command(name="group")
+    @commands.guild_only()
+    @checks.mod_or_permissions(manage_roles=True)
+    async def __reactroles_group(self, ctx: Context, queue_name: str, group_name: str, limit: int, *emojis: str):
+        """
+        Groups mapped reactions in a queue so members can only pick up to `limit` of their roles.
+
+        With a limit of 1 the group is exclusive: picking a reaction replaces the previously picked role of the group. With a higher limit, reactions beyond the limit are ignored. Defining a group with an existing name replaces it.
+        """
+        if not await self.__get_queue(ctx=ctx, queue_name=queue_name):
+            self.logger.info(f'GROUP: Queue "{queue_name}" does not exist for guild {ctx.guild.id}.')
+            return await ErrorReply(ErrorStrings.queue_not_exists_f.format(queue_name)).send(ctx)
+
+        if len(emojis) < 2:
+            return await ErrorReply(ErrorStrings.group_too_few_emojis).send(ctx)
+
+        if not 1 <= limit < len(emojis):
+            return await ErrorReply(ErrorStrings.group_limit_invalid_f.format(len(emojis))).send(ctx)
+
+        current_emojis = await self.__get_emojis_for_queue(ctx, queue_name)
+        role_ids = []
+        for emoji in emojis:
+            role_id = current_emojis.get(Utils.clean_animated_emoji(emoji))
+            if role_id is None:
+                return await ErrorReply(ErrorStrings.group_emoji_not_mapped_f.format(emoji, queue_name)).send(ctx)
+            role_ids.append(role_id)
+
+        def set_group(queues: dict):
+            queues.setdefault(queue_name, {}).setdefault("groups", {})[group_name] = {
+                "limit": limit,
+                "roles": role_ids
+            }
+
+        await self.queue_cache.update(ctx.guild, set_group)
+        self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | Set group "{group_name}" limit {limit} roles {role_ids}.')
+
+        emoji_list = " ".join(emojis)
+        if limit == 1:
+            message = SuccessStrings.group_exclusive_f.format(emoji_list, queue_name, group_name)
+        else:
+            message = SuccessStrings.group_limited_f.format(emoji_list, queue_name, group_name, limit)
+        await SuccessReply(message).send(ctx)
+
+    @_reactroles.command(name="ungroup")
+    @commands.guild_only()
+    @checks.mod_or_permissions(manage_roles=True)
+    async def __reactroles_ungroup(self, ctx: Context, queue_name: str, group_name: str):
+        """
+        Deletes a group of reactions from a queue. The reactions stay mapped.
+        """
+        if not await self.__get_queue(ctx=ctx, queue_name=queue_name):
+            self.logger.info(f'UNGROUP: Queue "{queue_name}" does not exist for guild {ctx.guild.id}.')
+            return await ErrorReply(ErrorStrings.queue_not_exists_f.format(queue_name)).send(ctx)
+
+        def delete_group(queues: dict):
+            return queues.get(queue_name, {}).get("groups", {}).pop(group_name, None)
+
+        if not await self.queue_cache.update(ctx.guild, delete_group):
+            return await ErrorReply(ErrorStrings.group_not_exists_f.format(group_name, queue_name)).send(ctx)
+
+        self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | Deleted group "{group_name}".')
+        await SuccessReply(SuccessStrings.group_deleted_f.format(group_name, queue_name)).send(ctx)
+
     @_reactroles.command(name="activate")
     @commands.guild_only()
     @checks.mod_or_permissions(manage_roles=True)
@@ -595,7 +1050,7 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
             return await ErrorReply(error_message).send(ctx)
 
         # the message is valid, so start adding reactions to it
-        emojis = await self.__get_emojis_for_queue(ctx=ctx, queue_name=queue_name)
+        emojis = dict(await self.__get_emojis_for_queue(ctx=ctx, queue_name=queue_name))
 
         if not emojis:
             self.logger.info("The queue has no mapped emojis. Not activating.")
@@ -611,7 +1066,9 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
             self.logger.info(f'g:{ctx.guild.id}|q:{queue_name} | '
                              f'Added emojis {emojis.keys()} to message {message_id}.')
             # move the emoji map to the activated config and delete the queue
-            await self.__add_activated_reactions(message_id=message_id, channel=channel, emoji_map=emojis)
+            groups = deepcopy((await self.__get_queue(ctx=ctx, queue_name=queue_name)).get("groups", {}))
+            await self.__add_activated_reactions(message_id=message_id, channel=channel, emoji_map=emojis,
+                                                 groups=groups)
             await self.__delete_queue(ctx=ctx, queue_name=queue_name)
 
             await SuccessReply(SuccessStrings.activated_queue_f.format(queue_name, message_id, channel)).send(ctx)
@@ -663,3 +1120,79 @@ class SimpleReactRoles(BaseSepCog, commands.Cog):
         else:
             self.logger.error(f"m:{message.id}|c:{channel.id} | Did not find any emojis in the queue for this message.")
             await ErrorReply(ErrorStrings.emoji_not_found_in_queue).send(ctx)
+
+    @_reactroles.command(name="deadletter", aliases=["dlq"])
+    @commands.guild_only()
+    @checks.mod_or_permissions(manage_roles=True)
+    async def __reactroles_deadletter(self, ctx: Context):
+        """
+        Shows the most recent role changes on this server which were dropped because they could not be applied.
+
+        Common causes are roles above the bot's highest role or the bot missing the Manage Roles permission.
+        """
+        dead_letters = self.dead_letters.get(ctx.guild.id)
+
+        if not dead_letters:
+            return await InfoReply(MiscStrings.dead_letter_empty).send(ctx)
+
+        message = MiscStrings.dead_letter_header
+        for entry in reversed(dead_letters):
+            line = MiscStrings.dead_letter_entry_f.format(entry.get('time'), entry.get('member'),
+                                                          ", ".join(entry.get('roles')), entry.get('reason'))
+            if len(message) + len(line) > self.EMBED_DESCRIPTION_LIMIT:
+                break
+            message += line
+
+        await InfoReply(message).send(ctx)
+
+    @_reactroles.group(name="stats", invoke_without_command=True)
+    @commands.guild_only()
+    @checks.mod_or_permissions(manage_roles=True)
+    async def __reactroles_stats(self, ctx: Context):
+        """
+        Shows recent reaction event, member edit and latency metrics of the role pipeline for this server.
+        """
+        metrics = self.metrics.guild(ctx.guild.id)
+        gauges = self.__pipeline_gauges()
+
+        def fmt_latency(histogram: RollingHistogram, percent: float) -> str:
+            seconds = histogram.percentile(percent)
+            if seconds is None:
+                return MiscStrings.stats_no_data
+            if seconds == float('inf'):
+                return f"> {histogram.bounds[-1]:g}s"
+            return f"<= {seconds * 1000:g}ms" if seconds < 1 else f"<= {seconds:g}s"
+
+        message = MiscStrings.stats_header_f.format(int(metrics.events.window // 60))
+        message += MiscStrings.stats_counters_f.format(metrics.events.recent(), metrics.coalesced.recent(),
+                                                       metrics.coalesced_percent(), metrics.edits.recent(),
+                                                       metrics.skipped.recent(), metrics.retries.recent(),
+                                                       metrics.dead_lettered.recent())
+        for label, histogram in ((MiscStrings.stats_latency_wait, metrics.wait_latency),
+                                 (MiscStrings.stats_latency_edit, metrics.edit_latency)):
+            message += MiscStrings.stats_latency_f.format(label, *(fmt_latency(histogram, p) for p in (50, 95, 99)))
+        message += MiscStrings.stats_queues_f.format(*(value for _, value in gauges.values()))
+
+        await InfoReply(message).send(ctx)
+
+    @__reactroles_stats.command(name="export")
+    @checks.is_owner()
+    async def __reactroles_stats_export(self, ctx: Context, export_format: str = "prometheus"):
+        """
+        Uploads the role pipeline metrics of every server as a file.
+
+        Formats: `prometheus` (text exposition format) or `json`.
+        """
+        export_format = export_format.lower()
+        gauges = self.__pipeline_gauges()
+
+        if export_format == "prometheus":
+            data = self.metrics.render_prometheus(gauges)
+            filename = "simplereactroles.prom"
+        elif export_format == "json":
+            data = json.dumps(self.metrics.export(gauges), indent=2)
+            filename = "simplereactroles.json"
+        else:
+            return await ErrorReply(ErrorStrings.stats_export_format_f.format(export_format)).send(ctx)
+
+        await ctx.send(file=discord.File(io.BytesIO(data.encode('utf-8')), filename=filename))
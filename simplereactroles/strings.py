@@ -23,6 +23,16 @@ class ErrorStrings(object):
 
     message_not_found_f = _("Message with ID `{}` not found in channel `{}`.")
 
+    # Groups
+    group_limit_invalid_f = _("The group limit must be at least 1 and fewer than the number of reactions in the "
+                              "group ({}).")
+    group_too_few_emojis = _("A group needs at least two reactions.")
+    group_emoji_not_mapped_f = _("Reaction {} is not mapped in queue `{}`. Map it before adding it to a group.")
+    group_not_exists_f = _("Group `{}` does not exist in queue `{}`.")
+
+    # Stats
+    stats_export_format_f = _("Unknown export format `{}`. Use `prometheus` or `json`.")
+
     discord_add_reaction_error = _("Received error while calling Discord add_reaction API. " +
                                    "Check logs for more details.")
     discord_remove_reaction_error = _("Received error while calling Discord remove_reaction API. " +
@@ -37,6 +47,9 @@ class SuccessStrings(object):
     queue_deleted_f = _("Deleted the queue named `{}`.")
     emoji_added_f = _("Assigned role `{}` to reaction {} in queue `{}`.")
     emoji_deleted_f = _("Deleted reaction {} in queue `{}`. It was assigned to role: `{}`")
+    group_exclusive_f = _("Reactions {} in queue `{}` are now an exclusive group `{}`. Members can pick one.")
+    group_limited_f = _("Reactions {} in queue `{}` are now group `{}`. Members can pick up to {}.")
+    group_deleted_f = _("Deleted group `{}` from queue `{}`.")
 
     activated_queue_f = _("**Queue Activated:** {}, **Message:** `{}`, **Channel:** `{}`")
     deactivated_queue_f = _("Deactivated reaction roles. **Message:** `{}`, **Channel:** `{}`")
@@ -46,6 +59,29 @@ class MiscStrings(object):
     # Permissions check. Not surfaced to the client.
     perm_passed = _("Permissions check passed.")
 
+    # Dead letter reasons
+    dead_letter_no_manage_roles = _("The bot does not have permission to manage roles on the server.")
+    dead_letter_managed_role = _("The role is managed by an integration and can't be assigned.")
+    dead_letter_hierarchy = _("The role is not below the bot's highest role.")
+    dead_letter_forbidden_f = _("Discord refused the role change: {}")
+    dead_letter_not_found_f = _("The member or role no longer exists: {}")
+    dead_letter_rejected_f = _("Discord rejected the role change: {}")
+    dead_letter_retries_f = _("Gave up after {} attempts. Last error: {}")
+
+    dead_letter_empty = _("No role changes have been dropped on this server.")
+    dead_letter_header = _("Most recent role changes which could not be applied:\n\n")
+    dead_letter_entry_f = _("`{}` **{}** | Roles: `{}` | {}\n")
+
+    # Stats
+    stats_header_f = _("Role pipeline over the last {} minutes on this server:\n\n")
+    stats_counters_f = _("**Reaction events:** {} ({} coalesced, {:.1f}%)\n"
+                         "**Member edits:** {} | **Skipped:** {} | **Retries:** {} | **Dropped:** {}\n")
+    stats_latency_f = _("**{}:** p50 `{}` | p95 `{}` | p99 `{}`\n")
+    stats_latency_wait = _("Reaction to role latency")
+    stats_latency_edit = _("Member edit latency")
+    stats_queues_f = _("\n**Bot wide:** {} queued | {} pending members | {} waiting to retry | {} editing\n")
+    stats_no_data = _("n/a")
+
 
 class DateTimeStrings(object):
     iso = "%Y-%m-%dT%H:%M:%SZ"
@@ -1,50 +1,28 @@
-import collections
-from copy import deepcopy
-from typing import Callable, Union
+import asyncio
+from typing import Callable, TypeVar
 
-class Utils(object):
+from redbot.core.config import Value
 
-    @staticmethod
-    def recursive_dict_update(d: dict, u: Union[dict, collections.Mapping]) -> dict:
-        for k, v, in u.items():
-            if isinstance(v, collections.Mapping):
-                d[k] = Utils.recursive_dict_update(d.get(k, {}), v)
-            else:
-                d[k] = v
-        return d
+T = TypeVar('T')
 
 
+class Utils(object):
+
     @staticmethod
-    async def update_config_keys(field_func: Callable, new_data: dict, update: bool = False):
+    async def atomic_update(value: Value, mutator: Callable[[dict], T], lock: asyncio.Lock) -> T:
         """
-        This is a very not safe way to update data in the config.
-        Gets the existing config value and updates the object, then returns the result.
-        With multiple calls running at the same time, it's possible to lose data.
-        If you need to safely update the data, consider connecting directly to the DB.
-
-        :param field_func: lambda function which will return the awaitable config Value
-        :param new_data: New dictionary to place in the config field
-        :param update: Perform a recursive dictionary update rather than an overwrite of each key.
-        :return:
+        Atomically applies an in place mutation to a dict stored in the Config.
+        Every writer of the value must use the same lock, so concurrent read-modify-write cycles on the
+        value are serialized and can no longer lose data.
+
+        :param value: Config Value holding a dict, eg. self.config.channel(channel).activated
+        :param mutator: Function which receives the current dict, modifies it in place and returns a result.
+        :param lock: asyncio Lock guarding the value.
+        :return: The result of the mutator.
         """
-
-        existing_data = await field_func()()  # double call to get the current data
-
-        if update:
-            updated_dict = Utils.recursive_dict_update(existing_data, new_data)
-        else:
-            updated_dict = deepcopy(existing_data)  # type: dict
-            for k, v in new_data.items():
-                updated_dict[k] = v
-
-        return await field_func().set(updated_dict)
-
-    @staticmethod
-    async def delete_config_key(field_func: Callable, key: str):
-        existing_data = await field_func()()
-        removed_value = existing_data.pop(key, None)
-        await field_func().set(existing_data)
-        return removed_value
+        async with lock:
+            async with value() as data:
+                return mutator(data)
 
     @staticmethod
     def clean_animated_emoji(emoji_str: str):
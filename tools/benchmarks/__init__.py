@@ -0,0 +1,27 @@
+"""
+Offline benchmarks for the cogs in this repository.
+
+Benchmarks run the real cog code against in-memory stand-ins for Discord, Twitch and the Red Config, so they
+need Red-DiscordBot and its dependencies installed, but no bot token or network access. Run them from the
+tools directory, eg. ``cd tools && python -m benchmarks.reactroles_storm --help``.
+
+They live outside the repository root, which Red's downloader treats as a collection of cogs.
+"""
+import os
+import sys
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Red's downloader installs this repository as the "cog_shared" package, which is where the cogs import seplib
+# from. Mirror that for a plain checkout.
+if 'cog_shared' not in sys.modules:
+    try:
+        import cog_shared  # noqa: F401
+    except ImportError:
+        cog_shared = types.ModuleType('cog_shared')
+        cog_shared.__path__ = [REPO_ROOT]
+        sys.modules['cog_shared'] = cog_shared
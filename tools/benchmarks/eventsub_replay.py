@@ -0,0 +1,240 @@
+"""
+Local stand-in for Twitch EventSub webhook delivery.
+
+Starts the TwitchLive EventSub receiver on a local port and replays signed messages at it the way Twitch would:
+a callback verification challenge, stream.online/stream.offline notifications, a revocation, and the messages the
+receiver must reject (bad signature, stale timestamp, duplicate delivery). Then measures how quickly a burst of
+signed notifications reaches the handler.
+
+EventSubReplayer can also be pointed at any other receiver, eg. a bot running with `twitchlive eventsub enable`.
+
+Usage:
+    python -m benchmarks.eventsub_replay --notifications 1000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from . import fakes
+from twitchlive.eventsub.receiver import EventSubReceiver
+
+
+class EventSubReplayer(object):
+    """
+    Sends EventSub messages signed with the subscription secret to a webhook callback URL.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, callback_url: str, secret: str):
+        self.session = session
+        self.callback_url = callback_url
+        self.secret = secret
+
+    @staticmethod
+    def timestamp(age: float = 0) -> str:
+        sent = datetime.datetime.utcnow() - datetime.timedelta(seconds=age)
+        return sent.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+
+    @staticmethod
+    def subscription(sub_type: str, user_id: str, status: str = "enabled") -> dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "status": status,
+            "type": sub_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": user_id},
+            "transport": {"method": "webhook", "callback": "https://example.com/eventsub"},
+            "created_at": EventSubReplayer.timestamp(),
+            "cost": 1
+        }
+
+    @staticmethod
+    def stream_event(sub_type: str, user_id: str, stream_id: Optional[str] = None) -> dict:
+        event = {
+            "broadcaster_user_id": user_id,
+            "broadcaster_user_login": f"streamer{user_id}",
+            "broadcaster_user_name": f"Streamer{user_id}",
+        }
+        if sub_type == "stream.online":
+            event.update({"id": stream_id or str(uuid.uuid4().int)[:11], "type": "live",
+                          "started_at": EventSubReplayer.timestamp()})
+        return event
+
+    async def send(self, message_type: str, payload: dict, message_id: Optional[str] = None,
+                   timestamp: Optional[str] = None, signature: Optional[str] = None) -> Tuple[int, str]:
+        """
+        Send one signed message.
+        :param message_type: EventSub message type header
+        :param payload: JSON body
+        :param message_id: Message ID, random if not given. Reuse one to simulate a redelivery.
+        :param timestamp: Message timestamp, now if not given.
+        :param signature: Signature override, eg. to simulate a forged message.
+        :return: Tuple of (HTTP status, response body)
+        """
+        body = json.dumps(payload).encode('utf-8')
+        message_id = message_id or str(uuid.uuid4())
+        timestamp = timestamp or self.timestamp()
+
+        headers = {
+            EventSubReceiver.MESSAGE_ID_HEADER: message_id,
+            EventSubReceiver.TIMESTAMP_HEADER: timestamp,
+            EventSubReceiver.SIGNATURE_HEADER: signature or EventSubReceiver.sign(self.secret, message_id,
+                                                                                  timestamp, body),
+            EventSubReceiver.MESSAGE_TYPE_HEADER: message_type,
+            "Content-Type": "application/json",
+        }
+
+        async with self.session.post(self.callback_url, data=body, headers=headers) as resp:
+            return resp.status, await resp.text()
+
+    async def challenge(self, sub_type: str, user_id: str) -> Tuple[int, str, str]:
+        challenge = str(uuid.uuid4())
+        status, text = await self.send(EventSubReceiver.TYPE_VERIFICATION, {
+            "challenge": challenge,
+            "subscription": self.subscription(sub_type, user_id, status="webhook_callback_verification_pending")
+        })
+        return status, text, challenge
+
+    async def notify(self, sub_type: str, user_id: str, **kwargs) -> Tuple[int, str]:
+        return await self.send(EventSubReceiver.TYPE_NOTIFICATION, {
+            "subscription": self.subscription(sub_type, user_id),
+            "event": self.stream_event(sub_type, user_id)
+        }, **kwargs)
+
+    async def revoke(self, sub_type: str, user_id: str) -> Tuple[int, str]:
+        return await self.send(EventSubReceiver.TYPE_REVOCATION, {
+            "subscription": self.subscription(sub_type, user_id, status="authorization_revoked")
+        })
+
+
+class RecordingHandler(object):
+    """
+    Receiver handler which records when each message arrived.
+    """
+
+    def __init__(self):
+        self.received = []  # type: List[Tuple[float, str, dict, dict]]
+        self.arrived = asyncio.Event()
+
+    async def __call__(self, message_type: str, subscription: dict, event: dict):
+        self.received.append((time.perf_counter(), message_type, subscription, event))
+        self.arrived.set()
+
+    async def wait_for(self, count: int, timeout: float = 5.0) -> bool:
+        deadline = time.perf_counter() + timeout
+        while len(self.received) < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+async def run_checks(replayer: EventSubReplayer, handler: RecordingHandler) -> Dict[str, bool]:
+    results = {}
+
+    status, text, challenge = await replayer.challenge("stream.online", "1001")
+    results["verification challenge answered"] = status == 200 and text == challenge
+
+    status, _ = await replayer.notify("stream.online", "1001", message_id="online-1")
+    results["online notification accepted"] = status == 204 and await handler.wait_for(1)
+
+    status, _ = await replayer.notify("stream.online", "1001", message_id="online-1")
+    await asyncio.sleep(0.1)
+    results["duplicate delivery dropped"] = status == 204 and len(handler.received) == 1
+
+    status, _ = await replayer.notify("stream.offline", "1001")
+    results["offline notification accepted"] = status == 204 and await handler.wait_for(2)
+
+    status, _ = await replayer.notify("stream.online", "1002", signature="sha256=" + "0" * 64)
+    results["forged signature rejected"] = status == 403
+
+    status, _ = await replayer.notify("stream.online", "1003",
+                                      timestamp=replayer.timestamp(age=EventSubReceiver.MAX_MESSAGE_AGE + 60))
+    results["stale message rejected"] = status == 403
+
+    status, _ = await replayer.revoke("stream.online", "1001")
+    results["revocation passed on"] = status == 204 and await handler.wait_for(3) and \
+        handler.received[2][1] == EventSubReceiver.TYPE_REVOCATION
+
+    await asyncio.sleep(0.1)
+    results["nothing else reached the handler"] = len(handler.received) == 3
+    return results
+
+
+async def run_replay(args: argparse.Namespace):
+    secret = "benchmark-secret"
+    handler = RecordingHandler()
+    receiver = EventSubReceiver(secret=secret, handler=handler, logger=logging.getLogger("eventsub_replay"),
+                                host="127.0.0.1", port=args.port)
+    await receiver.start()
+
+    callback_url = f"http://127.0.0.1:{args.port}{receiver.path}"
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            replayer = EventSubReplayer(session, callback_url, secret)
+
+            results = await run_checks(replayer, handler)
+            print("Receiver checks:")
+            for name, passed in results.items():
+                print(f"  {'PASS' if passed else 'FAIL'}  {name}")
+
+            # burst of notifications, measuring send -> handler latency
+            handler.received.clear()
+            sent_at = {}
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def send_one(index: int):
+                async with semaphore:
+                    message_id = f"burst-{index}"
+                    sent_at[message_id] = time.perf_counter()
+                    return await replayer.notify("stream.online", str(2000 + index), message_id=message_id)
+
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(send_one(i) for i in range(args.notifications)))
+            complete = await handler.wait_for(args.notifications, timeout=30)
+            elapsed = time.perf_counter() - started
+
+            latencies = []
+            for received_at, _, _, event in handler.received:
+                user_index = int(event["broadcaster_user_id"]) - 2000
+                latencies.append(received_at - sent_at[f"burst-{user_index}"])
+
+            accepted = sum(1 for status, _ in responses if status == 204)
+            print(f"Notifications:        {args.notifications} sent, {accepted} accepted, "
+                  f"{len(handler.received)} handled{'' if complete else ' (incomplete)'}")
+            print(f"Throughput:           {args.notifications / elapsed:.0f} notifications/s")
+            print(f"Send -> handler:      {fakes.summarize(latencies)}")
+    finally:
+        await receiver.stop()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay signed EventSub notifications at the TwitchLive receiver.")
+    parser.add_argument("--notifications", type=int, default=500, help="Notifications in the burst.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Notifications in flight at once.")
+    parser.add_argument("--port", type=int, default=18080, help="Local port for the receiver.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run_replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import asyncio
+import statistics
+from copy import deepcopy
+from typing import Any, Dict, List, Tuple
+
+
+class MemoryValue(object):
+    """
+    Stand-in for a Red Config Value backed by a plain dict.
+    Supports awaiting, set(), clear(), the ``async with value() as data`` context manager and the raw accessors.
+    """
+
+    def __init__(self, config: 'MemoryConfig', scope_key: Tuple, name: str, default: Any):
+        self.config = config
+        self.scope_key = scope_key
+        self.name = name
+        self.default = default
+
+    def __get(self) -> Any:
+        return self.config.data.get(self.scope_key, {}).get(self.name, deepcopy(self.default))
+
+    def __call__(self) -> '_MemoryValueContext':
+        return _MemoryValueContext(self)
+
+    async def get(self) -> Any:
+        return deepcopy(self.__get())
+
+    async def set(self, value: Any):
+        self.config.writes += 1
+        self.config.data.setdefault(self.scope_key, {})[self.name] = deepcopy(value)
+
+    async def clear(self):
+        self.config.writes += 1
+        self.config.data.get(self.scope_key, {}).pop(self.name, None)
+
+    async def get_raw(self, *keys: str, default: Any = None) -> Any:
+        value = self.__get()
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                return default
+            value = value[key]
+        return deepcopy(value)
+
+    async def set_raw(self, *keys: str, value: Any):
+        self.config.writes += 1
+        data = self.config.data.setdefault(self.scope_key, {}).setdefault(self.name, deepcopy(self.default))
+        for key in keys[:-1]:
+            data = data.setdefault(key, {})
+        data[keys[-1]] = deepcopy(value)
+
+    async def clear_raw(self, *keys: str):
+        self.config.writes += 1
+        data = self.config.data.get(self.scope_key, {}).get(self.name)
+        for key in keys[:-1]:
+            if not isinstance(data, dict):
+                return
+            data = data.get(key)
+        if isinstance(data, dict):
+            data.pop(keys[-1], None)
+
+
+class _MemoryValueContext(object):
+
+    def __init__(self, value: MemoryValue):
+        self.value = value
+        self.data = None
+
+    def __await__(self):
+        return self.value.get().__await__()
+
+    async def __aenter__(self):
+        self.data = await self.value.get()
+        return self.data
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.value.set(self.data)
+
+
+class MemoryGroup(object):
+
+    def __init__(self, config: 'MemoryConfig', scope: str, scope_key: Tuple):
+        self.config = config
+        self.scope = scope
+        self.scope_key = scope_key
+
+    def __getattr__(self, name: str) -> MemoryValue:
+        defaults = self.config.defaults.get(self.scope, {})
+        if name not in defaults:
+            raise AttributeError(name)
+        return MemoryValue(self.config, self.scope_key, name, defaults[name])
+
+    async def clear(self):
+        self.config.writes += 1
+        self.config.data.pop(self.scope_key, None)
+
+
+class MemoryConfig(object):
+    """
+    In-memory stand-in for the parts of Red's Config used by the cogs in this repository.
+    Counts every write, so benchmarks can report how much Config traffic a workload generates.
+    """
+
+    GLOBAL = "GLOBAL"
+    GUILD = "GUILD"
+    CHANNEL = "CHANNEL"
+    MEMBER = "MEMBER"
+
+    def __init__(self):
+        self.defaults = {}  # type: Dict[str, Dict[str, Any]]
+        self.data = {}  # type: Dict[Tuple, Dict[str, Any]]
+        self.writes = 0
+
+    def __register(self, scope: str, **kwargs):
+        self.defaults.setdefault(scope, {}).update(kwargs)
+
+    def register_global(self, **kwargs):
+        self.__register(self.GLOBAL, **kwargs)
+
+    def register_guild(self, **kwargs):
+        self.__register(self.GUILD, **kwargs)
+
+    def register_channel(self, **kwargs):
+        self.__register(self.CHANNEL, **kwargs)
+
+    def register_member(self, **kwargs):
+        self.__register(self.MEMBER, **kwargs)
+
+    def __getattr__(self, name: str) -> MemoryValue:
+        return getattr(MemoryGroup(self, self.GLOBAL, (self.GLOBAL,)), name)
+
+    def guild(self, guild) -> MemoryGroup:
+        return MemoryGroup(self, self.GUILD, (self.GUILD, guild.id))
+
+    def channel(self, channel) -> MemoryGroup:
+        return MemoryGroup(self, self.CHANNEL, (self.CHANNEL, channel.id))
+
+    def member(self, member) -> MemoryGroup:
+        return MemoryGroup(self, self.MEMBER, (self.MEMBER, member.guild.id, member.id))
+
+    def __all(self, scope: str) -> Dict[Tuple, Dict[str, Any]]:
+        results = {}
+        for scope_key, values in self.data.items():
+            if scope_key[0] == scope:
+                entry = deepcopy(self.defaults.get(scope, {}))
+                entry.update(deepcopy(values))
+                results[scope_key[1:]] = entry
+        return results
+
+    async def all_guilds(self) -> Dict[int, Dict[str, Any]]:
+        return {key[0]: values for key, values in self.__all(self.GUILD).items()}
+
+    async def all_channels(self) -> Dict[int, Dict[str, Any]]:
+        return {key[0]: values for key, values in self.__all(self.CHANNEL).items()}
+
+    async def all_members(self) -> Dict[int, Dict[int, Dict[str, Any]]]:
+        results = {}
+        for (guild_id, member_id), values in self.__all(self.MEMBER).items():
+            results.setdefault(guild_id, {})[member_id] = values
+        return results
+
+
+class FakeResponse(object):
+    """
+    Minimal aiohttp response stand-in, enough to construct discord.py HTTP exceptions.
+    """
+
+    def __init__(self, status: int, reason: str = ""):
+        self.status = status
+        self.reason = reason
+
+
+class FakeBot(object):
+    """
+    Minimal stand-in for Red, covering what the cogs use outside of their commands.
+    """
+
+    def __init__(self):
+        self.guilds = []
+        self.channels = {}
+        self.cogs = {}
+        self.loop = asyncio.get_event_loop()
+
+    async def wait_until_ready(self):
+        return
+
+    def add_cog(self, cog):
+        self.cogs[cog.__class__.__name__] = cog
+
+    def remove_cog(self, name: str):
+        self.cogs.pop(name, None)
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def get_guild(self, guild_id: int):
+        for guild in self.guilds:
+            if guild.id == guild_id:
+                return guild
+        return None
+
+    def get_channel(self, id: int):
+        return self.channels.get(id)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round((percent / 100.0) * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float], scale: float = 1000.0, unit: str = "ms") -> str:
+    """
+    Format a list of measurements (in seconds by default) as count/mean/p50/p95/p99/max.
+    """
+    if not values:
+        return "n=0"
+    return "n={} mean={:.2f}{u} p50={:.2f}{u} p95={:.2f}{u} p99={:.2f}{u} max={:.2f}{u}".format(
+        len(values), statistics.mean(values) * scale, percentile(values, 50) * scale,
+        percentile(values, 95) * scale, percentile(values, 99) * scale, max(values) * scale, u=unit
+    )
+
+
+def sample_at(series: List[Tuple[float, Any]], every: float) -> List[Tuple[float, Any]]:
+    """
+    Thin out a time series of (seconds, value) pairs to roughly one sample per `every` seconds.
+    """
+    thinned = []
+    next_time = 0.0
+    for timestamp, value in series:
+        if timestamp >= next_time:
+            thinned.append((timestamp, value))
+            next_time = timestamp + every
+    return thinned
@@ -0,0 +1,383 @@
+"""
+Offline stand-in for the Twitch Helix API.
+
+An aiohttp app serving the endpoints TwitchLive uses:
+    - POST /oauth2/token   client credentials grant
+    - GET  /helix/users    lookup by login or id
+    - GET  /helix/streams  streams by user_id, live streamers only
+    - GET  /helix/games    lookup by id or name
+
+It simulates a population of streamers which go live and offline over time, request latency, and Helix's
+per-client rate limit, including the Ratelimit-* headers and 429 responses once a client's bucket is empty.
+Every request and every go-live is recorded, so benchmarks can measure API calls and announcement latency.
+
+Point TwitchApi at it with ``HelixSimulator.patch_twitch_api()``, or run it standalone:
+    python -m benchmarks.helix_sim --streamers 10000 --port 18081
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+class SimStreamer(object):
+
+    __slots__ = ('user_id', 'login', 'stream_id', 'went_live_at', 'started_at', 'title', 'game_id')
+
+    def __init__(self, user_id: str, login: str):
+        self.user_id = user_id
+        self.login = login
+        self.stream_id = None  # type: Optional[str]
+        self.went_live_at = None  # type: Optional[float]
+        self.started_at = None  # type: Optional[str]
+        self.title = ""
+        self.game_id = None  # type: Optional[str]
+
+    @property
+    def is_live(self) -> bool:
+        return self.stream_id is not None
+
+
+class SimRateBucket(object):
+    """
+    Helix rate limit bucket of one client: `limit` points, refilled continuously over a minute.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(float(self.limit), self.tokens + (now - self.updated) * self.limit / 60.0)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    @property
+    def reset_epoch(self) -> int:
+        # when the bucket will be full again
+        return int(time.time() + (self.limit - self.tokens) * 60.0 / self.limit) + 1
+
+
+class HelixSimulator(object):
+
+    BASE_USER_ID = 10000000
+    BASE_GAME_ID = 500000
+    MAX_IDS_PER_REQUEST = 100
+    TOKEN_EXPIRES_IN = 3600
+
+    def __init__(self, streamers: int, live_fraction: float = 0.05, go_live_rate: float = 1.0,
+                 latency: float = 0.05, jitter: float = 0.01, rate_limit: int = 800, seed: int = 1,
+                 host: str = "127.0.0.1", port: int = 18081, games: int = 200):
+        """
+        :param streamers: Number of streamers in the population.
+        :param live_fraction: Fraction of the streamers live at the start. Stays about the same over time.
+        :param go_live_rate: Streamers going live per second, with as many going offline.
+        :param latency: Mean response latency in seconds.
+        :param jitter: Standard deviation of the response latency in seconds.
+        :param rate_limit: Helix points per minute for each client ID.
+        :param games: Number of games streamers pick from. A few popular ones get most of the streams.
+        """
+        self.live_fraction = live_fraction
+        self.go_live_rate = go_live_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.host = host
+        self.port = port
+
+        self.rng = random.Random(seed)
+
+        self.games = {str(self.BASE_GAME_ID + index): f"Game {index}" for index in range(games)}
+        self.games_by_name = {name.lower(): game_id for game_id, name in self.games.items()}
+        self.__game_ids = list(self.games)
+        self.__game_weights = [1.0 / (rank + 1) for rank in range(games)]
+
+        self.streamers = []  # type: List[SimStreamer]
+        self.by_id = {}  # type: Dict[str, SimStreamer]
+        self.by_login = {}  # type: Dict[str, SimStreamer]
+
+        for index in range(streamers):
+            streamer = SimStreamer(str(self.BASE_USER_ID + index), f"streamer{index}")
+            self.streamers.append(streamer)
+            self.by_id[streamer.user_id] = streamer
+            self.by_login[streamer.login] = streamer
+
+        self.__offline = set(range(streamers))
+        self.__live = set()
+        self.__stream_counter = 0
+
+        for index in self.rng.sample(range(streamers), int(streamers * live_fraction)):
+            self.__go_live(index, at=None)
+
+        self.calls = defaultdict(int)  # type: Dict[str, int]
+        self.rate_limited = 0
+        # stream ID -> perf_counter time the stream went live, for streams started while the simulator ran
+        self.went_live = {}  # type: Dict[str, float]
+
+        self.__buckets = {}  # type: Dict[str, SimRateBucket]
+        self.__runner = None  # type: Optional[web.AppRunner]
+        self.__churn_task = None  # type: Optional[asyncio.Task]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def patch_twitch_api(self):
+        """
+        Point every TwitchApi client at the simulator.
+        """
+        from twitchlive.twitchapi.twitchapi import TwitchApi
+
+        TwitchApi.TWITCH_AUTH_TOKEN_URL = f"{self.url}/oauth2/token"
+        TwitchApi.TWITCH_API_PREFIX = f"{self.url}/helix"
+
+    @property
+    def live_count(self) -> int:
+        return len(self.__live)
+
+    def __go_live(self, index: int, at: Optional[float]):
+        streamer = self.streamers[index]
+        self.__stream_counter += 1
+        streamer.stream_id = str(900000000 + self.__stream_counter)
+        streamer.went_live_at = at
+        streamer.started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        streamer.title = f"Stream {self.__stream_counter} of {streamer.login}"
+        streamer.game_id = self.rng.choices(self.__game_ids, weights=self.__game_weights)[0]
+        self.__offline.discard(index)
+        self.__live.add(index)
+
+        if at is not None:
+            self.went_live[streamer.stream_id] = at
+
+    def __go_offline(self, index: int):
+        streamer = self.streamers[index]
+        streamer.stream_id = None
+        streamer.went_live_at = None
+        streamer.started_at = None
+        self.__live.discard(index)
+        self.__offline.add(index)
+
+    async def __churn(self, tick: float = 0.1):
+        carry = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            carry += self.go_live_rate * tick
+
+            while carry >= 1 and self.__offline:
+                carry -= 1
+                now = time.perf_counter()
+                if self.__live:
+                    self.__go_offline(self.rng.choice(tuple(self.__live)))
+                self.__go_live(self.rng.choice(tuple(self.__offline)), at=now)
+
+    async def __delay(self):
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+
+    def __rate_limit(self, request: web.Request) -> Optional[web.Response]:
+        client_id = request.headers.get("Client-ID", "")
+        bucket = self.__buckets.get(client_id)
+        if bucket is None:
+            bucket = self.__buckets[client_id] = SimRateBucket(self.rate_limit)
+
+        allowed = bucket.take()
+        request['ratelimit_headers'] = {
+            "Ratelimit-Limit": str(bucket.limit),
+            "Ratelimit-Remaining": str(int(bucket.tokens)),
+            "Ratelimit-Reset": str(bucket.reset_epoch),
+        }
+
+        if allowed:
+            return None
+
+        self.rate_limited += 1
+        return web.json_response({"error": "Too Many Requests", "status": 429, "message": ""}, status=429,
+                                 headers=request['ratelimit_headers'])
+
+    def __authorized(self, request: web.Request) -> bool:
+        return request.headers.get("Authorization", "").startswith("Bearer sim-")
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        self.calls['token'] += 1
+        await self.__delay()
+
+        client_id = request.query.get("client_id", "")
+        return web.json_response({
+            "access_token": f"sim-{client_id}-{self.calls['token']}",
+            "expires_in": self.TOKEN_EXPIRES_IN,
+            "token_type": "bearer",
+        })
+
+    async def handle_users(self, request: web.Request) -> web.Response:
+        self.calls['users'] += 1
+        await self.__delay()
+
+        if not self.__authorized(request):
+            return web.json_response({"error": "Unauthorized", "status": 401}, status=401)
+        limited = self.__rate_limit(request)
+        if limited is not None:
+            return limited
+
+        logins = request.query.getall("login", [])
+        user_ids = request.query.getall("id", [])
+        if len(logins) + len(user_ids) > self.MAX_IDS_PER_REQUEST:
+            return web.json_response({"error": "Bad Request", "status": 400}, status=400)
+
+        found = [self.by_login.get(login.lower()) for login in logins] + [self.by_id.get(uid) for uid in user_ids]
+        data = [{
+            "id": streamer.user_id,
+            "login": streamer.login,
+            "display_name": streamer.login.capitalize(),
+            "type": "",
+            "broadcaster_type": "",
+            "description": "",
+            "profile_image_url": f"https://static-cdn.example/{streamer.login}-profile.png",
+            "offline_image_url": "",
+            "view_count": 0,
+            "created_at": "2016-12-14T20:32:28Z",
+        } for streamer in found if streamer is not None]
+
+        return web.json_response({"data": data}, headers=request['ratelimit_headers'])
+
+    async def handle_streams(self, request: web.Request) -> web.Response:
+        self.calls['streams'] += 1
+        await self.__delay()
+
+        if not self.__authorized(request):
+            return web.json_response({"error": "Unauthorized", "status": 401}, status=401)
+        limited = self.__rate_limit(request)
+        if limited is not None:
+            return limited
+
+        user_ids = request.query.getall("user_id", [])
+        if len(user_ids) > self.MAX_IDS_PER_REQUEST:
+            return web.json_response({"error": "Bad Request", "status": 400}, status=400)
+
+        data = []
+        for user_id in user_ids:
+            streamer = self.by_id.get(user_id)
+            if streamer is None or not streamer.is_live:
+                continue
+            data.append({
+                "id": streamer.stream_id,
+                "user_id": streamer.user_id,
+                "user_login": streamer.login,
+                "user_name": streamer.login.capitalize(),
+                "game_id": streamer.game_id,
+                "game_name": self.games[streamer.game_id],
+                "type": "live",
+                "title": streamer.title,
+                "viewer_count": 42,
+                "started_at": streamer.started_at,
+                "language": "en",
+                "thumbnail_url": f"https://static-cdn.example/live_user_{streamer.login}-{{width}}x{{height}}.jpg",
+                "tag_ids": [],
+                "is_mature": False,
+            })
+
+        return web.json_response({"data": data, "pagination": {}}, headers=request['ratelimit_headers'])
+
+    async def handle_games(self, request: web.Request) -> web.Response:
+        self.calls['games'] += 1
+        await self.__delay()
+
+        if not self.__authorized(request):
+            return web.json_response({"error": "Unauthorized", "status": 401}, status=401)
+        limited = self.__rate_limit(request)
+        if limited is not None:
+            return limited
+
+        game_ids = request.query.getall("id", [])
+        names = request.query.getall("name", [])
+        if len(game_ids) + len(names) > self.MAX_IDS_PER_REQUEST:
+            return web.json_response({"error": "Bad Request", "status": 400}, status=400)
+
+        found = [game_id for game_id in game_ids if game_id in self.games] + \
+                [self.games_by_name[name.lower()] for name in names if name.lower() in self.games_by_name]
+        data = [{
+            "id": game_id,
+            "name": self.games[game_id],
+            "box_art_url": f"https://static-cdn.example/ttv-boxart/{game_id}-{{width}}x{{height}}.jpg",
+        } for game_id in dict.fromkeys(found)]
+
+        return web.json_response({"data": data}, headers=request['ratelimit_headers'])
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/oauth2/token", self.handle_token)
+        app.router.add_get("/helix/users", self.handle_users)
+        app.router.add_get("/helix/streams", self.handle_streams)
+        app.router.add_get("/helix/games", self.handle_games)
+        return app
+
+    async def start(self):
+        self.__runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, self.host, self.port).start()
+        self.__churn_task = asyncio.ensure_future(self.__churn())
+
+    async def stop(self):
+        if self.__churn_task is not None:
+            self.__churn_task.cancel()
+            self.__churn_task = None
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+
+async def serve(args: argparse.Namespace):
+    simulator = HelixSimulator(streamers=args.streamers, live_fraction=args.live_fraction,
+                               go_live_rate=args.go_live_rate, latency=args.latency / 1000.0,
+                               jitter=args.jitter / 1000.0, rate_limit=args.rate_limit, seed=args.seed,
+                               port=args.port)
+    await simulator.start()
+    print(f"Helix simulator listening on {simulator.url} with {len(simulator.streamers)} streamers "
+          f"({simulator.live_count} live). Logins are streamer0..streamer{len(simulator.streamers) - 1}.")
+
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"calls: {dict(simulator.calls)} | rate limited: {simulator.rate_limited} | "
+                  f"live: {simulator.live_count} | went live: {len(simulator.went_live)}")
+    finally:
+        await simulator.stop()
+
+
+def add_simulator_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--live-fraction", type=float, default=0.05, help="Fraction of streamers live at once.")
+    parser.add_argument("--go-live-rate", type=float, default=2.0,
+                        help="Streamers going live per second (as many go offline).")
+    parser.add_argument("--latency", type=float, default=50, help="Mean Helix response latency in ms.")
+    parser.add_argument("--jitter", type=float, default=10, help="Helix response latency jitter in ms.")
+    parser.add_argument("--rate-limit", type=int, default=800, help="Helix points per minute per client ID.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline Twitch Helix API simulator.")
+    parser.add_argument("--streamers", type=int, default=10000, help="Number of simulated streamers.")
+    parser.add_argument("--port", type=int, default=18081, help="Local port to listen on.")
+    add_simulator_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
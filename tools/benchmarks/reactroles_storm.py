@@ -0,0 +1,446 @@
+"""
+Reaction storm benchmark for SimpleReactRoles.
+
+Feeds a synthetic stream of raw reaction add/remove events into the cog, against a fake guild, fake members and a
+fake Discord HTTP layer with configurable latency and 429 injection. The stream mixes many members, add/remove
+flapping on the same role and noise from unrelated messages and emojis.
+
+Reports:
+    - event handling cost per event (time spent in on_raw_reaction_add/remove)
+    - end-to-end role apply latency (reaction event -> its tracker item has been applied)
+    - percentage of role events coalesced away by the role tracker
+    - role queue depth over time
+
+Usage:
+    python -m benchmarks.reactroles_storm --members 500 --rate 300 --duration 10
+"""
+import argparse
+import asyncio
+import functools
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+import discord
+
+from . import fakes
+from simplereactroles.memberresolver import MemberResolver
+from simplereactroles.simplereactroles import SimpleReactRoles
+
+EMOJIS = ["\N{RED APPLE}", "\N{GREEN APPLE}", "\N{LEMON}", "\N{GRAPES}", "\N{CHERRIES}", "\N{PEACH}",
+          "\N{PINEAPPLE}", "\N{STRAWBERRY}", "\N{WATERMELON}", "\N{BANANA}", "\N{PEAR}", "\N{TANGERINE}"]
+NOISE_EMOJI = "\N{THUMBS UP SIGN}"
+
+GUILD_ID = 100
+CHANNEL_ID = 200
+MESSAGE_ID = 300
+BOT_USER_ID = 1
+
+
+class FakeDiscordHttp(object):
+    """
+    Fake Discord HTTP layer. Every call waits for the configured latency and may fail with a 429.
+    """
+
+    def __init__(self, latency: float, jitter: float, rate_limit_chance: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_chance = rate_limit_chance
+        self.rng = rng
+
+        self.calls = defaultdict(int)  # type: Dict[str, int]
+        self.rate_limited = 0
+
+    async def request(self, route: str):
+        self.calls[route] += 1
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+
+        if self.rng.random() < self.rate_limit_chance:
+            self.rate_limited += 1
+            raise discord.HTTPException(fakes.FakeResponse(429, "Too Many Requests"), "You are being rate limited.")
+
+
+@functools.total_ordering
+class FakeRole(object):
+
+    def __init__(self, role_id: int, name: str, position: int):
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.managed = False
+
+    def __lt__(self, other: 'FakeRole'):
+        return self.position < other.position
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return self.id
+
+    def __repr__(self):
+        return f"<FakeRole {self.name}>"
+
+
+class FakePermissions(object):
+    manage_roles = True
+
+
+class FakeMember(object):
+
+    def __init__(self, member_id: int, guild: 'FakeGuild', http: FakeDiscordHttp):
+        self.id = member_id
+        self.guild = guild
+        self.http = http
+        self.guild_permissions = FakePermissions()
+        self.top_role = guild.default_role
+
+        self._roles = {guild.default_role}  # type: Set[FakeRole]
+
+    @property
+    def roles(self) -> List[FakeRole]:
+        return sorted(self._roles)
+
+    async def edit(self, roles):
+        await self.http.request("edit_member")
+        self._roles = set(roles) | {self.guild.default_role}
+
+    def __str__(self):
+        return f"member{self.id}#0001"
+
+
+class FakeGuild(object):
+
+    def __init__(self, guild_id: int, http: FakeDiscordHttp):
+        self.id = guild_id
+        self.http = http
+        self.default_role = FakeRole(guild_id, "@everyone", 0)
+        self.roles = [self.default_role]
+        self.emojis = []
+        self.members = {}  # type: Dict[int, FakeMember]
+        self.cached_member_ids = set()  # type: Set[int]
+        self.me = None  # type: Optional[FakeMember]
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id) if user_id in self.cached_member_ids else None
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        for role in self.roles:
+            if role.id == role_id:
+                return role
+        return None
+
+
+class FakeBotHttp(object):
+    """
+    The REST routes of discord.py's HTTPClient the cog calls directly.
+    """
+
+    def __init__(self, http: FakeDiscordHttp, guilds: Dict[int, FakeGuild]):
+        self.http = http
+        self.guilds = guilds
+
+    async def get_member(self, guild_id: int, user_id: int) -> dict:
+        await self.http.request("get_member")
+        if user_id not in self.guilds[guild_id].members:
+            raise discord.NotFound(fakes.FakeResponse(404, "Not Found"), "Unknown Member")
+        return {'user': {'id': str(user_id)}, 'roles': []}
+
+
+class FakeTextChannel(object):
+
+    def __init__(self, channel_id: int, guild: FakeGuild):
+        self.id = channel_id
+        self.guild = guild
+
+
+class FakeReactionEvent(object):
+    """
+    Stand-in for discord.RawReactionActionEvent, with the attributes the cog reads.
+    """
+
+    def __init__(self, message_id: int, channel_id: int, guild_id: int, user_id: int, emoji: str):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.emoji = emoji
+
+
+class BenchMemberResolver(MemberResolver):
+    """
+    MemberResolver which maps fetched member data back to the fake members.
+    """
+
+    @staticmethod
+    def _member_from_data(guild: FakeGuild, data: dict) -> FakeMember:
+        return guild.members[int(data['user']['id'])]
+
+
+class BenchSimpleReactRoles(SimpleReactRoles):
+    """
+    SimpleReactRoles wired to an in-memory Config.
+    """
+
+    bench_config = None  # type: fakes.MemoryConfig
+
+    def _setup_config(self):
+        self._register_config_entities(self.bench_config)
+        return self.bench_config
+
+
+class StormStats(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+        self.events = 0
+        self.role_events = 0
+        self.handle_times = []  # type: List[float]
+        self.apply_latencies = []  # type: List[float]
+        self.items_processed = 0
+        self.depth = []  # type: List[tuple]
+
+        # member id -> perf_counter timestamps of role events not applied yet
+        self.unapplied = defaultdict(list)  # type: Dict[int, List[float]]
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def on_role_event(self, member_id: int, timestamp: float):
+        self.role_events += 1
+        self.unapplied[member_id].append(timestamp)
+
+    def on_item_processed(self, member_id: int, popped_at: float):
+        self.items_processed += 1
+        now = time.perf_counter()
+
+        still_pending = []
+        for timestamp in self.unapplied.get(member_id, []):
+            if timestamp <= popped_at:
+                self.apply_latencies.append(now - timestamp)
+            else:
+                still_pending.append(timestamp)
+        self.unapplied[member_id] = still_pending
+
+
+async def run_storm(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    http = FakeDiscordHttp(latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                           rate_limit_chance=args.rate_limit_chance, rng=rng)
+
+    bot = fakes.FakeBot()
+    guild = FakeGuild(GUILD_ID, http)
+    channel = FakeTextChannel(CHANNEL_ID, guild)
+    bot.guilds.append(guild)
+    bot.channels[CHANNEL_ID] = channel
+    bot.http = FakeBotHttp(http, {GUILD_ID: guild})
+
+    bot_member = FakeMember(BOT_USER_ID, guild, http)
+    guild.me = bot_member
+    guild.members[BOT_USER_ID] = bot_member
+    guild.cached_member_ids.add(BOT_USER_ID)
+
+    roles = []
+    for index in range(args.roles):
+        role = FakeRole(1000 + index, f"role{index}", index + 1)
+        guild.roles.append(role)
+        roles.append(role)
+    bot_member.top_role = FakeRole(999, "bot", len(roles) + 1)
+
+    member_ids = list(range(10000, 10000 + args.members))
+    for member_id in member_ids:
+        guild.members[member_id] = FakeMember(member_id, guild, http)
+        if rng.random() < args.cached_members:
+            guild.cached_member_ids.add(member_id)
+
+    emojis = EMOJIS[:args.roles]
+    config = fakes.MemoryConfig()
+    BenchSimpleReactRoles.bench_config = config
+    config.register_channel(activated={}, groups={})
+    await config.channel(channel).activated.set({
+        str(MESSAGE_ID): {emoji: role.id for emoji, role in zip(emojis, roles)}
+    })
+    if args.group_limit:
+        await config.channel(channel).groups.set({
+            str(MESSAGE_ID): {"bench": {"limit": args.group_limit, "roles": [role.id for role in roles]}}
+        })
+
+    cog = BenchSimpleReactRoles(bot)
+    cog.member_resolver = BenchMemberResolver(bot=bot, logger=cog.logger)
+    bot.add_cog(cog)
+    cog.logger.setLevel(args.log_level)
+    if args.edit_interval is not None:
+        cog.ADD_REMOVE_INTERVAL = args.edit_interval
+    await asyncio.sleep(0)  # let the cache initialize
+
+    stats = StormStats()
+
+    apply_tracker_item = cog._SimpleReactRoles__apply_tracker_item
+
+    async def timed_apply_tracker_item(tracker_key: str, tracker_item: dict):
+        popped_at = time.perf_counter()
+        await apply_tracker_item(tracker_key, tracker_item)
+        if tracker_key not in cog.role_tracker:
+            stats.on_item_processed(tracker_item['member'].id, popped_at)
+
+    cog._SimpleReactRoles__apply_tracker_item = timed_apply_tracker_item
+
+    async def dispatch(handler, payload: FakeReactionEvent):
+        start = time.perf_counter()
+        await handler(payload)
+        stats.handle_times.append(time.perf_counter() - start)
+
+    async def sample_depth():
+        while True:
+            stats.depth.append((stats.elapsed(), (cog.role_queue.qsize(), len(cog.role_tracker),
+                                                  cog.retry_queue.qsize())))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.ensure_future(sample_depth())
+
+    # reacted[member_id] = set of emoji indexes the member currently has reacted with
+    reacted = defaultdict(set)  # type: Dict[int, Set[int]]
+    # expected[member_id] = set of role indexes the member should end up with, after group constraints
+    expected = defaultdict(set)  # type: Dict[int, Set[int]]
+
+    def expect(user_id: int, index: int, add: bool):
+        if not add:
+            expected[user_id].discard(index)
+        elif args.group_limit == 1:
+            expected[user_id] = {index}
+        elif not args.group_limit or len(expected[user_id] | {index}) <= args.group_limit:
+            expected[user_id].add(index)
+    tick = 0.01
+    per_tick = args.rate * tick
+    carry = 0.0
+    deadline = time.perf_counter() + args.duration
+
+    def emit(user_id: int, emoji: str, add: bool, message_id: int = MESSAGE_ID):
+        payload = FakeReactionEvent(message_id, CHANNEL_ID, GUILD_ID, user_id, emoji)
+        handler = cog.on_raw_reaction_add if add else cog.on_raw_reaction_remove
+        stats.events += 1
+        if message_id == MESSAGE_ID and emoji in emojis:
+            stats.on_role_event(user_id, time.perf_counter())
+        asyncio.ensure_future(dispatch(handler, payload))
+
+    while time.perf_counter() < deadline:
+        carry += per_tick
+        while carry >= 1:
+            carry -= 1
+            user_id = rng.choice(member_ids)
+            roll = rng.random()
+
+            if roll < args.noise:
+                # unrelated message, or an emoji that isn't mapped on the activated message
+                if rng.random() < 0.5:
+                    emit(user_id, rng.choice(emojis), True, message_id=MESSAGE_ID + rng.randint(1, 1000))
+                else:
+                    emit(user_id, NOISE_EMOJI, True)
+                continue
+
+            index = rng.randrange(len(emojis))
+            if roll < args.noise + args.flap:
+                # add then immediately remove the same reaction
+                emit(user_id, emojis[index], True)
+                emit(user_id, emojis[index], False)
+                expect(user_id, index, True)
+                expect(user_id, index, False)
+                reacted[user_id].discard(index)
+            elif index in reacted[user_id]:
+                emit(user_id, emojis[index], False)
+                expect(user_id, index, False)
+                reacted[user_id].discard(index)
+            else:
+                emit(user_id, emojis[index], True)
+                expect(user_id, index, True)
+                reacted[user_id].add(index)
+        await asyncio.sleep(tick)
+
+    stream_done = stats.elapsed()
+
+    # drain the pipeline
+    drain_deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < drain_deadline:
+        await asyncio.sleep(0.1)
+        if cog.role_tracker or cog.backoff_keys or len(stats.handle_times) < stats.events:
+            continue
+        try:
+            # the worker marks a queue entry done only after its edit has finished
+            await asyncio.wait_for(cog.role_queue.join(), timeout=0.1)
+        except asyncio.TimeoutError:
+            continue
+        if not cog.role_tracker and not cog.backoff_keys:
+            break
+
+    drained = stats.elapsed()
+    sampler.cancel()
+    bot.remove_cog(cog.__class__.__name__)
+
+    # verify every member ended up with the roles matching their reactions and the group constraint
+    mismatched = 0
+    for member_id in member_ids:
+        expected_roles = {roles[index] for index in expected[member_id]}
+        actual = set(guild.members[member_id].roles) - {guild.default_role}
+        if expected_roles != actual:
+            mismatched += 1
+
+    edits = http.calls["edit_member"] - http.rate_limited
+    coalesced = 1 - (edits / stats.role_events) if stats.role_events else 0.0
+    dead_letters = sum(len(entries) for entries in cog.dead_letters.values())
+
+    print(f"Events:               {stats.events} ({stats.role_events} role events, "
+          f"{stats.events - stats.role_events} noise) over {stream_done:.1f}s")
+    print(f"Event handling cost:  {fakes.summarize(stats.handle_times)}")
+    print(f"Role apply latency:   {fakes.summarize(stats.apply_latencies, scale=1, unit='s')}")
+    print(f"Member edits:         {edits} applied, {http.rate_limited} rate limited, "
+          f"{http.calls['get_member']} member requests")
+    print(f"Coalesced away:       {coalesced * 100:.1f}% of role events did not need their own edit")
+    print(f"Config writes:        {config.writes}")
+    print(f"Dead letters:         {dead_letters}")
+    print(f"Drained after:        {drained - stream_done:.1f}s "
+          f"({'complete' if not cog.role_tracker else 'TIMED OUT'})")
+    print(f"Members with wrong roles: {mismatched} of {len(member_ids)}")
+    print("Queue depth over time (seconds: queued keys / tracker items / in backoff):")
+    for timestamp, (queued, tracked, backoff) in fakes.sample_at(stats.depth, args.depth_interval):
+        print(f"  {timestamp:7.2f}s: {queued:6d} / {tracked:6d} / {backoff:6d}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SimpleReactRoles reaction storm benchmark.")
+    parser.add_argument("--members", type=int, default=200, help="Number of distinct reacting members.")
+    parser.add_argument("--roles", type=int, default=6, choices=range(1, len(EMOJIS) + 1), metavar="N",
+                        help=f"Number of mapped reaction roles (max {len(EMOJIS)}).")
+    parser.add_argument("--rate", type=float, default=100, help="Reaction events per second.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to generate events for.")
+    parser.add_argument("--flap", type=float, default=0.2, help="Fraction of events that are an add+remove pair.")
+    parser.add_argument("--noise", type=float, default=0.2,
+                        help="Fraction of events on unrelated messages or unmapped emojis.")
+    parser.add_argument("--group-limit", type=int, default=0,
+                        help="Put every mapped role in one group with this limit (1 = exclusive, 0 = no group).")
+    parser.add_argument("--cached-members", type=float, default=0.5,
+                        help="Fraction of members present in the guild member cache.")
+    parser.add_argument("--latency", type=float, default=80, help="Mean fake Discord API latency in ms.")
+    parser.add_argument("--jitter", type=float, default=20, help="Standard deviation of the latency in ms.")
+    parser.add_argument("--rate-limit-chance", type=float, default=0.02,
+                        help="Probability that a fake API call fails with a 429.")
+    parser.add_argument("--edit-interval", type=float, default=None,
+                        help="Override SimpleReactRoles.ADD_REMOVE_INTERVAL (seconds between member edits).")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="Max seconds to wait for the queue.")
+    parser.add_argument("--depth-interval", type=float, default=1.0, help="Seconds between printed depth samples.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--log-level", default="CRITICAL", help="Log level of the cog's logger.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run_storm(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Poll cycle benchmark for TwitchLive.
+
+Runs the real TwitchLive cog, including its TwitchApi clients, against the offline Helix simulator in
+benchmarks.helix_sim and fake Discord guilds. Streamers go live and offline while it runs.
+
+Reports:
+    - poll cycle duration (from picking the due batches until the cycle's announcements are sent)
+    - streams API calls per cycle, and 429s
+    - announcement latency (the simulated stream going live -> its announcement being sent)
+    - announcements edited once their stream ended
+    - memory allocated by the cog, and the peak RSS of the process
+
+Usage:
+    python -m benchmarks.twitchlive_poll --subscriptions 10000 --guilds 200 --duration 120
+"""
+import argparse
+import asyncio
+import logging
+import random
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import discord
+
+from . import fakes
+from .helix_sim import HelixSimulator, add_simulator_args
+from twitchlive.twitchlive import TwitchLive
+
+ROLE_ID_OFFSET = 1000000
+CHANNEL_ID_OFFSET = 2000000
+
+
+class FakeRole(object):
+
+    def __init__(self, role_id: int):
+        self.id = role_id
+        self.mention = f"<@&{role_id}>"
+
+
+class FakeMessage(object):
+
+    def __init__(self, message_id: int, channel: 'FakeTextChannel'):
+        self.id = message_id
+        self.channel = channel
+
+    async def edit(self, content: str = None, embed: discord.Embed = None):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.edited += 1
+
+
+class FakeTextChannel(object):
+
+    def __init__(self, channel_id: int, guild: 'FakeGuild', latency: float):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+        self.sent = 0
+        self.edited = 0
+
+    async def send(self, content: str = None, embed: discord.Embed = None) -> FakeMessage:
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return FakeMessage(self.id * 100000 + self.sent, self)
+
+    async def get_message(self, message_id: int) -> FakeMessage:
+        await asyncio.sleep(self.latency)
+        return FakeMessage(message_id, self)
+
+
+class FakeGuild(object):
+
+    def __init__(self, guild_id: int, latency: float):
+        self.id = guild_id
+        self.unavailable = False
+        self.role = FakeRole(ROLE_ID_OFFSET + guild_id)
+        self.channel = FakeTextChannel(CHANNEL_ID_OFFSET + guild_id, self, latency)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.role if role_id == self.role.id else None
+
+    def get_channel(self, channel_id: int) -> Optional[FakeTextChannel]:
+        return self.channel if channel_id == self.channel.id else None
+
+
+class BenchTwitchLive(TwitchLive):
+    """
+    TwitchLive wired to an in-memory Config, which loads its cache once the benchmark has filled the Config.
+    """
+
+    bench_config = None  # type: fakes.MemoryConfig
+    config_ready = None  # type: asyncio.Event
+
+    def _setup_config(self):
+        self._register_config_entities(self.bench_config)
+        return self.bench_config
+
+    async def _init_cache(self):
+        await self.config_ready.wait()
+        await super(BenchTwitchLive, self)._init_cache()
+
+
+class PollStats(object):
+
+    def __init__(self, simulator: HelixSimulator):
+        self.simulator = simulator
+
+        self.cycle_started = None  # type: Optional[float]
+        self.cycle_calls = 0
+        self.cycles = []  # type: List[tuple]
+
+        self.latencies = []  # type: List[float]
+        self.initial_announcements = 0
+        self.announced_streams = set()
+
+    def on_cycle_start(self):
+        self.cycle_started = time.perf_counter()
+        self.cycle_calls = self.simulator.calls['streams']
+
+    def on_cycle_end(self):
+        if self.cycle_started is None:
+            return
+        self.cycles.append((time.perf_counter() - self.cycle_started,
+                            self.simulator.calls['streams'] - self.cycle_calls))
+        self.cycle_started = None
+
+    def on_sent(self, stream_id: str):
+        went_live = self.simulator.went_live.get(stream_id)
+        if went_live is None:
+            self.initial_announcements += 1
+            return
+        self.latencies.append(time.perf_counter() - went_live)
+        self.announced_streams.add(stream_id)
+
+
+async def populate_config(config: fakes.MemoryConfig, args: argparse.Namespace, simulator: HelixSimulator,
+                          guilds: List[FakeGuild], rng: random.Random):
+    credentials = [[f"bench-client-{index}", f"bench-secret-{index}"] for index in range(args.credentials)]
+    await config.twitch_config.set({'credentials': credentials})
+
+    # every streamer is announced in at least one guild, the remaining subscriptions go to random streamers
+    subscriptions = defaultdict(dict)  # type: Dict[int, Dict[str, dict]]
+    pairs = set()
+
+    def subscribe(guild: FakeGuild, streamer):
+        if (guild.id, streamer.user_id) in pairs:
+            return False
+        pairs.add((guild.id, streamer.user_id))
+        subscriptions[guild.id][streamer.user_id] = {
+            'twitch_name': streamer.login.capitalize(),
+            'channel_id': guild.channel.id,
+            'role_id': guild.role.id,
+            'user_login': streamer.login,
+            'user_thumbnail': f"https://static-cdn.example/{streamer.login}-profile.png"
+        }
+        return True
+
+    for index, streamer in enumerate(simulator.streamers):
+        subscribe(guilds[index % len(guilds)], streamer)
+    while len(pairs) < args.subscriptions:
+        subscribe(rng.choice(guilds), rng.choice(simulator.streamers))
+
+    now = time.time()
+    for guild_id, announcements in subscriptions.items():
+        guild_config = config.guild(discord.Object(id=guild_id))
+        await guild_config.announcements.set(announcements)
+
+        # a bot which has been running already announced the streams which are live at the start. Otherwise the
+        # first cycle spends minutes in Discord's rate limits announcing all of them.
+        if not args.cold_start:
+            await guild_config.announced_streams.set({
+                simulator.by_id[user_id].stream_id: now
+                for user_id in announcements if simulator.by_id[user_id].is_live
+            })
+
+    # seed the polling tiers: streamers seen live recently are hot, long dormant ones are cold
+    activity = {}
+    for streamer in simulator.streamers:
+        roll = rng.random()
+        if streamer.is_live or roll < args.hot_fraction:
+            activity[streamer.user_id] = {'last_live': now - 3600, 'hours': {}, 'last_stream': None}
+        elif roll < args.hot_fraction + args.cold_fraction:
+            activity[streamer.user_id] = {'last_live': now - 60 * 24 * 3600, 'hours': {}, 'last_stream': None}
+    await config.streamer_activity.set(activity)
+
+
+async def run_poll(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    streamers = max(1, int(args.subscriptions / args.overlap))
+
+    simulator = HelixSimulator(streamers=streamers, live_fraction=args.live_fraction,
+                               go_live_rate=args.go_live_rate, latency=args.latency / 1000.0,
+                               jitter=args.jitter / 1000.0, rate_limit=args.rate_limit, seed=args.seed,
+                               port=args.port)
+    simulator.patch_twitch_api()
+    await simulator.start()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    bot = fakes.FakeBot()
+    guilds = [FakeGuild(guild_id, args.send_latency / 1000.0) for guild_id in range(1, args.guilds + 1)]
+    guild_map = {guild.id: guild for guild in guilds}
+    bot.guilds.extend(guilds)
+    bot.get_guild = guild_map.get
+    bot.channels.update({guild.channel.id: guild.channel for guild in guilds})
+
+    config = fakes.MemoryConfig()
+    BenchTwitchLive.bench_config = config
+    BenchTwitchLive.config_ready = asyncio.Event()
+
+    cog = BenchTwitchLive(bot)
+    bot.add_cog(cog)
+    cog.logger.setLevel(args.log_level)
+
+    await populate_config(config, args, simulator, guilds, rng)
+    BenchTwitchLive.config_ready.set()
+    while cog.twitch_api is None:
+        await asyncio.sleep(0.01)
+
+    stats = PollStats(simulator)
+    started = time.perf_counter()
+
+    next_batches = cog.poll_scheduler.next_batches
+
+    def timed_next_batches(index, elapsed):
+        stats.on_cycle_start()
+        return next_batches(index, elapsed)
+
+    cog.poll_scheduler.next_batches = timed_next_batches
+
+    announce_streams = cog._TwitchLive__announce_streams
+
+    async def timed_announce_streams(live_streams):
+        sent = await announce_streams(live_streams)
+        stats.on_cycle_end()
+        return sent
+
+    cog._TwitchLive__announce_streams = timed_announce_streams
+
+    send_all = cog.announcer.send_all
+
+    async def recording_send_all(announcements):
+        results = await send_all(announcements)
+        for announcement, result in results.items():
+            if result == cog.announcer.SENT:
+                stats.on_sent(announcement.stream_id)
+        return results
+
+    cog.announcer.send_all = recording_send_all
+
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+
+    if args.tracemalloc:
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, "*twitchlive*")])
+        cog_memory = sum(stat.size for stat in snapshot.statistics('filename'))
+        tracemalloc.stop()
+    else:
+        cog_memory = None
+
+    bot.remove_cog(cog.__class__.__name__)
+    if cog.twitch_api is not None:
+        await cog.twitch_api.close()
+    await simulator.stop()
+
+    went_live = len(simulator.went_live)
+    durations = [duration for duration, _ in stats.cycles]
+    calls = [count for _, count in stats.cycles]
+    tiers = cog.poll_index.tier_sizes()
+
+    print(f"Subscriptions:        {args.subscriptions} ({len(cog.poll_index)} streamers in {args.guilds} guilds, "
+          f"{args.credentials} credential set(s))")
+    print(f"Polling tiers:        hot {tiers.get(0, 0)} / warm {tiers.get(1, 0)} / cold {tiers.get(2, 0)}")
+    print(f"Poll cycles:          {len(stats.cycles)} in {elapsed:.1f}s")
+    print(f"Cycle duration:       {fakes.summarize(durations)}")
+    print(f"Streams calls/cycle:  {fakes.summarize(calls, scale=1, unit='')}")
+    print(f"Helix calls:          {dict(simulator.calls)} | {simulator.rate_limited} rate limited (429)")
+    print(f"Announcement latency: {fakes.summarize(stats.latencies, scale=1, unit='s')}")
+    print(f"Streams gone live:    {went_live}, announced {len(stats.announced_streams)} "
+          f"(+{stats.initial_announcements} announcements of streams live at the start)")
+    print(f"Ended stream edits:   {sum(guild.channel.edited for guild in guilds)} announcements edited, "
+          f"{len(cog.edit_queue)} queued, {len(cog.sessions)} streams still tracked")
+    if cog_memory is not None:
+        print(f"Cog memory:           {cog_memory / 1024 / 1024:.1f} MiB allocated by twitchlive")
+    # ru_maxrss is in KiB on Linux
+    print(f"Peak RSS:             {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="TwitchLive poll cycle benchmark against a simulated Helix API.")
+    parser.add_argument("--subscriptions", type=int, default=10000,
+                        help="Guild announcements to poll for (1k to 50k is the interesting range).")
+    parser.add_argument("--guilds", type=int, default=200, help="Number of guilds.")
+    parser.add_argument("--overlap", type=float, default=1.25,
+                        help="Average number of guilds announcing each streamer.")
+    parser.add_argument("--credentials", type=int, default=1, help="Twitch credential sets to shard across.")
+    parser.add_argument("--hot-fraction", type=float, default=0.05,
+                        help="Fraction of streamers seeded as recently live (hot tier), besides the live ones.")
+    parser.add_argument("--cold-fraction", type=float, default=0.3,
+                        help="Fraction of streamers seeded as dormant (cold tier).")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="Start with nothing announced, so every stream live at the start is announced.")
+    parser.add_argument("--duration", type=float, default=90, help="Seconds to run the cog for.")
+    parser.add_argument("--send-latency", type=float, default=50, help="Fake Discord message send latency in ms.")
+    parser.add_argument("--port", type=int, default=18081, help="Local port for the Helix simulator.")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="Don't trace the cog's memory allocations, which slows it down.")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the cog.")
+    add_simulator_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run_poll(args))
+
+
+if __name__ == "__main__":
+    main()
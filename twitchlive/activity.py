@@ -0,0 +1,94 @@
+import time
+from logging import Logger
+from typing import Dict, Optional
+
+from redbot.core import Config
+
+from .twitchapi.twichobjects import TwitchStream
+
+# polling tiers, most frequently polled first
+TIER_HOT = 0
+TIER_WARM = 1
+TIER_COLD = 2
+# streamers covered by EventSub notifications, only polled as a fallback sweep
+TIER_EVENTSUB = 3
+
+
+class StreamerActivity(object):
+    """
+    Learns when each streamer is active, to decide how often they need to be polled.
+
+    For every streamer it remembers when they were last seen live and how often they went live in each hour of the
+    week, taken from the `started_at` of their streams. A streamer is HOT while live, shortly after streaming, or
+    around the hours they usually go live; WARM if they streamed in the last few weeks; COLD otherwise.
+    """
+
+    RECENT_WINDOW = 3 * 24 * 60 * 60
+    DORMANT_AFTER = 30 * 24 * 60 * 60
+    # go-live starts needed in the surrounding hours of the week for them to count as usual hours
+    USUAL_HOURS_MIN_STARTS = 2
+    HOURS_PER_WEEK = 7 * 24
+
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+
+        self.__streamers = {}  # type: Dict[str, dict]
+
+    async def load(self):
+        self.__streamers = {str(user_id): data for user_id, data in (await self.config.streamer_activity()).items()}
+
+    @classmethod
+    def hour_of_week(cls, timestamp: float) -> int:
+        tm = time.gmtime(timestamp)
+        return tm.tm_wday * 24 + tm.tm_hour
+
+    def tier(self, user_id: str, now: Optional[float] = None) -> int:
+        """
+        :param user_id: Twitch user ID
+        :param now: Epoch time to evaluate the tier at. Defaults to now.
+        :return: Polling tier of the streamer.
+        """
+        now = time.time() if now is None else now
+        data = self.__streamers.get(str(user_id))
+
+        if not data:
+            return TIER_WARM
+
+        since_live = now - data.get('last_live', 0)
+        if since_live <= self.RECENT_WINDOW:
+            return TIER_HOT
+
+        # from the hour before they usually go live, until the hour after
+        hours = data.get('hours', {})
+        current = self.hour_of_week(now)
+        starts = sum(hours.get(str((current + offset) % self.HOURS_PER_WEEK), 0) for offset in (-1, 0, 1))
+        if starts >= self.USUAL_HOURS_MIN_STARTS:
+            return TIER_HOT
+
+        return TIER_WARM if since_live <= self.DORMANT_AFTER else TIER_COLD
+
+    async def observe_live(self, stream: TwitchStream):
+        """
+        Record that a stream was seen live. Each stream's start is counted once, and only then persisted.
+        :param stream: Live TwitchStream
+        :return: None
+        """
+        user_id = str(stream.user_id)
+        data = self.__streamers.setdefault(user_id, {'last_live': 0, 'hours': {}, 'last_stream': None})
+        data['last_live'] = time.time()
+
+        if data.get('last_stream') == stream.id:
+            return
+
+        data['last_stream'] = stream.id
+        # streams without a started_at count at the hour they were first seen
+        started_at = stream.started_at.timestamp() if stream.started_at is not None else time.time()
+        hour = str(self.hour_of_week(started_at))
+        data['hours'][hour] = data['hours'].get(hour, 0) + 1
+
+        await self.config.streamer_activity.set_raw(user_id, value=data)
+
+    async def forget(self, user_id: str):
+        if self.__streamers.pop(str(user_id), None) is not None:
+            await self.config.streamer_activity.clear_raw(str(user_id))
@@ -0,0 +1,186 @@
+import time
+from collections import OrderedDict, Counter, defaultdict
+from logging import Logger
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+from redbot.core import Config
+
+
+class AnnouncedStore(object):
+    """
+    Remembers which streams have already been announced in which guild, so a stream is announced once per guild.
+
+    Entries are keyed by (guild ID, stream ID) and expire once the stream has not been seen live for
+    ENDED_GRACE seconds. A stream keeps its ID for its whole run, so the entries of a stream which is still live
+    never expire, however long it runs. At most MAX_ENTRIES are kept; beyond that the oldest announcements of
+    streams which ended are dropped first. Changes are persisted into the guild's `announced_streams` in
+    batches, with one write per guild, instead of rewriting the whole store.
+    """
+
+    ENDED_GRACE = 15 * 60
+    PRUNE_INTERVAL = 60
+    MAX_ENTRIES = 20000
+
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+
+        self.__entries = OrderedDict()  # type: OrderedDict[Tuple[int, str], float]
+        self.__last_seen = {}  # type: Dict[str, float]
+        self.__guild_counts = Counter()  # type: Counter
+        self.__last_prune = time.time()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    async def load(self):
+        """
+        Load the announced streams of every guild, migrating the legacy `already_announced` lists.
+        :return: None
+        """
+        now = time.time()
+        guilds = await self.config.all_guilds()
+
+        for guild_id, guild_dict in guilds.items():
+            announced = dict(guild_dict.get('announced_streams', {}))
+            legacy = guild_dict.get('already_announced', [])
+
+            if legacy:
+                # the legacy lists don't say which guild announced what. Keep them as announced now, so streams
+                # which are still live aren't announced again; the rest expire after the grace period.
+                for stream_id in legacy:
+                    announced.setdefault(str(stream_id), now)
+                await self.config.guild(discord.Object(id=int(guild_id))).announced_streams.set(announced)
+                await self.config.guild(discord.Object(id=int(guild_id))).already_announced.clear()
+                self.logger.info(f"Migrated {len(legacy)} announced stream IDs for guild {guild_id}.")
+
+            for stream_id, announced_at in announced.items():
+                self.__entries[(int(guild_id), str(stream_id))] = float(announced_at)
+                self.__last_seen[str(stream_id)] = now
+                self.__guild_counts[str(stream_id)] += 1
+
+        # oldest announcements first, so they are evicted first
+        self.__entries = OrderedDict(sorted(self.__entries.items(), key=lambda item: item[1]))
+
+    def contains(self, guild_id: int, stream_id: str) -> bool:
+        return (int(guild_id), str(stream_id)) in self.__entries
+
+    def mark(self, guild_id: int, stream_id: str):
+        """
+        Record a stream as announced in a guild, in memory only. Use `persist` once the announcement was sent,
+        or `unmark` if it should be retried.
+        :param guild_id: ID of the guild the stream is announced in
+        :param stream_id: Twitch stream ID
+        :return: None
+        """
+        now = time.time()
+        key = (int(guild_id), str(stream_id))
+
+        if key not in self.__entries:
+            self.__guild_counts[key[1]] += 1
+        self.__entries[key] = now
+        self.__entries.move_to_end(key)
+        self.__last_seen[key[1]] = now
+
+    def unmark(self, guild_id: int, stream_id: str):
+        """
+        Forget a marked stream which was never persisted, so it is announced again.
+        :return: None
+        """
+        key = (int(guild_id), str(stream_id))
+        if self.__entries.pop(key, None) is not None:
+            self.__release(key)
+
+    async def persist(self, keys: Iterable[Tuple[int, str]]):
+        """
+        Persist marked entries with one Config write per guild, and evict the oldest entries of ended streams if
+        the store is full. Entries of live streams are kept even if that leaves the store above MAX_ENTRIES.
+        :param keys: (guild ID, stream ID) tuples to persist
+        :return: None
+        """
+        by_guild = defaultdict(dict)
+        for guild_id, stream_id in keys:
+            announced_at = self.__entries.get((guild_id, stream_id))
+            if announced_at is not None:
+                by_guild[guild_id][stream_id] = announced_at
+
+        for guild_id, streams in by_guild.items():
+            async with self.config.guild(discord.Object(id=guild_id)).announced_streams() as announced:
+                announced.update(streams)
+
+        excess = len(self.__entries) - self.MAX_ENTRIES
+        if excess <= 0:
+            return
+
+        evicted = []
+        for key in self.__entries:
+            if len(evicted) >= excess:
+                break
+            if self.__is_ended(key[1]):
+                evicted.append(key)
+
+        for key in evicted:
+            del self.__entries[key]
+            self.__release(key)
+        await self.__clear(evicted)
+
+        if len(evicted) < excess:
+            self.logger.warning(f"Announced stream store holds {len(self.__entries)} entries of live streams, "
+                                f"above its limit of {self.MAX_ENTRIES}.")
+
+    def touch(self, stream_id: str):
+        """
+        Mark a stream as still live, keeping its entries from expiring. Not persisted.
+        :param stream_id: Twitch stream ID
+        :return: None
+        """
+        if stream_id in self.__last_seen:
+            self.__last_seen[stream_id] = time.time()
+
+    async def prune(self):
+        """
+        Remove the entries of streams which have ended. Only call this after a poll which
+        saw every tracked user, otherwise streams missing from failed requests would be treated as ended.
+        Runs at most every PRUNE_INTERVAL seconds.
+        :return: None
+        """
+        now = time.time()
+        if now - self.__last_prune < self.PRUNE_INTERVAL:
+            return
+        self.__last_prune = now
+
+        expired = [key for key in self.__entries if self.__is_ended(key[1], now)]
+
+        for key in expired:
+            self.__entries.pop(key, None)
+            self.__release(key)
+        await self.__clear(expired)
+
+        if expired:
+            self.logger.debug(f"Expired {len(expired)} announced stream entries.")
+
+    def __is_ended(self, stream_id: str, now: Optional[float] = None) -> bool:
+        """
+        :return: True if the stream has not been seen live for ENDED_GRACE seconds.
+        """
+        now = time.time() if now is None else now
+        return now - self.__last_seen.get(stream_id, 0.0) > self.ENDED_GRACE
+
+    def __release(self, key: Tuple[int, str]):
+        stream_id = key[1]
+
+        self.__guild_counts[stream_id] -= 1
+        if self.__guild_counts[stream_id] <= 0:
+            del self.__guild_counts[stream_id]
+            self.__last_seen.pop(stream_id, None)
+
+    async def __clear(self, keys: List[Tuple[int, str]]):
+        by_guild = defaultdict(list)
+        for guild_id, stream_id in keys:
+            by_guild[guild_id].append(stream_id)
+
+        for guild_id, stream_ids in by_guild.items():
+            async with self.config.guild(discord.Object(id=guild_id)).announced_streams() as announced:
+                for stream_id in stream_ids:
+                    announced.pop(stream_id, None)
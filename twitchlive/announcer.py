@@ -0,0 +1,88 @@
+import asyncio
+from collections import OrderedDict
+from logging import Logger
+from typing import Dict, List
+
+import discord
+
+from cog_shared.seplib.utils.ratelimit import TokenBucket
+from .models.common_models import StreamAnnouncement
+
+
+class AnnouncementFanout(object):
+    """
+    Sends stream announcements concurrently, within Discord's message rate limits.
+
+    Each channel gets a token bucket matching Discord's per-channel limit, and every send also takes a token from
+    a global bucket. At most MAX_CONCURRENT_SENDS messages are in flight at once. A failed send only affects its
+    own announcement; the result says whether it is worth retrying.
+    """
+
+    MAX_CONCURRENT_SENDS = 10
+
+    # Discord allows 5 messages per 5 seconds in a channel, and about 50 requests per second per bot
+    CHANNEL_RATE = 1.0
+    CHANNEL_BURST = 5
+    GLOBAL_RATE = 40.0
+    GLOBAL_BURST = 40
+
+    # idle channel buckets are dropped once there are more than this many
+    MAX_CHANNEL_BUCKETS = 1000
+
+    SENT = "sent"
+    FAILED_PERMANENT = "failed_permanent"
+    FAILED_TRANSIENT = "failed_transient"
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+
+        self.__semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_SENDS)
+        self.__global_bucket = TokenBucket(rate=self.GLOBAL_RATE, capacity=self.GLOBAL_BURST)
+        self.__channel_buckets = OrderedDict()  # type: OrderedDict[int, TokenBucket]
+
+    def __get_channel_bucket(self, channel_id: int) -> TokenBucket:
+        bucket = self.__channel_buckets.get(channel_id)
+
+        if bucket is None:
+            bucket = self.__channel_buckets[channel_id] = TokenBucket(rate=self.CHANNEL_RATE,
+                                                                      capacity=self.CHANNEL_BURST)
+            if len(self.__channel_buckets) > self.MAX_CHANNEL_BUCKETS:
+                for idle_id in [cid for cid, b in self.__channel_buckets.items() if b.idle and cid != channel_id]:
+                    del self.__channel_buckets[idle_id]
+
+        self.__channel_buckets.move_to_end(channel_id)
+        return bucket
+
+    async def send_all(self, announcements: List[StreamAnnouncement]) -> Dict[StreamAnnouncement, str]:
+        """
+        Send every announcement.
+        :param announcements: List of valid StreamAnnouncement objects
+        :return: dict of announcement -> SENT, FAILED_PERMANENT or FAILED_TRANSIENT
+        """
+        results = await asyncio.gather(*(self.__send(announcement) for announcement in announcements))
+        return dict(zip(announcements, results))
+
+    async def __send(self, announcement: StreamAnnouncement) -> str:
+        # wait for the channel's bucket before taking a send slot, so one busy channel can't hold up the others
+        await self.__get_channel_bucket(announcement.channel.id).acquire()
+
+        async with self.__semaphore:
+            await self.__global_bucket.acquire()
+
+            try:
+                message = await announcement.channel.send(content=announcement.message_content,
+                                                           embed=announcement.embed)
+            except (discord.Forbidden, discord.NotFound) as e:
+                self.logger.error(f"Can't announce streamer {announcement.twitch_name} in channel "
+                                  f"{announcement.channel.id} of guild {announcement.guild.id}: {e}")
+                return self.FAILED_PERMANENT
+            except Exception as e:
+                self.logger.error(f"Error announcing streamer {announcement.twitch_name} in channel "
+                                  f"{announcement.channel.id} of guild {announcement.guild.id}: {e}")
+                return self.FAILED_TRANSIENT
+
+        announcement.message_id = message.id
+        self.logger.info("Announced streamer {}. Guild: {} | Channel: {}".format(
+            announcement.twitch_name, announcement.guild.id, announcement.channel.id
+        ))
+        return self.SENT
@@ -0,0 +1,134 @@
+import asyncio
+from collections import deque, OrderedDict
+from logging import Logger
+from typing import Deque, Optional, Tuple
+
+import discord
+
+from cog_shared.seplib.utils.ratelimit import TokenBucket
+from .models.common_models import StreamAnnouncement
+from .sessions import StreamSession
+
+
+class AnnouncementEditQueue(object):
+    """
+    Edits the announcements of ended streams, one at a time and well within Discord's rate limits.
+
+    Edits are low priority: they share the per-channel message limit with new announcements, so each one waits
+    for a slow channel bucket and a global bucket which leaves most of the bot's budget to everything else.
+    An edit which fails with a transient error is retried at the back of the queue, up to MAX_ATTEMPTS times.
+    """
+
+    # an edit fetches the message and then edits it, so it costs two requests
+    CHANNEL_RATE = 0.5
+    CHANNEL_BURST = 2
+    GLOBAL_RATE = 5.0
+    GLOBAL_BURST = 5
+
+    MAX_ATTEMPTS = 3
+    # the oldest edits are dropped beyond this, eg. after a long outage ended every stream at once
+    MAX_PENDING = 5000
+    # idle channel buckets are dropped once there are more than this many
+    MAX_CHANNEL_BUCKETS = 1000
+
+    EDITED = "edited"
+    GONE = "gone"
+    FAILED = "failed"
+
+    def __init__(self, bot, logger: Logger):
+        self.bot = bot
+        self.logger = logger
+
+        # (session, guild ID, attempt)
+        self.__pending = deque()  # type: Deque[Tuple[StreamSession, int, int]]
+        self.__changed = asyncio.Event()
+        self.__global_bucket = TokenBucket(rate=self.GLOBAL_RATE, capacity=self.GLOBAL_BURST)
+        self.__channel_buckets = OrderedDict()  # type: OrderedDict[int, TokenBucket]
+
+    def __len__(self) -> int:
+        return len(self.__pending)
+
+    def __get_channel_bucket(self, channel_id: int) -> TokenBucket:
+        bucket = self.__channel_buckets.get(channel_id)
+
+        if bucket is None:
+            bucket = self.__channel_buckets[channel_id] = TokenBucket(rate=self.CHANNEL_RATE,
+                                                                      capacity=self.CHANNEL_BURST)
+            if len(self.__channel_buckets) > self.MAX_CHANNEL_BUCKETS:
+                for idle_id in [cid for cid, b in self.__channel_buckets.items() if b.idle and cid != channel_id]:
+                    del self.__channel_buckets[idle_id]
+
+        self.__channel_buckets.move_to_end(channel_id)
+        return bucket
+
+    def put(self, session: StreamSession):
+        """
+        Queue the edits of every announcement of an ended session.
+        :return: None
+        """
+        for guild_id in session.messages:
+            self.__pending.append((session, guild_id, 1))
+        self.__trim()
+
+    def retry(self, session: StreamSession, guild_id: int, attempt: int) -> bool:
+        """
+        Queue a failed edit again, unless it ran out of attempts.
+        :param attempt: The attempt which failed
+        :return: True if the edit was queued again
+        """
+        if attempt >= self.MAX_ATTEMPTS:
+            return False
+        self.__pending.append((session, guild_id, attempt + 1))
+        self.__trim()
+        return True
+
+    def __trim(self):
+        while len(self.__pending) > self.MAX_PENDING:
+            dropped, guild_id, _ = self.__pending.popleft()
+            self.logger.warning(f"Edit queue is full. Not editing the announcement of stream {dropped.stream_id} "
+                                f"in guild {guild_id}.")
+        self.__changed.set()
+
+    async def get(self, timeout: float) -> Optional[Tuple[StreamSession, int, int]]:
+        """
+        Wait for the next edit.
+        :param timeout: Seconds to wait at most
+        :return: (session, guild ID, attempt), or None if nothing was queued in time.
+        """
+        if not self.__pending:
+            self.__changed.clear()
+            try:
+                await asyncio.wait_for(self.__changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.__pending.popleft()
+
+    async def edit(self, session: StreamSession, guild_id: int) -> str:
+        """
+        Edit a guild's announcement of an ended session into its summary.
+        :return: EDITED, GONE if the message or channel is gone, or FAILED if it is worth retrying.
+        """
+        channel_id, message_id = session.messages[guild_id]
+
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return self.GONE
+
+        await self.__get_channel_bucket(channel_id).acquire()
+        await self.__global_bucket.acquire()
+
+        try:
+            message = await channel.get_message(message_id)
+            await message.edit(content=StreamAnnouncement.ended_message_content(session.twitch_name,
+                                                                                 session.stream_url),
+                               embed=StreamAnnouncement.render_ended_embed(
+                                   twitch_name=session.twitch_name, stream_title=session.stream_title,
+                                   stream_url=session.stream_url, user_thumbnail=session.user_thumbnail,
+                                   duration=session.duration))
+        except (discord.Forbidden, discord.NotFound):
+            return self.GONE
+        except Exception as e:
+            self.logger.error(f"Error editing the announcement of stream {session.stream_id} in guild {guild_id}: {e}")
+            return self.FAILED
+
+        return self.EDITED
@@ -0,0 +1,146 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+from collections import OrderedDict
+from logging import Logger
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+
+
+class EventSubReceiver(object):
+    """
+    Embedded aiohttp web server which receives Twitch EventSub webhook notifications.
+
+    Every message is verified against the HMAC-SHA256 signature Twitch computes with the subscription secret.
+    Stale messages and duplicate deliveries are dropped. Verification challenges are answered directly;
+    notifications and revocations are passed on to the handler in the background, so Twitch gets its
+    response right away.
+    """
+
+    MESSAGE_ID_HEADER = "Twitch-Eventsub-Message-Id"
+    TIMESTAMP_HEADER = "Twitch-Eventsub-Message-Timestamp"
+    SIGNATURE_HEADER = "Twitch-Eventsub-Message-Signature"
+    MESSAGE_TYPE_HEADER = "Twitch-Eventsub-Message-Type"
+
+    TYPE_VERIFICATION = "webhook_callback_verification"
+    TYPE_NOTIFICATION = "notification"
+    TYPE_REVOCATION = "revocation"
+
+    # messages older than this are rejected as possible replays
+    MAX_MESSAGE_AGE = 10 * 60
+    SEEN_MESSAGE_LIMIT = 1000
+
+    def __init__(self, secret: str, handler: Callable[[str, dict, dict], Awaitable], logger: Logger,
+                 host: str = "0.0.0.0", port: int = 8080, path: str = "/eventsub"):
+        """
+        :param secret: Secret the subscriptions were created with.
+        :param handler: Coroutine function called with (message type, subscription, event) for every
+                        notification and revocation.
+        :param logger: Logger of the cog.
+        :param host: Interface to listen on.
+        :param port: Port to listen on.
+        :param path: Path the callback URL points to.
+        """
+        self.secret = secret
+        self.handler = handler
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.path = path
+
+        self.__seen_message_ids = OrderedDict()  # type: OrderedDict[str, None]
+        self.__runner = None  # type: Optional[web.AppRunner]
+
+    @staticmethod
+    def sign(secret: str, message_id: str, timestamp: str, body: bytes) -> str:
+        """
+        Compute the signature Twitch sends in the signature header.
+        :return: Signature in the form `sha256=<hex digest>`
+        """
+        message = message_id.encode() + timestamp.encode() + body
+        return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+    @property
+    def is_running(self) -> bool:
+        return self.__runner is not None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.__handle)
+
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, self.host, self.port).start()
+        self.logger.info(f"EventSub receiver listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+    @staticmethod
+    def __parse_timestamp(timestamp: str) -> datetime.datetime:
+        # Twitch sends RFC3339 timestamps with nanoseconds, which strptime can't parse
+        return datetime.datetime.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S")
+
+    def __is_duplicate(self, message_id: str) -> bool:
+        if message_id in self.__seen_message_ids:
+            return True
+
+        self.__seen_message_ids[message_id] = None
+        while len(self.__seen_message_ids) > self.SEEN_MESSAGE_LIMIT:
+            self.__seen_message_ids.popitem(last=False)
+        return False
+
+    async def __handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        message_id = request.headers.get(self.MESSAGE_ID_HEADER, "")
+        timestamp = request.headers.get(self.TIMESTAMP_HEADER, "")
+        signature = request.headers.get(self.SIGNATURE_HEADER, "")
+        message_type = request.headers.get(self.MESSAGE_TYPE_HEADER, "")
+
+        expected = self.sign(self.secret, message_id, timestamp, body)
+        if not message_id or not hmac.compare_digest(expected, signature):
+            self.logger.warning(f"Rejected EventSub message with an invalid signature. Id: {message_id}")
+            return web.Response(status=403)
+
+        try:
+            age = (datetime.datetime.utcnow() - self.__parse_timestamp(timestamp)).total_seconds()
+        except ValueError:
+            return web.Response(status=400)
+
+        if age > self.MAX_MESSAGE_AGE:
+            self.logger.warning(f"Rejected stale EventSub message. Id: {message_id} | Timestamp: {timestamp}")
+            return web.Response(status=403)
+
+        if self.__is_duplicate(message_id):
+            return web.Response(status=204)
+
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return web.Response(status=400)
+
+        subscription = payload.get('subscription', {})
+
+        if message_type == self.TYPE_VERIFICATION:
+            self.logger.info(f"Verified EventSub subscription {subscription.get('type')} "
+                             f"for {subscription.get('condition')}")
+            return web.Response(status=200, text=payload.get('challenge', ""), content_type="text/plain")
+
+        if message_type in (self.TYPE_NOTIFICATION, self.TYPE_REVOCATION):
+            asyncio.ensure_future(self.__dispatch(message_type, subscription, payload.get('event', {})))
+            return web.Response(status=204)
+
+        return web.Response(status=400)
+
+    async def __dispatch(self, message_type: str, subscription: dict, event: dict):
+        try:
+            await self.handler(message_type, subscription, event)
+        except Exception as e:
+            self.logger.error(f"Error handling EventSub {message_type} {subscription.get('type')}: {e}",
+                              exc_info=True)
@@ -0,0 +1,77 @@
+import asyncio
+from logging import Logger
+from typing import Dict, Iterable, Set, Tuple
+
+from ..twitchapi.twichobjects import EventSubSubscription
+from ..twitchapi.twitchapi import TwitchApi
+
+
+class EventSubSubscriptionManager(object):
+    """
+    Keeps the application's EventSub subscriptions in line with the streamers the cog announces.
+    Only subscriptions which deliver to this cog's callback URL are touched.
+    """
+
+    SUBSCRIPTION_TYPES = ("stream.online", "stream.offline")
+
+    def __init__(self, twitch_api: TwitchApi, callback_url: str, secret: str, logger: Logger):
+        self.twitch_api = twitch_api
+        self.callback_url = callback_url
+        self.secret = secret
+        self.logger = logger
+
+        self.subscribed_user_ids = set()  # type: Set[str]
+
+    async def reconcile(self, user_ids: Iterable[str]) -> Tuple[int, int]:
+        """
+        Create the missing subscriptions for the given broadcasters and delete every other subscription
+        to the callback URL, including failed or revoked ones.
+        :param user_ids: Twitch user IDs which should be subscribed.
+        :return: Tuple of (subscriptions created, subscriptions deleted)
+        """
+        wanted = {(sub_type, str(user_id)) for user_id in user_ids for sub_type in self.SUBSCRIPTION_TYPES}
+
+        existing = {}  # type: Dict[Tuple[str, str], EventSubSubscription]
+        stale = []
+
+        for subscription in await self.twitch_api.get_eventsub_subscriptions():
+            if subscription.callback != self.callback_url:
+                continue
+
+            key = (subscription.type, subscription.broadcaster_user_id)
+            if subscription.is_active and key in wanted and key not in existing:
+                existing[key] = subscription
+            else:
+                stale.append(subscription)
+
+        to_create = list(wanted - set(existing))
+
+        create_results = await asyncio.gather(*(
+            self.twitch_api.create_eventsub_subscription(sub_type=sub_type, user_id=user_id,
+                                                         callback=self.callback_url, secret=self.secret)
+            for sub_type, user_id in to_create
+        ), return_exceptions=True)
+        delete_results = await asyncio.gather(*(
+            self.twitch_api.delete_eventsub_subscription(subscription.id) for subscription in stale
+        ), return_exceptions=True)
+
+        subscribed = set(existing)
+        for key, result in zip(to_create, create_results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Could not subscribe to {key[0]} for {key[1]}: {result}")
+            else:
+                subscribed.add(key)
+
+        for result in delete_results:
+            if isinstance(result, Exception):
+                self.logger.error(f"Could not delete EventSub subscription: {result}")
+
+        # a streamer only counts as covered when both online and offline events will be delivered
+        self.subscribed_user_ids = {
+            user_id for _, user_id in subscribed
+            if all((sub_type, user_id) in subscribed for sub_type in self.SUBSCRIPTION_TYPES)
+        }
+
+        created_count = sum(1 for result in create_results if not isinstance(result, Exception))
+        deleted_count = sum(1 for result in delete_results if not isinstance(result, Exception))
+        return created_count, deleted_count
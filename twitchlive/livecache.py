@@ -0,0 +1,73 @@
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .twitchapi.twichobjects import TwitchStream
+
+
+class LiveStreamCache(object):
+    """
+    The latest live TwitchStream of every tracked streamer, as seen by the poll cycles and EventSub lookups.
+
+    A successful poll of a batch replaces the snapshots of the batch's user IDs: the ones in the response are
+    live, the rest went offline. Failed batches leave their snapshots as they were, so a Twitch outage does not
+    make every streamer look offline. Reading the cache never calls the API.
+    """
+
+    def __init__(self):
+        self.__streams = {}  # type: Dict[str, TwitchStream]
+        self.__updated_at = {}  # type: Dict[str, float]
+
+    def __len__(self) -> int:
+        return len(self.__streams)
+
+    def update_batch(self, user_ids: Sequence[str], streams: Iterable[TwitchStream]):
+        """
+        Replace the snapshots of a polled batch.
+        :param user_ids: User IDs which were polled
+        :param streams: Streams the poll returned for them
+        :return: None
+        """
+        now = time.time()
+        for user_id in user_ids:
+            self.__streams.pop(str(user_id), None)
+            self.__updated_at[str(user_id)] = now
+        self.observe(streams, now)
+
+    def observe(self, streams: Iterable[TwitchStream], now: Optional[float] = None):
+        """
+        Store live streams seen outside of a poll, eg. looked up for an EventSub notification.
+        :param streams: TwitchStream objects
+        :param now: Time they were seen
+        :return: None
+        """
+        now = time.time() if now is None else now
+        for stream in streams:
+            if stream.is_live:
+                self.__streams[str(stream.user_id)] = stream
+                self.__updated_at[str(stream.user_id)] = now
+
+    def discard(self, user_id: str):
+        """
+        Forget a streamer, eg. once they went offline or are no longer announced anywhere.
+        :param user_id: Twitch user ID
+        :return: None
+        """
+        self.__streams.pop(str(user_id), None)
+        self.__updated_at.pop(str(user_id), None)
+
+    def get(self, user_id: str) -> Optional[TwitchStream]:
+        return self.__streams.get(str(user_id))
+
+    def updated_at(self, user_id: str) -> Optional[float]:
+        """
+        :return: Time the streamer's status was last seen, or None if they have not been polled yet.
+        """
+        return self.__updated_at.get(str(user_id))
+
+    def live(self, user_ids: Iterable[str]) -> List[TwitchStream]:
+        """
+        :param user_ids: Twitch user IDs
+        :return: The live streams among the user IDs, most viewers first.
+        """
+        streams = [self.__streams[user_id] for user_id in map(str, user_ids) if user_id in self.__streams]
+        return sorted(streams, key=lambda stream: stream.viewer_count or 0, reverse=True)
@@ -0,0 +1,175 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cog_shared.seplib.utils.metrics import RollingCounter, RollingHistogram, PrometheusWriter, \
+    DEFAULT_LATENCY_BOUNDS
+from .twitchapi.metrics import TwitchApiMetrics
+from .twitchapi.twitchapi import TwitchApi
+
+CYCLE_REQUEST_BOUNDS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+ANNOUNCE_DELAY_BOUNDS = (5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class PollMetrics(object):
+    """
+    Operational metrics of the stream monitor: per poll cycle, rolling over the last few minutes, and of the
+    Helix requests made by each TwitchApi client.
+    """
+
+    PROMETHEUS_PREFIX = "twitchlive"
+
+    COUNTERS = {
+        'cycles': "Poll cycles run.",
+        'batches': "Batches of user IDs requested from the streams endpoint.",
+        'failed_batches': "Batches which could not be polled.",
+        'live_streams': "Live streams seen by polls and EventSub lookups.",
+        'announcements': "Stream announcements sent.",
+        'announcement_failures': "Stream announcements which could not be sent.",
+        'announcement_edits': "Announcements edited into a summary after their stream ended.",
+    }
+
+    HISTOGRAMS = {
+        'cycle_duration_seconds': ("Seconds from the start of a poll cycle until its announcements were sent.",
+                                   DEFAULT_LATENCY_BOUNDS),
+        'cycle_requests': ("Helix requests made by a poll cycle, including retries.", CYCLE_REQUEST_BOUNDS),
+        'announce_delay_seconds': ("Seconds from a stream's started_at until its announcement was sent.",
+                                   ANNOUNCE_DELAY_BOUNDS),
+    }
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, RollingCounter())
+        for name, (_, bounds) in self.HISTOGRAMS.items():
+            setattr(self, name, RollingHistogram(bounds=bounds))
+
+        self.last_cycle = {}  # type: Dict[str, float]
+
+    def observe_cycle(self, duration: float, batches: int, failed_batches: int, requests: int, live: int,
+                      announced: int):
+        """
+        Record a finished poll cycle.
+        :param duration: Seconds the cycle took
+        :param batches: Batches requested
+        :param failed_batches: Batches which failed
+        :param requests: Helix requests made during the cycle, across every client
+        :param live: Live streams found
+        :param announced: Announcements sent
+        :return: None
+        """
+        self.cycles.add()
+        self.batches.add(batches)
+        self.failed_batches.add(failed_batches)
+        self.cycle_duration_seconds.observe(duration)
+        self.cycle_requests.observe(requests)
+
+        self.last_cycle = {
+            'finished_at': time.time(),
+            'duration': duration,
+            'batches': batches,
+            'failed_batches': failed_batches,
+            'requests': requests,
+            'live': live,
+            'announced': announced,
+        }
+
+    @staticmethod
+    def __histogram_export(histogram: RollingHistogram) -> dict:
+        return {
+            'count': histogram.count,
+            'sum': histogram.sum,
+            'p50': histogram.percentile(50),
+            'p95': histogram.percentile(95),
+            'p99': histogram.percentile(99),
+        }
+
+    @staticmethod
+    def client_gauges(client: TwitchApi) -> Dict[str, Tuple[str, float]]:
+        """
+        :return: dict of gauge name -> (help text, value) of a client's rate limit and circuit breaker.
+        """
+        limiter = client.rate_limiter
+        return {
+            'ratelimit_limit': ("Helix points per minute granted to the client.", limiter.limit),
+            'ratelimit_remaining': ("Helix points the client has left.", max(limiter.tokens, 0.0)),
+            'ratelimit_used_ratio': ("Share of the client's Helix points in use.",
+                                     1 - max(limiter.tokens, 0.0) / limiter.limit if limiter.limit else 0.0),
+            'circuit_open': ("1 if the client's circuit breaker is not closed.",
+                             0 if client.circuit_breaker.state == client.circuit_breaker.CLOSED else 1),
+        }
+
+    def export(self, gauges: Dict[str, Tuple[str, float]], clients: List[TwitchApi]) -> dict:
+        """
+        Structured snapshot of every metric, suitable for JSON serialization.
+        :param gauges: dict of gauge name -> (help text, value) of point in time values, eg. streamers polled.
+        :param clients: TwitchApi clients to include the request metrics of.
+        :return: dict of the gauges, the last cycle, the monitor's metrics and per client metrics.
+        """
+        monitor = {}
+        for name in self.COUNTERS:
+            counter = getattr(self, name)  # type: RollingCounter
+            monitor[name] = {'total': counter.total, 'recent': counter.recent(), 'window': counter.window}
+        for name in self.HISTOGRAMS:
+            monitor[name] = self.__histogram_export(getattr(self, name))
+
+        client_exports = {}
+        for client in clients:
+            client_export = {name: value for name, (_, value) in self.client_gauges(client).items()}
+            for name in TwitchApiMetrics.COUNTERS:
+                counter = getattr(client.metrics, name)  # type: RollingCounter
+                client_export[name] = {'total': counter.total, 'recent': counter.recent(), 'window': counter.window}
+            for name in TwitchApiMetrics.HISTOGRAMS:
+                client_export[name] = self.__histogram_export(getattr(client.metrics, name))
+            client_exports[client.client_id] = client_export
+
+        return {
+            'gauges': {name: value for name, (_, value) in gauges.items()},
+            'last_cycle': self.last_cycle,
+            'monitor': monitor,
+            'clients': client_exports,
+        }
+
+    def render_prometheus(self, gauges: Dict[str, Tuple[str, float]], clients: List[TwitchApi]) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        :param gauges: dict of gauge name -> (help text, value)
+        :param clients: TwitchApi clients to include the request metrics of.
+        :return: Prometheus text document.
+        """
+        writer = PrometheusWriter()
+        prefix = self.PROMETHEUS_PREFIX
+
+        for name, (help_text, value) in gauges.items():
+            writer.gauge(f"{prefix}_{name}", help_text, value)
+
+        for name, help_text in self.COUNTERS.items():
+            writer.counter(f"{prefix}_{name}_total", help_text, getattr(self, name).total)
+
+        for name, (help_text, _) in self.HISTOGRAMS.items():
+            writer.histogram(f"{prefix}_{name}", help_text, getattr(self, name))
+
+        # every sample of a metric has to be written together, so iterate the clients within each metric
+        client_gauges = [(client, self.client_gauges(client)) for client in clients]
+        for name in (client_gauges[0][1] if client_gauges else {}):
+            for client, values in client_gauges:
+                help_text, value = values[name]
+                writer.gauge(f"{prefix}_helix_{name}", help_text, value, labels={'client': client.client_id})
+
+        for name, help_text in TwitchApiMetrics.COUNTERS.items():
+            for client in clients:
+                writer.counter(f"{prefix}_helix_{name}_total", help_text, getattr(client.metrics, name).total,
+                               labels={'client': client.client_id})
+
+        for name, help_text in TwitchApiMetrics.HISTOGRAMS.items():
+            for client in clients:
+                writer.histogram(f"{prefix}_helix_{name}_seconds", help_text, getattr(client.metrics, name),
+                                 labels={'client': client.client_id})
+
+        return writer.render()
+
+    @staticmethod
+    def format_seconds(seconds: Optional[float], histogram: RollingHistogram) -> str:
+        if seconds is None:
+            return "n/a"
+        if seconds == float('inf'):
+            return f"> {histogram.bounds[-1]:g}s"
+        return f"<= {seconds * 1000:g}ms" if seconds < 1 else f"<= {seconds:g}s"
@@ -1,16 +1,26 @@
-from typing import Tuple, Optional
+from typing import Optional
 
 import discord
-from redbot.core.bot import Red
 
+from ..targets import AnnouncementTarget
 
-class StreamAnnouncement(object):
+TWITCH_LOGO_URL = "https://i.imgur.com/csGI2jA.png"
+ENDED_EMBED_COLOR = 0x808080
 
-    def __init__(self, bot: Red, guild_id: int, role_id: int, channel_id: int, twitch_name: str, stream_title: str,
-                 stream_url: str, stream_id: str, user_login: str, user_thumbnail: str, stream_thumbnail: str):
 
-        self.bot = bot
+class StreamAnnouncement(object):
 
+    def __init__(self, target: Optional[AnnouncementTarget], guild_id: int, role_id: int, channel_id: int,
+                 twitch_name: str, stream_title: str, stream_url: str, stream_id: str, user_login: str,
+                 user_thumbnail: str, stream_thumbnail: str, embed: Optional[discord.Embed] = None,
+                 game_name: Optional[str] = None, game_box_art: Optional[str] = None):
+        """
+        :param target: Resolved guild, role and channel, or None if they do not exist. See AnnouncementTargets.
+        :param game_name: Name of the stream's game or category, if known.
+        :param game_box_art: Box art URL of the game, if known.
+        :param embed: Pre-rendered embed to share with the other announcements of the stream. Rendered on first
+                      access if not given.
+        """
         self.guild_id = int(guild_id) if guild_id is not None else 0
         self.role_id = int(role_id) if role_id is not None else 0
         self.channel_id = int(channel_id) if channel_id is not None else 0
@@ -21,45 +31,73 @@ class StreamAnnouncement(object):
         self.stream_id = str(stream_id)
         self.user_thumbnail = str(user_thumbnail) if user_thumbnail is not None else ""
         self.stream_thumbnail_f = str(stream_thumbnail) if stream_thumbnail is not None else ""
+        self.game_name = game_name
+        self.game_box_art = game_box_art
 
-        valid, guild, role, channel = self.__validate_announcement()
+        self.is_valid = target is not None
+        self.guild = target.guild if target is not None else None
+        self.role = target.role if target is not None else None
+        self.channel = target.channel if target is not None else None
 
-        self.is_valid = valid
-        self.guild = guild
-        self.role = role
-        self.channel = channel
+        self.__embed = embed
+        # set once the announcement was sent
+        self.message_id = None  # type: Optional[int]
 
-        self.__twitch_logo_url = "https://i.imgur.com/csGI2jA.png"
+    def get_stream_thumbnail(self, width=512, height=288):
+        return self.stream_thumbnail_f.format(width=width, height=height)
 
-    def __validate_announcement(self) -> Tuple[bool, Optional[discord.Guild], Optional[discord.Role],
-                                               Optional[discord.TextChannel]]:
-        guild = discord.utils.get(self.bot.guilds, id=self.guild_id)
-        if guild is None:
-            return False, None, None, None
+    @staticmethod
+    def render_embed(twitch_name: str, stream_title: str, stream_url: str, user_thumbnail: str,
+                     stream_thumbnail: str, game_name: Optional[str] = None,
+                     game_box_art: Optional[str] = None) -> discord.Embed:
+        """
+        Render the embed of a stream announcement. Embeds are only read when sending, so one can be shared by
+        every announcement of the stream.
+        """
+        embed = discord.Embed(title=stream_title, description=f"Watch now: {stream_url}", color=0x00ff00)
+
+        embed.set_thumbnail(url=game_box_art or TWITCH_LOGO_URL)
+        embed.set_author(name=twitch_name, url=stream_url, icon_url=user_thumbnail)
+        embed.set_image(url=stream_thumbnail)
+        if game_name:
+            embed.add_field(name="Playing", value=game_name)
 
-        role = discord.utils.get(guild.roles, id=self.role_id)
-        if role is None:
-            return False, guild, None, None
+        return embed
 
-        channel = self.bot.get_channel(id=self.channel_id)
-        if channel is None:
-            return False, guild, role, None
+    @staticmethod
+    def format_duration(seconds: float) -> str:
+        minutes = int(seconds // 60)
+        return f"{minutes // 60}h {minutes % 60:02d}m"
+
+    @classmethod
+    def render_ended_embed(cls, twitch_name: str, stream_title: str, stream_url: str, user_thumbnail: str,
+                           duration: Optional[float]) -> discord.Embed:
+        """
+        Render the summary an announcement is edited into once its stream ended.
+        :param duration: Seconds the stream lasted, or None if unknown.
+        """
+        summary = "Stream ended." if duration is None else \
+            f"Stream ended. Streamed for {cls.format_duration(duration)}."
+        embed = discord.Embed(title=stream_title, description=f"{summary}\n{stream_url}", color=ENDED_EMBED_COLOR)
+
+        embed.set_thumbnail(url=TWITCH_LOGO_URL)
+        embed.set_author(name=twitch_name, url=stream_url, icon_url=user_thumbnail or discord.Embed.Empty)
 
-        return True, guild, role, channel
+        return embed
 
-    def get_stream_thumbnail(self, width=512, height=288):
-        return self.stream_thumbnail_f.format(width=width, height=height)
+    @staticmethod
+    def ended_message_content(twitch_name: str, stream_url: str) -> str:
+        name = str(twitch_name).replace("_", "\\_")
+        return f"{name} was live: {stream_url}"
 
     @property
     def embed(self) -> discord.Embed:
-
-        embed = discord.Embed(title=self.stream_title, description=f"Watch now: {self.stream_url}", color=0x00ff00)
-
-        embed.set_thumbnail(url=self.__twitch_logo_url)
-        embed.set_author(name=self.twitch_name, url=self.stream_url, icon_url=self.user_thumbnail)
-        embed.set_image(url=self.get_stream_thumbnail())
-
-        return embed
+        if self.__embed is None:
+            self.__embed = self.render_embed(twitch_name=self.twitch_name, stream_title=self.stream_title,
+                                             stream_url=self.stream_url, user_thumbnail=self.user_thumbnail,
+                                             stream_thumbnail=self.get_stream_thumbnail(),
+                                             game_name=self.game_name, game_box_art=self.game_box_art)
+        return self.__embed
 
     @property
     def message_content(self):
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Set, Tuple
+
+from .activity import TIER_WARM
+
+
+class PollIndex(object):
+    """
+    Inverted index of Twitch user IDs to the guild announcements subscribed to them, with the user IDs
+    pre-split into the batches the streams endpoint accepts. Each polling tier has its own batches.
+
+    The index is updated as announcements are added and removed, so a poll cycle only reads it. Batches are
+    immutable tuples which are replaced when they change, so a poll which is still using them is unaffected.
+    """
+
+    BATCH_SIZE = 100
+
+    def __init__(self):
+        self.__subscriptions = {}  # type: Dict[str, Dict[int, Dict[str, Any]]]
+        self.__batches = defaultdict(list)  # type: Dict[int, List[Tuple[str, ...]]]
+        self.__batch_of = {}  # type: Dict[str, Tuple[int, int]]
+
+    def __len__(self) -> int:
+        return len(self.__subscriptions)
+
+    @property
+    def batches(self) -> Tuple[Tuple[str, ...], ...]:
+        """
+        :return: The user IDs to poll across every tier, in batches of at most BATCH_SIZE.
+        """
+        return tuple(batch for tier in sorted(self.__batches) for batch in self.__batches[tier])
+
+    def tier_batches(self, tier: int) -> Tuple[Tuple[str, ...], ...]:
+        """
+        :return: The user IDs to poll in a tier, in batches of at most BATCH_SIZE.
+        """
+        return tuple(self.__batches.get(tier, ()))
+
+    def tier_of(self, user_id: str) -> int:
+        return self.__batch_of[str(user_id)][0]
+
+    def tier_sizes(self) -> Dict[int, int]:
+        """
+        :return: dict of tier -> number of user IDs in it.
+        """
+        return {tier: sum(len(batch) for batch in batches) for tier, batches in self.__batches.items()}
+
+    def set_tier(self, user_id: str, tier: int):
+        """
+        Move a user ID to another polling tier.
+        :param user_id: Twitch user ID, which must be in the index.
+        :param tier: Polling tier
+        :return: None
+        """
+        user_id = str(user_id)
+        if self.__batch_of[user_id][0] != tier:
+            self.__remove_from_batch(user_id)
+            self.__add_to_batch(user_id, tier)
+
+    @property
+    def user_ids(self) -> Set[str]:
+        """
+        :return: Every Twitch user ID announced by at least one guild.
+        """
+        return set(self.__subscriptions)
+
+    def subscriptions(self, user_id: str) -> Dict[int, Dict[str, Any]]:
+        """
+        :param user_id: Twitch user ID
+        :return: dict of guild ID -> announcement metadata for the user. Owned by the index; do not mutate.
+        """
+        return self.__subscriptions.get(user_id, {})
+
+    def rebuild(self, announce_cache: Dict[int, Dict[str, Dict[str, Any]]]):
+        """
+        Replace the index with the announcements of every guild.
+        :param announce_cache: dict of guild ID -> Twitch user ID -> announcement metadata
+        :return: None
+        """
+        self.__subscriptions = {}
+        self.__batches = defaultdict(list)
+        self.__batch_of = {}
+
+        for guild_id, announcements in announce_cache.items():
+            for user_id, metadata in announcements.items():
+                self.add(guild_id, user_id, metadata)
+
+    def add(self, guild_id: int, user_id: str, metadata: Dict[str, Any], tier: int = TIER_WARM):
+        """
+        Add or replace the announcement of a guild for a Twitch user.
+        :param guild_id: ID of the guild
+        :param user_id: Twitch user ID
+        :param metadata: Announcement metadata, as stored in the announce cache.
+        :param tier: Polling tier, if the user is new to the index.
+        :return: None
+        """
+        user_id = str(user_id)
+        subscriptions = self.__subscriptions.get(user_id)
+
+        if subscriptions is None:
+            subscriptions = self.__subscriptions[user_id] = {}
+            self.__add_to_batch(user_id, tier)
+
+        subscriptions[int(guild_id)] = metadata
+
+    def remove(self, guild_id: int, user_id: str):
+        """
+        Remove the announcement of a guild for a Twitch user. The user is no longer polled once no guild
+        announces them.
+        :param guild_id: ID of the guild
+        :param user_id: Twitch user ID
+        :return: None
+        """
+        user_id = str(user_id)
+        subscriptions = self.__subscriptions.get(user_id)
+
+        if subscriptions is None:
+            return
+
+        subscriptions.pop(int(guild_id), None)
+
+        if not subscriptions:
+            self.__subscriptions.pop(user_id)
+            self.__remove_from_batch(user_id)
+
+    def __add_to_batch(self, user_id: str, tier: int):
+        batches = self.__batches[tier]
+        if batches and len(batches[-1]) < self.BATCH_SIZE:
+            batches[-1] = batches[-1] + (user_id,)
+        else:
+            batches.append((user_id,))
+        self.__batch_of[user_id] = (tier, len(batches) - 1)
+
+    def __remove_from_batch(self, user_id: str):
+        tier, index = self.__batch_of.pop(user_id)
+        batches = self.__batches[tier]
+        last_index = len(batches) - 1
+        last_batch = batches[last_index]
+
+        # fill the gap with the last user ID of the last batch, so that only the last batch can be partial
+        if index == last_index:
+            batches[index] = tuple(uid for uid in last_batch if uid != user_id)
+        else:
+            moved = last_batch[-1]
+            batches[last_index] = last_batch[:-1]
+            batches[index] = tuple(moved if uid == user_id else uid for uid in batches[index])
+            self.__batch_of[moved] = (tier, index)
+
+        if not batches[last_index]:
+            batches.pop()
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from .activity import TIER_HOT, TIER_WARM, TIER_COLD, TIER_EVENTSUB
+from .pollindex import PollIndex
+
+
+class TieredPollScheduler(object):
+    """
+    Decides which batches of the poll index to request in a poll cycle.
+
+    Each tier is swept once per its interval. Rather than polling a whole tier at once when it falls due,
+    every cycle polls the next slice of its batches, so the API calls of the slow tiers are spread evenly.
+    User IDs which were due but could not be requested are deferred to the front of the next cycle.
+    """
+
+    TIER_INTERVALS = {
+        TIER_HOT: 5,
+        TIER_WARM: 60,
+        TIER_COLD: 600,
+        TIER_EVENTSUB: 300,
+    }
+
+    def __init__(self, intervals: Dict[int, float] = None):
+        self.intervals = dict(intervals or self.TIER_INTERVALS)
+
+        self.__cursors = defaultdict(int)  # type: Dict[int, int]
+        self.__credit = defaultdict(float)  # type: Dict[int, float]
+        self.__deferred = []  # type: List[str]
+
+    def defer(self, user_ids: Iterable[str]):
+        """
+        Poll user IDs in the next cycle, eg. ones left out while their client's circuit is recovering.
+        :param user_ids: Twitch user IDs
+        :return: None
+        """
+        self.__deferred.extend(user_ids)
+
+    def next_batches(self, index: PollIndex, elapsed: float) -> List[Tuple[str, ...]]:
+        """
+        :param index: Poll index to take the batches from.
+        :param elapsed: Seconds since the previous poll cycle.
+        :return: Batches of user IDs to poll in this cycle.
+        """
+        due = []
+
+        # skip the deferred user IDs which are no longer announced anywhere
+        tracked = index.user_ids if self.__deferred else set()
+        deferred = list(dict.fromkeys(user_id for user_id in self.__deferred if user_id in tracked))
+        self.__deferred = []
+        for i in range(0, len(deferred), index.BATCH_SIZE):
+            due.append(tuple(deferred[i:i + index.BATCH_SIZE]))
+
+        for tier, interval in self.intervals.items():
+            batches = index.tier_batches(tier)
+            if not batches:
+                self.__credit[tier] = 0.0
+                continue
+
+            # a tier earns the share of its batches which must be polled to sweep it once per interval
+            credit = self.__credit[tier] + len(batches) * min(1.0, elapsed / interval)
+            count = min(len(batches), int(credit))
+            self.__credit[tier] = min(credit - count, float(len(batches)))
+
+            cursor = self.__cursors[tier] % len(batches)
+            for offset in range(count):
+                due.append(batches[(cursor + offset) % len(batches)])
+            self.__cursors[tier] = cursor + count
+
+        return due
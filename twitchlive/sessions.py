@@ -0,0 +1,187 @@
+import time
+from collections import defaultdict
+from logging import Logger
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import discord
+from redbot.core import Config
+
+from .twitchapi.twichobjects import TwitchStream
+
+
+class StreamSession(object):
+    """
+    A live stream which was announced, and the announcement message of every guild it was sent to.
+    """
+
+    __slots__ = ('stream_id', 'user_id', 'started_at', 'last_seen', 'ended_at', 'twitch_name', 'stream_url',
+                 'stream_title', 'user_thumbnail', 'messages')
+
+    def __init__(self, stream_id: str, user_id: str, started_at: Optional[float], twitch_name: str,
+                 stream_url: str, stream_title: str, user_thumbnail: str):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.started_at = started_at
+        self.last_seen = time.time()
+        self.ended_at = None  # type: Optional[float]
+        self.twitch_name = twitch_name
+        self.stream_url = stream_url
+        self.stream_title = stream_title
+        self.user_thumbnail = user_thumbnail
+        # guild ID -> (channel ID, message ID)
+        self.messages = {}  # type: Dict[int, Tuple[int, int]]
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        :return: Seconds from the stream's start until it was last seen live, or None if the start is unknown.
+        """
+        if self.started_at is None:
+            return None
+        return max((self.ended_at or self.last_seen) - self.started_at, 0.0)
+
+    def to_config(self, guild_id: int) -> dict:
+        channel_id, message_id = self.messages[guild_id]
+        return {
+            'user_id': self.user_id,
+            'started_at': self.started_at,
+            'twitch_name': self.twitch_name,
+            'stream_url': self.stream_url,
+            'stream_title': self.stream_title,
+            'user_thumbnail': self.user_thumbnail,
+            'channel_id': channel_id,
+            'message_id': message_id,
+        }
+
+
+class StreamSessions(object):
+    """
+    Tracks the announced streams which are still live, to edit their announcements once they end.
+
+    Offline transitions are detected from the poll results the monitor already has: a streamer in a successfully
+    polled batch without a live stream has ended their stream once they have not been seen live for
+    OFFLINE_GRACE seconds, which rides out streams briefly missing from the streams endpoint. A streamer live with
+    another stream ID has ended the previous one. EventSub stream.offline notifications end a session right away.
+
+    Sessions are persisted in the guild's `stream_sessions`, one entry per announcement message, so streams which
+    end while the bot is down are still edited after a restart. Sessions not seen live for TTL seconds are dropped
+    unedited.
+    """
+
+    OFFLINE_GRACE = 60
+    TTL = 48 * 60 * 60
+
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+
+        self.__sessions = {}  # type: Dict[str, StreamSession]
+        self.__by_user = defaultdict(set)  # type: Dict[str, Set[str]]
+
+    def __len__(self) -> int:
+        return len(self.__sessions)
+
+    async def load(self):
+        """
+        Load the sessions of every guild. They count as seen live now, so they are only ended by a later poll.
+        :return: None
+        """
+        guilds = await self.config.all_guilds()
+
+        for guild_id, guild_dict in guilds.items():
+            for stream_id, data in guild_dict.get('stream_sessions', {}).items():
+                session = self.__sessions.get(stream_id)
+                if session is None:
+                    session = self.__add(StreamSession(
+                        stream_id=stream_id, user_id=str(data.get('user_id')), started_at=data.get('started_at'),
+                        twitch_name=data.get('twitch_name'), stream_url=data.get('stream_url'),
+                        stream_title=data.get('stream_title'), user_thumbnail=data.get('user_thumbnail')
+                    ))
+                session.messages[int(guild_id)] = (int(data.get('channel_id')), int(data.get('message_id')))
+
+    def __add(self, session: StreamSession) -> StreamSession:
+        self.__sessions[session.stream_id] = session
+        self.__by_user[session.user_id].add(session.stream_id)
+        return session
+
+    def __end(self, session: StreamSession, ended_at: float) -> StreamSession:
+        self.__sessions.pop(session.stream_id, None)
+        self.__by_user[session.user_id].discard(session.stream_id)
+        if not self.__by_user[session.user_id]:
+            del self.__by_user[session.user_id]
+
+        session.ended_at = ended_at
+        return session
+
+    async def record(self, sent: Iterable[Tuple[int, int, int]], stream: TwitchStream, twitch_name: str,
+                     stream_url: str, user_thumbnail: str):
+        """
+        Record the announcement messages sent for a stream.
+        :param sent: (guild ID, channel ID, message ID) of every message sent
+        :param stream: The announced stream
+        :return: None
+        """
+        session = self.__sessions.get(str(stream.id))
+        if session is None:
+            started_at = stream.started_at.timestamp() if stream.started_at is not None else None
+            session = self.__add(StreamSession(
+                stream_id=str(stream.id), user_id=str(stream.user_id), started_at=started_at,
+                twitch_name=twitch_name, stream_url=stream_url, stream_title=stream.title,
+                user_thumbnail=user_thumbnail
+            ))
+
+        for guild_id, channel_id, message_id in sent:
+            session.messages[guild_id] = (channel_id, message_id)
+            async with self.config.guild(discord.Object(id=guild_id)).stream_sessions() as sessions:
+                sessions[session.stream_id] = session.to_config(guild_id)
+
+    def observe_poll(self, user_ids: Sequence[str], streams: Iterable[TwitchStream]) -> List[StreamSession]:
+        """
+        Update the sessions of a successfully polled batch.
+        :param user_ids: User IDs which were polled
+        :param streams: Streams the poll returned for them
+        :return: The sessions which ended
+        """
+        now = time.time()
+        live = {str(stream.user_id): str(stream.id) for stream in streams if stream.is_live}
+        ended = []
+
+        for user_id in map(str, user_ids):
+            live_stream_id = live.get(user_id)
+
+            for stream_id in list(self.__by_user.get(user_id, ())):
+                session = self.__sessions[stream_id]
+
+                if stream_id == live_stream_id:
+                    session.last_seen = now
+                elif live_stream_id is not None or now - session.last_seen >= self.OFFLINE_GRACE:
+                    ended.append(self.__end(session, ended_at=session.last_seen))
+
+        return ended
+
+    def end_user(self, user_id: str) -> List[StreamSession]:
+        """
+        End every session of a streamer, eg. on their stream.offline notification.
+        :return: The sessions which ended
+        """
+        now = time.time()
+        return [self.__end(self.__sessions[stream_id], ended_at=now)
+                for stream_id in list(self.__by_user.get(str(user_id), ()))]
+
+    def expire(self) -> List[StreamSession]:
+        """
+        Drop the sessions not seen live for TTL seconds, which are of streamers no longer polled.
+        :return: The sessions which were dropped. Their announcements should not be edited.
+        """
+        now = time.time()
+        return [self.__end(session, ended_at=now) for session in list(self.__sessions.values())
+                if now - session.last_seen > self.TTL]
+
+    async def forget(self, stream_id: str, guild_ids: Iterable[int]):
+        """
+        Remove the persisted announcement messages of an ended session, once they were edited or given up on.
+        :return: None
+        """
+        for guild_id in guild_ids:
+            async with self.config.guild(discord.Object(id=guild_id)).stream_sessions() as sessions:
+                sessions.pop(str(stream_id), None)
@@ -0,0 +1,75 @@
+from typing import Dict, Optional, Tuple
+
+import discord
+from redbot.core.bot import Red
+
+
+class AnnouncementTarget(object):
+    """
+    Resolved guild, role and channel of an announcement.
+    """
+
+    __slots__ = ('guild', 'role', 'channel')
+
+    def __init__(self, guild: discord.Guild, role: discord.Role, channel: discord.TextChannel):
+        self.guild = guild
+        self.role = role
+        self.channel = channel
+
+
+class AnnouncementTargets(object):
+    """
+    Cache of the guild, role and channel each announcement goes to, so announcing does not resolve them from IDs
+    every time. A guild's entries are re-resolved when the bot sees the guild, one of its roles or one of its
+    channels change; between those events the handles are known to be current.
+
+    Targets which do not resolve, eg. because the role was deleted, are cached as None.
+    """
+
+    def __init__(self, bot: Red):
+        self.bot = bot
+
+        self.__targets = {}  # type: Dict[int, Dict[Tuple[int, int], Optional[AnnouncementTarget]]]
+
+    def get(self, guild_id: int, role_id: int, channel_id: int) -> Optional[AnnouncementTarget]:
+        """
+        :param guild_id: ID of the guild
+        :param role_id: ID of the role to mention
+        :param channel_id: ID of the channel to announce in
+        :return: The resolved target, or None if any of the guild, role or channel does not exist.
+        """
+        guild_id, key = int(guild_id or 0), (int(role_id or 0), int(channel_id or 0))
+        guild_targets = self.__targets.setdefault(guild_id, {})
+
+        if key not in guild_targets:
+            guild_targets[key] = self.__resolve(guild_id, *key)
+        return guild_targets[key]
+
+    def refresh_guild(self, guild_id: int):
+        """
+        Re-resolve every cached target of a guild.
+        :param guild_id: ID of the guild which changed
+        :return: None
+        """
+        guild_targets = self.__targets.get(int(guild_id))
+        if not guild_targets:
+            return
+
+        for role_id, channel_id in guild_targets:
+            guild_targets[(role_id, channel_id)] = self.__resolve(int(guild_id), role_id, channel_id)
+
+    def clear(self):
+        self.__targets = {}
+
+    def __resolve(self, guild_id: int, role_id: int, channel_id: int) -> Optional[AnnouncementTarget]:
+        # all of these are dict lookups in discord.py's state
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or guild.unavailable:
+            return None
+
+        role = guild.get_role(role_id)
+        channel = guild.get_channel(channel_id)
+        if role is None or channel is None:
+            return None
+
+        return AnnouncementTarget(guild=guild, role=role, channel=channel)
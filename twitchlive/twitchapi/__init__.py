@@ -1 +1,2 @@
-from .twitchapi import TwitchApi
\ No newline at end of file
+from .twitchapi import TwitchApi
+from .pool import TwitchApiPool
@@ -0,0 +1,115 @@
+import random
+import time
+from typing import Optional
+
+from .twichobjects import TwitchCircuitOpenError
+
+
+class CircuitBreaker(object):
+    """
+    Stops requests to the Twitch API while it is failing, instead of sending every request into an outage.
+
+    CLOSED: requests go through. After FAILURE_THRESHOLD consecutive failures the circuit opens.
+    OPEN: requests are rejected with TwitchCircuitOpenError until the backoff has passed. The backoff doubles
+    every time the circuit opens again without a success in between, up to MAX_BACKOFF, with some jitter.
+    HALF_OPEN: once the backoff has passed, a single probe request is let through. Its success closes the circuit;
+    its failure opens it again with the next backoff.
+
+    Only failures of the API itself count: connection errors, timeouts and 5xx responses. A 4xx is a problem
+    with the request, not with Twitch.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    FAILURE_THRESHOLD = 5
+    BASE_BACKOFF = 5.0
+    MAX_BACKOFF = 300.0
+    JITTER = 0.1
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, base_backoff: float = BASE_BACKOFF,
+                 max_backoff: float = MAX_BACKOFF):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.last_error = None  # type: Optional[str]
+        self.last_failure_at = None  # type: Optional[float]
+
+        self.__state = self.CLOSED
+        self.__trips = 0
+        self.__retry_at = 0.0
+        self.__probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.__state == self.OPEN and time.monotonic() >= self.__retry_at:
+            return self.HALF_OPEN
+        return self.__state
+
+    @property
+    def retry_after(self) -> float:
+        """
+        :return: Seconds until a probe request will be let through, or 0 if requests are allowed now.
+        """
+        if self.__state != self.OPEN:
+            return 0.0
+        return max(self.__retry_at - time.monotonic(), 0.0)
+
+    def before_request(self):
+        """
+        Call before making a request. Every call which does not raise must be followed by `record_success`,
+        `record_failure` or `release`.
+        :raises TwitchCircuitOpenError: if the circuit is open, or a half-open probe is already in flight.
+        :return: None
+        """
+        state = self.state
+
+        if state == self.CLOSED:
+            return
+
+        if state == self.HALF_OPEN and not self.__probe_in_flight:
+            self.__state = self.HALF_OPEN
+            self.__probe_in_flight = True
+            return
+
+        raise TwitchCircuitOpenError(f"Twitch API circuit is {state} after {self.consecutive_failures} failures. "
+                                     f"Last error: {self.last_error}", retry_after=self.retry_after)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.__trips = 0
+        self.__probe_in_flight = False
+        self.__state = self.CLOSED
+
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        self.last_failure_at = time.time()
+
+        probe_failed = self.__probe_in_flight
+        self.__probe_in_flight = False
+
+        if probe_failed or (self.__state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self.__open()
+
+    def release(self):
+        """
+        Give up a request without a verdict on the API, eg. when it was cancelled, so another probe can be made.
+        :return: None
+        """
+        if self.__probe_in_flight:
+            self.__probe_in_flight = False
+            self.__state = self.OPEN
+
+    def __open(self):
+        backoff = min(self.base_backoff * (2 ** self.__trips), self.max_backoff)
+        backoff *= 1 + random.uniform(-self.JITTER, self.JITTER)
+
+        self.__trips += 1
+        self.times_opened += 1
+        self.__state = self.OPEN
+        self.__retry_at = time.monotonic() + backoff
@@ -0,0 +1,71 @@
+import bisect
+import hashlib
+from typing import Iterator, List, Sequence, Tuple
+
+
+class HashRing(object):
+    """
+    Consistent hash ring. Each node is placed on the ring at REPLICAS points, and a key belongs to the first
+    node clockwise of the key's hash. Adding or removing a node only moves the keys on its share of the ring,
+    about 1/N of them, so the other nodes keep their keys.
+    """
+
+    REPLICAS = 100
+
+    def __init__(self, nodes: Sequence[str] = (), replicas: int = REPLICAS):
+        self.replicas = replicas
+        self.nodes = []  # type: List[str]
+
+        self.__points = []  # type: List[Tuple[int, str]]
+        self.__hashes = []  # type: List[int]
+
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            bisect.insort(self.__points, (self._hash(f"{node}#{replica}"), node))
+        self.__hashes = [point for point, _ in self.__points]
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+
+        self.nodes.remove(node)
+        self.__points = [point for point in self.__points if point[1] != node]
+        self.__hashes = [point for point, _ in self.__points]
+
+    def preference(self, key: str) -> Iterator[str]:
+        """
+        :param key: Key to place on the ring
+        :return: Every node, in the order the key falls to them: its owner first, then the fallbacks if the owner
+                 is unavailable.
+        """
+        if not self.__points:
+            return
+
+        seen = set()
+        start = bisect.bisect(self.__hashes, self._hash(key))
+
+        for offset in range(len(self.__points)):
+            node = self.__points[(start + offset) % len(self.__points)][1]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def owner(self, key: str) -> str:
+        """
+        :param key: Key to place on the ring
+        :return: Node the key belongs to
+        """
+        return next(self.preference(key))
@@ -0,0 +1,47 @@
+from typing import Optional
+
+from cog_shared.seplib.utils.metrics import RollingCounter, RollingHistogram
+
+
+class TwitchApiMetrics(object):
+    """
+    Rolling counters and latency of the requests a TwitchApi client makes to Helix.
+    """
+
+    COUNTERS = {
+        'requests': "Helix requests sent, including retries.",
+        'rate_limited': "Helix requests rejected with a 429.",
+        'client_errors': "Helix requests which failed with a 4xx other than 429.",
+        'server_errors': "Helix requests which failed with a 5xx.",
+        'connection_errors': "Helix requests which failed without a response.",
+        'token_requests': "App access tokens requested.",
+    }
+
+    HISTOGRAMS = {
+        'request_latency': "Seconds taken by Helix requests.",
+    }
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, RollingCounter())
+        for name in self.HISTOGRAMS:
+            setattr(self, name, RollingHistogram())
+
+    def observe(self, seconds: float, status: Optional[int] = None):
+        """
+        Record a Helix request.
+        :param seconds: Time until the response headers arrived, or until the request failed.
+        :param status: HTTP status of the response, or None if the request failed without one.
+        :return: None
+        """
+        self.requests.add()
+        self.request_latency.observe(seconds)
+
+        if status is None:
+            self.connection_errors.add()
+        elif status == 429:
+            self.rate_limited.add()
+        elif 400 <= status < 500:
+            self.client_errors.add()
+        elif status >= 500:
+            self.server_errors.add()
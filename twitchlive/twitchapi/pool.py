@@ -0,0 +1,197 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .circuitbreaker import CircuitBreaker
+from .hashring import HashRing
+from .twichobjects import TwitchStream, TwitchUser, TwitchGame, TwitchAuthError
+from .twitchapi import TwitchApi
+
+
+class TwitchApiPool(object):
+    """
+    Spreads the polling work over several Twitch applications, each with its own Helix rate budget.
+
+    Every credential set gets its own TwitchApi client, and so its own token, session, rate limiter and circuit
+    breaker. Streamers are assigned to clients by consistent hashing of their user ID. While a client's circuit
+    is open its streamers fall to the next client on the ring, and return once it recovers; adding or removing
+    a credential only moves the streamers on its share of the ring.
+
+    Requests which are not about a particular streamer, like user lookups, go to the first healthy client.
+    EventSub subscriptions belong to an application, so they always use the primary (first) client.
+    """
+
+    def __init__(self, credentials: Sequence[Tuple[str, str]] = ()):
+        self.__clients = OrderedDict()  # type: OrderedDict[str, TwitchApi]
+        self.__secrets = {}  # type: Dict[str, str]
+        self.__ring = HashRing()
+        # user ID -> ID of the client owning the user on the ring. Only changes with the credentials.
+        self.__owners = {}  # type: Dict[str, str]
+
+        self.set_credentials(credentials)
+
+    @property
+    def clients(self) -> List[TwitchApi]:
+        return list(self.__clients.values())
+
+    @property
+    def primary(self) -> TwitchApi:
+        return next(iter(self.__clients.values()))
+
+    @property
+    def available(self) -> bool:
+        """
+        :return: False if every client's circuit is open, ie. no request can be made right now.
+        """
+        return any(client.circuit_breaker.state != CircuitBreaker.OPEN for client in self.__clients.values())
+
+    def set_credentials(self, credentials: Sequence[Tuple[str, str]]) -> List[TwitchApi]:
+        """
+        Replace the credential sets of the pool. Clients whose credentials are unchanged are kept, along with
+        their tokens and connections.
+        :param credentials: List of (client ID, client secret)
+        :return: The clients which were removed. They must be closed by the caller.
+        """
+        current, current_secrets = self.__clients, self.__secrets
+        self.__clients, self.__secrets = OrderedDict(), {}
+
+        for client_id, client_secret in credentials:
+            client = current.get(client_id)
+            if client is None or current_secrets.get(client_id) != client_secret:
+                client = TwitchApi(client_id=client_id, client_secret=client_secret)
+            self.__clients[client_id] = client
+            self.__secrets[client_id] = client_secret
+
+        removed = [client for client_id, client in current.items() if self.__clients.get(client_id) is not client]
+
+        for client_id in set(self.__ring.nodes) - set(self.__clients):
+            self.__ring.remove(client_id)
+        for client_id in self.__clients:
+            self.__ring.add(client_id)
+        self.__owners.clear()
+
+        return removed
+
+    def client_for(self, user_id: str) -> TwitchApi:
+        """
+        :param user_id: Twitch user ID
+        :return: The client polling the user: the first client on the ring with a closed circuit, or the user's
+                 own client if none is closed.
+        """
+        preference = list(self.__ring.preference(str(user_id)))
+
+        for client_id in preference:
+            client = self.__clients[client_id]
+            if client.circuit_breaker.state == CircuitBreaker.CLOSED:
+                return client
+        return self.__clients[preference[0]]
+
+    def owner_of(self, user_id: str) -> TwitchApi:
+        """
+        :param user_id: Twitch user ID
+        :return: The client the user belongs to when every client is healthy.
+        """
+        user_id = str(user_id)
+        client_id = self.__owners.get(user_id)
+        if client_id is None:
+            client_id = self.__owners[user_id] = self.__ring.owner(user_id)
+        return self.__clients[client_id]
+
+    def shard_batches(self, batches: Sequence[Sequence[str]]) \
+            -> Tuple[List[Tuple[TwitchApi, Tuple[str, ...]]], List[str]]:
+        """
+        Regroup batches of user IDs by the client polling them, so every request is made with the budget of the
+        client the users belong to. A client whose circuit is half-open gets one batch of its own users as the
+        probe, and the rest of its users are polled by the fallbacks.
+
+        Users without a client able to take their request, ie. no closed fallback and no room left in the probe,
+        are deferred rather than sent into a circuit which would reject them.
+
+        While every circuit is closed, users go to their owner, which is looked up once per user and cached.
+        A single healthy client polls the batches as they are.
+        :param batches: Batches of Twitch user IDs
+        :return: Tuple of (list of (client, batch of at most MAX_IDS_PER_REQUEST user IDs), deferred user IDs)
+        """
+        healthy = all(client.circuit_breaker.state == CircuitBreaker.CLOSED for client in self.__clients.values())
+
+        if healthy and len(self.__clients) == 1:
+            return [(self.primary, tuple(batch)) for batch in batches], []
+
+        grouped = OrderedDict()  # type: OrderedDict[str, List[str]]
+        deferred = []
+
+        for batch in batches:
+            for user_id in batch:
+                owner = self.owner_of(user_id)
+                if healthy:
+                    grouped.setdefault(owner.client_id, []).append(user_id)
+                    continue
+                probe = grouped.get(owner.client_id)
+
+                if owner.circuit_breaker.state == CircuitBreaker.HALF_OPEN and \
+                        (probe is None or len(probe) < TwitchApi.MAX_IDS_PER_REQUEST):
+                    client = owner
+                else:
+                    client = self.client_for(user_id)
+                    if client.circuit_breaker.state != CircuitBreaker.CLOSED:
+                        deferred.append(user_id)
+                        continue
+                grouped.setdefault(client.client_id, []).append(user_id)
+
+        sharded = []
+        size = TwitchApi.MAX_IDS_PER_REQUEST
+        for client_id, user_ids in grouped.items():
+            client = self.__clients[client_id]
+            for i in range(0, len(user_ids), size):
+                sharded.append((client, tuple(user_ids[i:i + size])))
+        return sharded, deferred
+
+    def lookup_client(self) -> TwitchApi:
+        for client in self.__clients.values():
+            if client.circuit_breaker.state == CircuitBreaker.CLOSED:
+                return client
+        return self.primary
+
+    async def get_streams_for_multiple(self, user_id_list: List[str]) -> List[TwitchStream]:
+        streams = []
+        shards, _ = self.shard_batches([user_id_list])
+        for client, batch in shards:
+            streams.extend(await client.get_streams_for_multiple(list(batch)))
+        return streams
+
+    async def get_users_for_logins(self, username_list: List[str]) -> Dict[str, Optional[TwitchUser]]:
+        return await self.lookup_client().get_users_for_logins(username_list)
+
+    async def get_user_ids_for_logins(self, username_list: List[str]) -> Dict[str, Optional[str]]:
+        return await self.lookup_client().get_user_ids_for_logins(username_list)
+
+    def get_cached_game(self, game_id: str) -> Optional[TwitchGame]:
+        """
+        :return: The game if any client has it cached, without making a request.
+        """
+        for client in self.__clients.values():
+            cached, game = client.game_cache.get(str(game_id))
+            if cached:
+                return game
+        return None
+
+    async def get_games_for_ids(self, game_id_list: List[str]) -> Dict[str, Optional[TwitchGame]]:
+        return await self.lookup_client().get_games_for_ids(game_id_list)
+
+    async def get_games_for_names(self, name_list: List[str]) -> Dict[str, Optional[TwitchGame]]:
+        return await self.lookup_client().get_games_for_names(name_list)
+
+    async def _sanity_check(self) -> Tuple[bool, Optional[Exception]]:
+        """
+        Check that every credential set can get an access token.
+        :return: Tuple of (all passed, the first error)
+        """
+        results = await asyncio.gather(*(client._sanity_check() for client in self.__clients.values()))
+
+        for client, (success, exception) in zip(self.__clients.values(), results):
+            if not success:
+                return False, TwitchAuthError(f"Client ID {client.client_id}: {exception}")
+        return True, None
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.__clients.values()))
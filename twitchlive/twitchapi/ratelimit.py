@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Mapping, Optional
+
+
+class HelixRateLimiter(object):
+    """
+    Token bucket for the Twitch Helix API, kept in sync with the rate limit headers Twitch returns.
+
+    Helix grants each client a bucket of `Ratelimit-Limit` points per minute which refills continuously.
+    Every response reports the points left (`Ratelimit-Remaining`) and when the bucket will be full again
+    (`Ratelimit-Reset`, epoch seconds). Requests acquire a point before they are sent; when the bucket is empty,
+    they wait for it to refill instead of being rejected with a 429.
+    """
+
+    DEFAULT_LIMIT = 800
+    REFILL_WINDOW = 60
+
+    LIMIT_HEADER = "Ratelimit-Limit"
+    REMAINING_HEADER = "Ratelimit-Remaining"
+    RESET_HEADER = "Ratelimit-Reset"
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        self.tokens = float(limit)
+        self.in_flight = 0
+
+        self.__updated = time.monotonic()
+        self.__blocked_until = 0.0
+        self.__lock = asyncio.Lock()
+
+    @property
+    def refill_rate(self) -> float:
+        return self.limit / self.REFILL_WINDOW
+
+    def __refill(self, now: float):
+        if self.__blocked_until and now >= self.__blocked_until:
+            # the reset time has passed, so the bucket is full again
+            self.__blocked_until = 0.0
+            self.tokens = float(self.limit)
+        elif not self.__blocked_until:
+            self.tokens = min(float(self.limit), self.tokens + (now - self.__updated) * self.refill_rate)
+        self.__updated = now
+
+    async def acquire(self):
+        """
+        Wait until a point is available and take it. Every acquire must be followed by a call to `complete`.
+        Waiters are served in order, so a burst of requests is spread over the refill rate.
+        :return: None
+        """
+        async with self.__lock:
+            while True:
+                now = time.monotonic()
+                self.__refill(now)
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+                if self.__blocked_until:
+                    wait = self.__blocked_until - now
+                else:
+                    wait = (1 - self.tokens) / self.refill_rate
+                await asyncio.sleep(max(wait, 0.01))
+
+    def complete(self, headers: Optional[Mapping[str, str]] = None, status: Optional[int] = None):
+        """
+        Release an acquired point and sync the bucket with the rate limit headers of the response.
+        :param headers: Response headers, or None if the request failed without a response.
+        :param status: HTTP status code of the response.
+        :return: None
+        """
+        self.in_flight = max(self.in_flight - 1, 0)
+
+        if not headers:
+            return
+
+        try:
+            limit = headers.get(self.LIMIT_HEADER)
+            remaining = headers.get(self.REMAINING_HEADER)
+            reset = headers.get(self.RESET_HEADER)
+
+            if limit is not None:
+                self.limit = max(int(limit), 1)
+            if remaining is None:
+                return
+
+            now = time.monotonic()
+            # the server has not yet counted the requests which are still in flight
+            self.tokens = float(int(remaining) - self.in_flight)
+            self.__updated = now
+
+            if (int(remaining) <= 0 or status == 429) and reset is not None:
+                self.tokens = min(self.tokens, 0.0)
+                self.__blocked_until = now + max(float(reset) - time.time(), 0.0)
+            else:
+                self.__blocked_until = 0.0
+        except ValueError:
+            return
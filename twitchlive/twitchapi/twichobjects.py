@@ -1,6 +1,5 @@
 import datetime
-import time
-from typing import List
+from typing import List, Optional
 
 import pytz
 
@@ -21,7 +20,7 @@ class TwitchAuthToken(object):
     def __calc_expires_dt(self, date_header: str, expires_in: int) -> datetime.datetime:
         response_time = datetime.datetime.strptime(date_header, self.DATE_HEADER_FORMAT).replace(tzinfo=pytz.UTC)
 
-        response_epoch = int(time.mktime(response_time.timetuple()))
+        response_epoch = int(response_time.timestamp())
 
         expiration_epoch = response_epoch + expires_in
 
@@ -33,12 +32,28 @@ class TwitchAuthToken(object):
     def is_valid(self, padding=30):
 
         now_dt = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
-        padded_dt = (now_dt - datetime.timedelta(seconds=padding))
+        padded_dt = (now_dt + datetime.timedelta(seconds=padding))
 
         return self.expires_dt > padded_dt
 
+    @property
+    def seconds_to_expiry(self) -> float:
+        now_dt = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
+        return (self.expires_dt - now_dt).total_seconds()
+
 
 class TwitchStream(object):
+    """
+    A stream from the Helix streams endpoint. `started_at` and `thumbnail_url` are only parsed/formatted
+    when they are first read, since most polled streams are never announced.
+    """
+
+    __slots__ = ('community_ids', 'game_id', 'id', 'language', 'pagination', 'title', 'type', 'user_id',
+                 'viewer_count', 'user_name', '_started_at_raw', '_started_at', '_thumbnail_template', '_thumbnail_url')
+
+    # fields of a stream the cog reads. from_json ignores the rest.
+    JSON_FIELDS = ('game_id', 'id', 'language', 'title', 'type', 'user_id', 'viewer_count', 'user_name')
+
     def __init__(self, community_ids: List[str], game_id: str, id: str, language: str, started_at: str,
                  thumbnail_url: str, title: str, type: str, user_id: str, viewer_count: int, pagination=None,
                  user_name: str = None, **kwargs):
@@ -48,17 +63,57 @@ class TwitchStream(object):
         self.id = id
         self.language = language
         self.pagination = pagination
-        self.started_at = self.__create_started_dt(started_at)
-        self.thumbnail_url = "{}?cache={}".format(thumbnail_url, datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S"))
         self.title = title
         self.type = type
         self.user_id = user_id
         self.viewer_count = viewer_count
         self.user_name = user_name
 
-    def __create_started_dt(self, started_at: str):
-        return datetime.datetime.strptime(started_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.UTC)
+        self._started_at_raw = started_at
+        self._started_at = None
+        self._thumbnail_template = thumbnail_url
+        self._thumbnail_url = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TwitchStream':
+        """
+        Build a stream from a decoded Helix response item, reading only the fields the cog uses.
+        Tolerates fields being added to or removed from the API response.
+        """
+        stream = cls.__new__(cls)
+        for field in cls.JSON_FIELDS:
+            setattr(stream, field, data.get(field))
+
+        stream.community_ids = None
+        stream.pagination = None
+        stream._started_at_raw = data.get('started_at')
+        stream._started_at = None
+        stream._thumbnail_template = data.get('thumbnail_url')
+        stream._thumbnail_url = None
+        return stream
 
+    @property
+    def started_at(self) -> Optional[datetime.datetime]:
+        if self._started_at is None and self._started_at_raw:
+            self._started_at = self.__create_started_dt(self._started_at_raw)
+        return self._started_at
+
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        if self._thumbnail_url is None and self._thumbnail_template is not None:
+            self._thumbnail_url = "{}?cache={}".format(self._thumbnail_template,
+                                                       datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S"))
+        return self._thumbnail_url
+
+    @staticmethod
+    def __create_started_dt(started_at: str) -> datetime.datetime:
+        # fixed "%Y-%m-%dT%H:%M:%SZ" format, sliced directly since strptime is slow
+        try:
+            return datetime.datetime(int(started_at[0:4]), int(started_at[5:7]), int(started_at[8:10]),
+                                     int(started_at[11:13]), int(started_at[14:16]), int(started_at[17:19]),
+                                     tzinfo=pytz.UTC)
+        except ValueError:
+            return datetime.datetime.strptime(started_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.UTC)
 
     @property
     def is_live(self):
@@ -66,8 +121,15 @@ class TwitchStream(object):
 
 
 class TwitchUser(object):
+
+    __slots__ = ('broadcaster_type', 'description', 'display_name', 'id', 'login', 'offline_image_url',
+                 'profile_image_url', 'type', 'view_count', 'email')
+
+    # fields of a user the cog reads. from_json ignores the rest.
+    JSON_FIELDS = ('display_name', 'id', 'login', 'profile_image_url')
+
     def __init__(self, broadcaster_type: str, description: str, display_name: str, id: str, login: str,
-                 offline_image_url: str, profile_image_url: str, type: str, view_count: int, email=None):
+                 offline_image_url: str, profile_image_url: str, type: str, view_count: int, email=None, **kwargs):
 
         self.broadcaster_type = broadcaster_type
         self.description = description
@@ -80,5 +142,86 @@ class TwitchUser(object):
         self.view_count = view_count
         self.email = email
 
+    @classmethod
+    def from_json(cls, data: dict) -> 'TwitchUser':
+        """
+        Build a user from a decoded Helix response item, reading only the fields the cog uses.
+        """
+        user = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(user, field, data.get(field) if field in cls.JSON_FIELDS else None)
+        return user
+
+
+class TwitchGame(object):
+    """
+    A game or category from the Helix games endpoint.
+    """
+
+    __slots__ = ('id', 'name', 'box_art_url')
+
+    def __init__(self, id: str, name: str, box_art_url: str, **kwargs):
+        self.id = id
+        self.name = name
+        self.box_art_url = box_art_url
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TwitchGame':
+        return cls(id=str(data.get('id')), name=data.get('name'), box_art_url=data.get('box_art_url'))
+
+    def get_box_art(self, width=144, height=192) -> Optional[str]:
+        if not self.box_art_url:
+            return None
+        return self.box_art_url.replace("{width}", str(width)).replace("{height}", str(height))
+
+
+class EventSubSubscription(object):
+    def __init__(self, id: str, status: str, type: str, version: str, condition: dict, transport: dict,
+                 created_at: str, cost: int = 0, **kwargs):
+
+        self.id = id
+        self.status = status
+        self.type = type
+        self.version = version
+        self.condition = condition
+        self.transport = transport
+        self.created_at = created_at
+        self.cost = cost
+
+    @property
+    def broadcaster_user_id(self) -> str:
+        return str(self.condition.get('broadcaster_user_id'))
+
+    @property
+    def callback(self) -> str:
+        return self.transport.get('callback')
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("enabled", "webhook_callback_verification_pending")
+
+
 class TwitchAuthError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class TwitchApiError(Exception):
+    pass
+
+
+class TwitchResponseError(TwitchApiError):
+    """
+    Twitch answered with an error status, or with a body which could not be decoded.
+    """
+    def __init__(self, message: str, status: Optional[int] = None):
+        super(TwitchResponseError, self).__init__(message)
+        self.status = status
+
+
+class TwitchCircuitOpenError(TwitchApiError):
+    """
+    The request was not made because the Twitch API has been failing. See CircuitBreaker.
+    """
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super(TwitchCircuitOpenError, self).__init__(message)
+        self.retry_after = retry_after
@@ -1,9 +1,18 @@
-from collections import defaultdict
 from typing import Optional, List, Tuple, Union, Dict
 
+import asyncio
+import json
+import time
+from urllib.parse import quote
+
 import aiohttp
 
-from .twichobjects import TwitchAuthToken, TwitchStream, TwitchAuthError, TwitchUser
+from cog_shared.seplib.utils.ttlcache import TTLCache
+from .circuitbreaker import CircuitBreaker
+from .metrics import TwitchApiMetrics
+from .ratelimit import HelixRateLimiter
+from .twichobjects import TwitchAuthToken, TwitchStream, TwitchAuthError, TwitchUser, TwitchGame, \
+    EventSubSubscription, TwitchResponseError
 
 
 class TwitchApi(object):
@@ -12,13 +21,52 @@ class TwitchApi(object):
     TWITCH_API_PREFIX = "https://api.twitch.tv/helix"
     STREAMS_PATH = "/streams"
     USERS_PATH = "/users"
+    GAMES_PATH = "/games"
+    EVENTSUB_SUBSCRIPTIONS_PATH = "/eventsub/subscriptions"
+
+    # most logins, names or IDs the users, games and streams endpoints accept per request
+    MAX_IDS_PER_REQUEST = 100
+
+    # connection pool settings for the shared session
+    CONNECTION_LIMIT = 20
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+    REQUEST_TIMEOUT = 30
+
+    # Helix requests allowed in flight at once, and how often a rate limited (429) request is retried
+    MAX_CONCURRENT_REQUESTS = 10
+    MAX_RATE_LIMIT_RETRIES = 3
+
+    # users by login and games by ID, including the ones which were not found, so repeated lookups of a typo
+    # don't hit the API. Games rarely change, so they are kept for longer.
+    USER_CACHE_SIZE = 5000
+    USER_CACHE_TTL = 60 * 60
+    GAME_CACHE_SIZE = 5000
+    GAME_CACHE_TTL = 24 * 60 * 60
 
+    # renew the access token this many seconds before it expires
+    TOKEN_RENEWAL_MARGIN = 300
+    TOKEN_RENEWAL_RETRY_DELAY = 60
 
     def __init__(self, client_id: str, client_secret: str):
         self.__client_id = client_id
         self.__client_secret = client_secret
 
         self.__twitch_auth_token = None  # type: Optional[TwitchAuthToken]
+        self.__token_lock = asyncio.Lock()
+        self.__renewal_task = None  # type: Optional[asyncio.Task]
+        self.__session = None  # type: Optional[aiohttp.ClientSession]
+
+        self.rate_limiter = HelixRateLimiter()
+        self.circuit_breaker = CircuitBreaker()
+        self.metrics = TwitchApiMetrics()
+        self.user_cache = TTLCache(maxsize=self.USER_CACHE_SIZE, ttl=self.USER_CACHE_TTL)
+        self.game_cache = TTLCache(maxsize=self.GAME_CACHE_SIZE, ttl=self.GAME_CACHE_TTL)
+        self.__request_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+    @property
+    def client_id(self) -> str:
+        return self.__client_id
 
     async def __get_new_auth_token(self, client_id: str,
                              client_secret: str,
@@ -30,33 +78,164 @@ class TwitchApi(object):
             "grant_type": grant_type
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url=self.TWITCH_AUTH_TOKEN_URL, params=params) as resp:
-                json_response = await resp.json()
-                date_header = resp.headers.get('date')
+        self.metrics.token_requests.add()
+        async with self._get_session().post(url=self.TWITCH_AUTH_TOKEN_URL, params=params) as resp:
+            json_response = await resp.json()
+            date_header = resp.headers.get('date')
 
-                json_response['date_header'] = date_header
+            json_response['date_header'] = date_header
 
-                if not str(resp.status).startswith('2'):
-                    raise TwitchAuthError(f"Error generating Auth token with Twitch. Dump: {json_response}")
+            if not str(resp.status).startswith('2'):
+                raise TwitchAuthError(f"Error generating Auth token with Twitch. Dump: {json_response}")
 
-                return TwitchAuthToken(**json_response)
+            return TwitchAuthToken(**json_response)
 
     def __get_auth_header(self, access_token: str):
+        # EventSub requires the Client-ID alongside the app access token
         return {
+            "Client-ID": self.__client_id,
             "Authorization": f"Bearer {access_token}"
         }
 
-    async def _get_access_token(self) -> str:
-        token_valid = self.__twitch_auth_token is not None and self.__twitch_auth_token.is_valid
-
-        if not token_valid:
-            self.__twitch_auth_token = await self.__get_new_auth_token(client_id=self.__client_id,
-                                                                       client_secret=self.__client_secret)
-        return self.__twitch_auth_token.access_token
-
-    async def _get_session(self):
-        return aiohttp.ClientSession(headers=self.__get_auth_header(await self._get_access_token()))
+    def __token_usable(self, rejected_token: Optional[str] = None) -> bool:
+        token = self.__twitch_auth_token
+        return token is not None and token.is_valid and token.access_token != rejected_token
+
+    async def _get_access_token(self, rejected_token: Optional[str] = None) -> str:
+        """
+        Get a valid access token, requesting a new one if needed. Concurrent callers share a single refresh.
+        :param rejected_token: Access token Twitch rejected with a 401, which must not be returned again.
+        :return: Access token
+        """
+        if self.__token_usable(rejected_token):
+            return self.__twitch_auth_token.access_token
+
+        async with self.__token_lock:
+            # another caller may have refreshed the token while this one waited for the lock
+            if not self.__token_usable(rejected_token):
+                await self.__refresh_token()
+            return self.__twitch_auth_token.access_token
+
+    async def __refresh_token(self):
+        self.__twitch_auth_token = await self.__get_new_auth_token(client_id=self.__client_id,
+                                                                   client_secret=self.__client_secret)
+
+        if self.__renewal_task is None or self.__renewal_task.done():
+            self.__renewal_task = asyncio.ensure_future(self.__renew_token_loop())
+
+    async def __renew_token_loop(self):
+        """
+        Renew the access token in the background shortly before it expires, so requests never wait on a refresh
+        or fail with an expired token.
+        """
+        while self.__twitch_auth_token is not None:
+            await asyncio.sleep(max(self.__twitch_auth_token.seconds_to_expiry - self.TOKEN_RENEWAL_MARGIN, 0))
+
+            try:
+                async with self.__token_lock:
+                    if self.__twitch_auth_token.seconds_to_expiry <= self.TOKEN_RENEWAL_MARGIN:
+                        self.__twitch_auth_token = await self.__get_new_auth_token(
+                            client_id=self.__client_id, client_secret=self.__client_secret)
+            except (TwitchAuthError, aiohttp.ClientError, asyncio.TimeoutError):
+                # requests will refresh the token themselves if it does expire
+                await asyncio.sleep(self.TOKEN_RENEWAL_RETRY_DELAY)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the long-lived session shared by every Twitch API call, creating it on first use.
+        Connections are kept alive and DNS lookups cached between polls. The session carries no auth headers,
+        so it survives token rotation; they are added to each request instead.
+        :return: Shared aiohttp ClientSession
+        """
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.CONNECTION_LIMIT, ttl_dns_cache=self.DNS_CACHE_TTL,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            self.__session = aiohttp.ClientSession(connector=connector,
+                                                   timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT))
+        return self.__session
+
+    async def _get(self, path: str, url_suffix: str) -> aiohttp.ClientResponse:
+        """
+        Make an authenticated GET request to the Helix API using the shared session.
+        :param path: API path, eg. USERS_PATH
+        :param url_suffix: Query string to append to the path.
+        :return: aiohttp response, to be used as an async context manager.
+        """
+        return await self._request("GET", path, url_suffix)
+
+    async def _request(self, method: str, path: str, url_suffix: str = "", **kwargs) -> aiohttp.ClientResponse:
+        """
+        Make an authenticated request to the Helix API using the shared session.
+        Requests wait for the Helix rate limit bucket, and are retried if Twitch still responds with a 429.
+        A 401 is retried once with a new access token. Requests are refused while the circuit breaker is open.
+        :param method: HTTP method
+        :param path: API path, eg. USERS_PATH
+        :param url_suffix: Query string to append to the path.
+        :param kwargs: Passed on to aiohttp, eg. `json` for the request body.
+        :raises TwitchCircuitOpenError: if the Twitch API has been failing and the circuit breaker is open.
+        :return: aiohttp response, to be used as an async context manager.
+        """
+        url = self.TWITCH_API_PREFIX + path + url_suffix
+
+        self.circuit_breaker.before_request()
+        try:
+            resp = await self.__send(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError, TwitchAuthError) as e:
+            self.circuit_breaker.record_failure(f"{e.__class__.__name__}: {e}")
+            raise
+        except BaseException:
+            self.circuit_breaker.release()
+            raise
+
+        if resp.status >= 500:
+            self.circuit_breaker.record_failure(f"HTTP {resp.status} from {path}")
+        else:
+            self.circuit_breaker.record_success()
+        return resp
+
+    async def __send(self, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        rejected_token = None
+        attempt = 0
+
+        while True:
+            access_token = await self._get_access_token(rejected_token=rejected_token)
+            headers = self.__get_auth_header(access_token)
+
+            async with self.__request_semaphore:
+                await self.rate_limiter.acquire()
+                started = time.monotonic()
+                try:
+                    resp = await self._get_session().request(method, url, headers=headers, **kwargs)
+                except Exception:
+                    self.rate_limiter.complete()
+                    self.metrics.observe(time.monotonic() - started)
+                    raise
+                self.rate_limiter.complete(resp.headers, resp.status)
+                self.metrics.observe(time.monotonic() - started, resp.status)
+
+            if resp.status == 401 and rejected_token is None:
+                # the token was revoked or expired early. Retry once with a new one.
+                rejected_token = access_token
+                resp.release()
+                continue
+
+            attempt += 1
+            if resp.status != 429 or attempt >= self.MAX_RATE_LIMIT_RETRIES:
+                return resp
+            resp.release()
+
+    async def close(self):
+        """
+        Close the shared session and its pooled connections. Called when the cog is unloaded or reconfigured.
+        :return: None
+        """
+        if self.__renewal_task is not None:
+            self.__renewal_task.cancel()
+            self.__renewal_task = None
+
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+        self.__session = None
 
     async def _sanity_check(self) -> Tuple[bool, Optional[Exception]]:
         try:
@@ -66,33 +245,141 @@ class TwitchApi(object):
             return False, e
 
     async def get_user_ids_for_logins(self, username_list: List[str]) -> Dict[str, Optional[str]]:
-        map = defaultdict()
-
-        for username in username_list:
-            map[username] = None
-        username_str = "&login=".join(username_list)
-        users = await self.get_users_by_login(username=username_str)
+        users = await self.get_users_for_logins(username_list)
+        return {login: str(user.id) if user is not None else None for login, user in users.items()}
+
+    async def get_users_for_logins(self, username_list: List[str]) -> Dict[str, Optional[TwitchUser]]:
+        """
+        Look up many users by login. Cached users are served from the user cache; the rest are requested
+        concurrently, up to 100 logins per request.
+        :param username_list: List of Twitch logins
+        :return: dict of lower case login -> TwitchUser, or None if the user does not exist.
+        """
+        users = {}
+        to_fetch = []
+
+        for login in dict.fromkeys(username.lower() for username in username_list):
+            cached, user = self.user_cache.get(login)
+            if cached:
+                users[login] = user
+            else:
+                to_fetch.append(login)
+
+        size = self.MAX_IDS_PER_REQUEST
+        chunks = [to_fetch[i:i + size] for i in range(0, len(to_fetch), size)]
+        results = await asyncio.gather(*(self.get_users_by_login(username="&login=".join(chunk))
+                                         for chunk in chunks))
+
+        for chunk, chunk_users in zip(chunks, results):
+            found = {user.login.lower(): user for user in chunk_users}
+            for login in chunk:
+                users[login] = found.get(login)
+                self.user_cache.set(login, users[login])
+
+        return users
+
+    @staticmethod
+    async def _read_json(resp: aiohttp.ClientResponse, expected_status: int = 200) -> dict:
+        """
+        Decode a JSON response body. Helix always answers in UTF-8, so this skips the charset detection and
+        content-type check of ClientResponse.json(), which are a noticeable share of decoding a large poll response.
+        :param resp: aiohttp response
+        :param expected_status: Status of a successful response.
+        :raises TwitchResponseError: if the response has another status, or its body is not a JSON object.
+        :return: Decoded body
+        """
+        body = await resp.read()
+
+        if resp.status != expected_status:
+            raise TwitchResponseError(f"Twitch responded with HTTP {resp.status} for {resp.url.path}. "
+                                      f"Body: {body[:200]!r}", status=resp.status)
+        try:
+            json_response = json.loads(body)
+        except ValueError:
+            json_response = None
 
-        for user in users:
-            map[user.login] = str(user.id)
-        return map
+        if not isinstance(json_response, dict):
+            raise TwitchResponseError(f"Twitch responded with a body which is not a JSON object for "
+                                      f"{resp.url.path}. Body: {body[:200]!r}", status=resp.status)
+        return json_response
 
     async def get_users_by_login(self, username: str) -> List[TwitchUser]:
         url_suffix = "?login={}".format(username)
 
-        async with await self._get_session() as session:
-            async with session.get(self.TWITCH_API_PREFIX + self.USERS_PATH + url_suffix) as resp:
-                json_response = await resp.json()
-
-                users = []
-
-                user_data = json_response.get('data', {})
-                if isinstance(user_data, dict) and not user_data:
-                    print(f"Invalid twitch response for Users. Full response: {json_response}")
-
-                for user in user_data:
-                    users.append(TwitchUser(**user))
-                return users
+        async with await self._get(self.USERS_PATH, url_suffix) as resp:
+            json_response = await self._read_json(resp)
+
+            users = []
+
+            user_data = json_response.get('data')
+            if not isinstance(user_data, list):
+                raise TwitchResponseError(f"Invalid twitch response for Users. Full response: {json_response}",
+                                          status=resp.status)
+
+            for user in user_data:
+                users.append(TwitchUser.from_json(user))
+            return users
+
+    async def get_games_for_ids(self, game_id_list: List[str]) -> Dict[str, Optional[TwitchGame]]:
+        """
+        Look up many games by ID. Cached games are served from the game cache; the rest are requested
+        concurrently, up to 100 IDs per request.
+        :param game_id_list: List of Twitch game IDs
+        :return: dict of game ID -> TwitchGame, or None if the game does not exist.
+        """
+        games = {}
+        to_fetch = []
+
+        for game_id in dict.fromkeys(str(game_id) for game_id in game_id_list if game_id):
+            cached, game = self.game_cache.get(game_id)
+            if cached:
+                games[game_id] = game
+            else:
+                to_fetch.append(game_id)
+
+        size = self.MAX_IDS_PER_REQUEST
+        chunks = [to_fetch[i:i + size] for i in range(0, len(to_fetch), size)]
+        results = await asyncio.gather(*(self.get_games("?id=" + "&id=".join(chunk)) for chunk in chunks))
+
+        for chunk, chunk_games in zip(chunks, results):
+            found = {game.id: game for game in chunk_games}
+            for game_id in chunk:
+                games[game_id] = found.get(game_id)
+                self.game_cache.set(game_id, games[game_id])
+
+        return games
+
+    async def get_games_for_names(self, name_list: List[str]) -> Dict[str, Optional[TwitchGame]]:
+        """
+        Look up games by their exact name, requested concurrently, up to 100 names per request. The found games
+        are added to the game cache.
+        :param name_list: List of game names
+        :return: dict of lower case name -> TwitchGame, or None if no game has the name.
+        """
+        names = list(dict.fromkeys(name_list))
+
+        size = self.MAX_IDS_PER_REQUEST
+        chunks = [names[i:i + size] for i in range(0, len(names), size)]
+        results = await asyncio.gather(*(self.get_games("?name=" + "&name=".join(quote(name) for name in chunk))
+                                         for chunk in chunks))
+
+        found = {}
+        for chunk_games in results:
+            for game in chunk_games:
+                self.game_cache.set(game.id, game)
+                found[game.name.lower()] = game
+        return {name.lower(): found.get(name.lower()) for name in names}
+
+    async def get_games(self, url_suffix: str) -> List[TwitchGame]:
+        async with await self._get(self.GAMES_PATH, url_suffix) as resp:
+            json_response = await self._read_json(resp)
+
+            game_data = json_response.get('data')
+            if not isinstance(game_data, list):
+                raise TwitchResponseError(f"Invalid twitch response for Games. Full response: {json_response}",
+                                          status=resp.status)
+
+            return [TwitchGame.from_json(game) for game in game_data]
 
     async def get_streams_for_multiple(self, user_id_list: List[str]) -> List[TwitchStream]:
         username_str = "&user_id=".join(user_id_list) # really, twitch?
@@ -101,19 +388,19 @@ class TwitchApi(object):
     async def get_streams_by_user_id(self, user_id: str) -> List[TwitchStream]:
         url_suffix = "?user_id={}".format(user_id) # really, twitch?
 
-        async with await self._get_session() as session:
-            async with session.get(self.TWITCH_API_PREFIX + self.STREAMS_PATH + url_suffix) as resp:
-                json_response =  await resp.json()
+        async with await self._get(self.STREAMS_PATH, url_suffix) as resp:
+            json_response = await self._read_json(resp)
 
-                streams = []
+            streams = []
 
-                stream_data = json_response.get('data', {})
-                if isinstance(stream_data, dict) and not stream_data:
-                    print(f"Invalid twitch response for Streams. Full response: {json_response}")
+            stream_data = json_response.get('data')
+            if not isinstance(stream_data, list):
+                raise TwitchResponseError(f"Invalid twitch response for Streams. Full response: {json_response}",
+                                          status=resp.status)
 
-                for stream in stream_data:
-                    streams.append(TwitchStream(**stream))
-                return streams
+            for stream in stream_data:
+                streams.append(TwitchStream.from_json(stream))
+            return streams
 
     async def get_live_stream_by_user_id(self, user_id: str) -> Optional[TwitchStream]:
         for stream in await self.get_streams_by_user_id(user_id):
@@ -125,3 +412,52 @@ class TwitchApi(object):
             if stream.is_live:
                 return True
         return False
+
+    async def get_eventsub_subscriptions(self) -> List[EventSubSubscription]:
+        """
+        Get every EventSub subscription of the application, following the pagination cursor.
+        :return: List of EventSubSubscription objects
+        """
+        subscriptions = []
+        url_suffix = ""
+
+        while True:
+            async with await self._get(self.EVENTSUB_SUBSCRIPTIONS_PATH, url_suffix) as resp:
+                json_response = await self._read_json(resp)
+
+            for subscription in json_response.get('data', []):
+                subscriptions.append(EventSubSubscription(**subscription))
+
+            cursor = json_response.get('pagination', {}).get('cursor')
+            if not cursor:
+                return subscriptions
+            url_suffix = "?after={}".format(cursor)
+
+    async def create_eventsub_subscription(self, sub_type: str, user_id: str, callback: str,
+                                           secret: str) -> EventSubSubscription:
+        """
+        Subscribe to an EventSub event of a broadcaster, delivered by webhook.
+        :param sub_type: Subscription type, eg. "stream.online"
+        :param user_id: Twitch user ID of the broadcaster
+        :param callback: URL Twitch sends the notifications to
+        :param secret: Secret Twitch signs the notifications with
+        :return: The created EventSubSubscription
+        """
+        body = {
+            "type": sub_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": str(user_id)},
+            "transport": {"method": "webhook", "callback": callback, "secret": secret}
+        }
+
+        async with await self._request("POST", self.EVENTSUB_SUBSCRIPTIONS_PATH, json=body) as resp:
+            json_response = await self._read_json(resp, expected_status=202)
+            return EventSubSubscription(**json_response['data'][0])
+
+    async def delete_eventsub_subscription(self, subscription_id: str):
+        url_suffix = "?id={}".format(subscription_id)
+
+        async with await self._request("DELETE", self.EVENTSUB_SUBSCRIPTIONS_PATH, url_suffix) as resp:
+            if resp.status not in (204, 404):
+                raise TwitchResponseError(f"Error deleting EventSub subscription {subscription_id}. "
+                                          f"Status: {resp.status}", status=resp.status)
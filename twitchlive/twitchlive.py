@@ -1,42 +1,107 @@
 import asyncio
+import datetime
+import io
+import json
+import re
+import secrets
+import time
 from collections import defaultdict
 from copy import deepcopy
-from typing import Optional, Tuple, Dict, Any, List
+from typing import Optional, Tuple, Dict, Any, List, Sequence
 
 import aiohttp
 import discord
 from redbot.core import Config, commands, checks
 from redbot.core.bot import Red
 from redbot.core.commands import Context
+from redbot.core.utils.menus import menu, DEFAULT_CONTROLS
 
 from cog_shared.seplib.classes.basesepcog import BaseSepCog
-from cog_shared.seplib.responses.embeds import ErrorReply, SuccessReply
+from cog_shared.seplib.responses.embeds import ErrorReply, SuccessReply, InfoReply
+from cog_shared.seplib.utils.metrics import RollingHistogram
 from twitchlive.models.common_models import StreamAnnouncement
-from twitchlive.twitchapi.twichobjects import TwitchUser
-from .twitchapi import TwitchApi
+from twitchlive.twitchapi.twichobjects import TwitchUser, TwitchStream, TwitchGame, TwitchApiError, \
+    TwitchCircuitOpenError
+from .activity import StreamerActivity, TIER_HOT, TIER_WARM, TIER_COLD, TIER_EVENTSUB
+from .announcedstore import AnnouncedStore
+from .announcer import AnnouncementFanout
+from .editqueue import AnnouncementEditQueue
+from .eventsub.receiver import EventSubReceiver
+from .eventsub.subscriptions import EventSubSubscriptionManager
+from .livecache import LiveStreamCache
+from .metrics import PollMetrics
+from .pollindex import PollIndex
+from .scheduler import TieredPollScheduler
+from .sessions import StreamSessions, StreamSession
+from .targets import AnnouncementTargets
+from .twitchapi import TwitchApi, TwitchApiPool
+from .twitchapi.circuitbreaker import CircuitBreaker
+
+TWITCH_LOGIN_PATTERN = re.compile(r"^[a-z0-9_]{1,25}$")
+
 
 class TwitchLive(BaseSepCog, commands.Cog):
 
     MONITOR_PROCESS_INTERVAL = 5
-    TWITCH_API_THROTTLE = 0.2
+    MAX_BULK_ADD = 1000
+    # how often the polling tiers of every streamer are re-evaluated
+    TIER_REFRESH_INTERVAL = 60
+    # streamers covered by EventSub are only polled in a fallback sweep for missed notifications
+    EVENTSUB_FALLBACK_INTERVAL = 300
+    EVENTSUB_RECONCILE_INTERVAL = 3600
+    EVENTSUB_DEFAULT_PORT = 8080
+    # a stream can take a moment to show up in the streams endpoint after its stream.online notification
+    ONLINE_LOOKUP_ATTEMPTS = 4
+    ONLINE_LOOKUP_DELAY = 5
     COG_CONFIG_SALT = "twitch.tv/seputaes"
+    LIVE_PAGE_SIZE = 10
+    LIVE_TITLE_LIMIT = 100
 
     def __init__(self, bot: Red):
 
         super(TwitchLive, self).__init__(bot=bot)
 
-        self.twitch_api = None  # type: Optional[TwitchApi]
+        self.twitch_api = None  # type: Optional[TwitchApiPool]
 
         self.twitch_config_cache = {}
         self.announce_cache = {}
-        self.already_announced_cache = set()
+        self.poll_index = PollIndex()
+        poll_intervals = dict(TieredPollScheduler.TIER_INTERVALS)
+        poll_intervals[TIER_EVENTSUB] = self.EVENTSUB_FALLBACK_INTERVAL
+        self.poll_scheduler = TieredPollScheduler(intervals=poll_intervals)
+        self.activity = StreamerActivity(config=self.config, logger=self.logger)
+        self.announced_store = AnnouncedStore(config=self.config, logger=self.logger)
+        self.announce_lock = asyncio.Lock()
+        self.announcer = AnnouncementFanout(logger=self.logger)
+        self.announce_targets = AnnouncementTargets(bot=self.bot)
+        self.metrics = PollMetrics()
+        self.live_cache = LiveStreamCache()
+        self.sessions = StreamSessions(config=self.config, logger=self.logger)
+        self.edit_queue = AnnouncementEditQueue(bot=self.bot, logger=self.logger)
+
+        self.eventsub_config_cache = {}
+        self.eventsub_receiver = None  # type: Optional[EventSubReceiver]
+        self.eventsub_manager = None  # type: Optional[EventSubSubscriptionManager]
+        self.eventsub_reconcile = asyncio.Event()
 
         self._add_future(self.__monitor_streams())
+        self._add_future(self.__reconcile_eventsub_loop())
+        self._add_future(self.__edit_ended_announcements())
         self._ensure_futures()
 
+    def __unload(self):
+        asyncio.ensure_future(self.__stop_eventsub())
+        if self.twitch_api is not None:
+            asyncio.ensure_future(self.twitch_api.close())
+
     def _register_config_entities(self, config: Config):
         config.register_global(twitch_config={})
+        config.register_global(eventsub={})
+        config.register_global(streamer_activity={})
         config.register_guild(announcements={})
+        config.register_guild(announced_streams={})
+        config.register_guild(stream_sessions={})
+        # legacy list of announced stream IDs, migrated into announced_streams on load
         config.register_guild(already_announced=[])
 
     async def _init_cache(self):
@@ -49,14 +114,24 @@ class TwitchLive(BaseSepCog, commands.Cog):
 
         for guild_id, guild_dict in guilds.items():
             announcements = guild_dict.get('announcements', {})
-            already_announced = guild_dict.get('already_announced', [])
 
             for user_id, metadata in announcements.items():
                 streamer_checks[int(guild_id)][str(user_id)] = metadata
 
-            self.already_announced_cache.update(set(already_announced))
+        # load what was already announced before any streamer is polled
+        await self.announced_store.load()
+
+        await self.activity.load()
+        await self.sessions.load()
 
         self.announce_cache = streamer_checks
+        self.poll_index.rebuild(streamer_checks)
+
+        # resolve where every announcement goes now that the guilds are loaded
+        for guild_id, announcements in streamer_checks.items():
+            for metadata in announcements.values():
+                self.announce_targets.get(guild_id, metadata.get('role_id'), metadata.get('channel_id'))
+        self.__refresh_tiers()
 
         # cache twitch configuration
         self.twitch_config_cache = await self.config.twitch_config()
@@ -64,16 +139,38 @@ class TwitchLive(BaseSepCog, commands.Cog):
         # init the api
         self.__init_twitch_api()
 
-    def __init_twitch_api(self):
+        self.eventsub_config_cache = await self.config.eventsub()
+        await self.__start_eventsub()
+
+    def __get_credentials(self) -> List[Tuple[str, str]]:
+        """
+        :return: List of (client ID, client secret) from the Twitch configuration, which holds either a list of
+                 credentials or a single client ID and secret.
+        """
+        if 'credentials' in self.twitch_config_cache:
+            return [(client_id, client_secret) for client_id, client_secret
+                    in self.twitch_config_cache['credentials'] if client_id and client_secret]
+
         client_id = self.twitch_config_cache.get('client_id')
         client_secret = self.twitch_config_cache.get('client_secret')
+        return [(client_id, client_secret)] if client_id and client_secret else []
+
+    def __init_twitch_api(self):
+        credentials = self.__get_credentials()
+
+        if not credentials:
+            if self.twitch_api is not None:
+                asyncio.ensure_future(self.twitch_api.close())
+            self.twitch_api = None
+            return
 
-        if client_id and client_secret:
-            self.twitch_api = TwitchApi(client_id=client_id, client_secret=client_secret)
+        if self.twitch_api is None:
+            self.twitch_api = TwitchApiPool(credentials)
+            return
 
-    async def __add_already_announced(self, guild: discord.Guild, stream_id: str):
-        self.already_announced_cache.add(stream_id)
-        await self.config.guild(guild).already_announced.set(list(self.already_announced_cache))
+        # clients with unchanged credentials are kept. Release the pooled connections of the ones replaced.
+        for client in self.twitch_api.set_credentials(credentials):
+            asyncio.ensure_future(client.close())
 
     async def __get_guild_announcements(self, guild: discord.Guild):
         return await self.config.guild(guild).announcements()
@@ -84,25 +181,72 @@ class TwitchLive(BaseSepCog, commands.Cog):
 
     async def __add_current_announcement(self, guild: discord.Guild, role: discord.Role,
                                          channel: discord.TextChannel, user: TwitchUser):
+        await self.__add_announcements(guild=guild, role=role, channel=channel, users=[user])
 
-        cur_announcements = await self.__get_guild_announcements(guild)
+    async def __add_announcements(self, guild: discord.Guild, role: discord.Role, channel: discord.TextChannel,
+                                  users: List[TwitchUser]) -> Tuple[List[TwitchUser], List[TwitchUser]]:
+        """
+        Add announcements for many Twitch users with a single Config write. Users which already have an
+        announcement on the guild are left as they are.
+        :param guild: discord.py Guild to add the announcements to
+        :param role: discord.py Role to mention
+        :param channel: discord.py TextChannel to announce in
+        :param users: List of TwitchUser objects
+        :return: Tuple of (users added, users which already had an announcement)
+        """
+        added = []
+        existing = []
 
-        metadata = {
-            'twitch_name': user.display_name,
-            'channel_id': channel.id,
-            'role_id': role.id,
-            'user_login': user.login,
-            'user_thumbnail': user.profile_image_url
-        }
+        async with self.config.guild(guild).announcements() as cur_announcements:
+            for user in users:
+                if user.id in cur_announcements:
+                    existing.append(user)
+                    continue
+
+                metadata = {
+                    'twitch_name': user.display_name,
+                    'channel_id': channel.id,
+                    'role_id': role.id,
+                    'user_login': user.login,
+                    'user_thumbnail': user.profile_image_url
+                }
+
+                cur_announcements[user.id] = metadata
+                added.append((user, metadata))
 
-        cur_announcements[user.id] = metadata
         # update the cache
         if not self.announce_cache.get(guild.id):
             self.announce_cache[guild.id] = {}
 
+        for user, metadata in added:
+            if isinstance(self.announce_cache.get(guild.id), dict):
+                self.announce_cache[guild.id][user.id] = metadata
+            self.poll_index.add(guild.id, user.id, metadata, tier=self.__poll_tier(user.id))
+
+        if added:
+            self.eventsub_reconcile.set()
+
+        return [user for user, _ in added], existing
+
+    async def __set_game_filter(self, guild: discord.Guild, user_id: str, games: List[TwitchGame]):
+        """
+        Set the games a guild's announcement of a streamer is limited to.
+        :param games: TwitchGame objects. Empty to announce every stream.
+        :return: None
+        """
+        async with self.config.guild(guild).announcements() as cur_announcements:
+            metadata = cur_announcements[user_id]
+            if games:
+                metadata['game_ids'] = [game.id for game in games]
+                metadata['game_names'] = [game.name for game in games]
+            else:
+                metadata.pop('game_ids', None)
+                metadata.pop('game_names', None)
+
+        # update the cache
         if isinstance(self.announce_cache.get(guild.id), dict):
-            self.announce_cache[guild.id][user.id] = metadata
-        await self.config.guild(guild).announcements.set(cur_announcements)
+            self.announce_cache[guild.id][user_id] = metadata
+        self.poll_index.add(guild.id, user_id, metadata)
 
     async def __remove_current_announcement(self, guild: discord.Guild, user_id: str):
         cur_announcements = await self.__get_guild_announcements(guild)
@@ -112,6 +256,12 @@ class TwitchLive(BaseSepCog, commands.Cog):
         # update the cache
         if isinstance(self.announce_cache.get(guild.id), dict):
             self.announce_cache[guild.id].pop(user_id, None)
+        self.poll_index.remove(guild.id, user_id)
+        self.eventsub_reconcile.set()
+
+        if not self.poll_index.subscriptions(user_id):
+            await self.activity.forget(user_id)
+            self.live_cache.discard(user_id)
 
         if removed:
             await self.config.guild(guild).announcements.set(cur_announcements)
@@ -119,80 +269,432 @@ class TwitchLive(BaseSepCog, commands.Cog):
     def __twitch_is_init(self):
         return self.twitch_api is not None
 
-    async def __monitor_streams(self):
+    def __poll_tier(self, user_id: str, now: Optional[float] = None) -> int:
+        """
+        :return: The polling tier of a streamer: the EventSub fallback tier if their stream.online and
+                 stream.offline notifications are active, otherwise the tier of their activity.
+        """
+        if self.__eventsub_is_active() and self.eventsub_manager is not None and \
+                str(user_id) in self.eventsub_manager.subscribed_user_ids:
+            return TIER_EVENTSUB
+        return self.activity.tier(user_id, now)
+
+    def __refresh_tiers(self):
+        now = time.time()
+        for user_id in self.poll_index.user_ids:
+            self.poll_index.set_tier(user_id, self.__poll_tier(user_id, now))
+
+    async def __observe_live(self, streams: List[TwitchStream]):
+        """
+        Record live streams in the streamers' activity, and poll them in the hot tier from now on unless EventSub
+        covers them.
+        :param streams: List of live TwitchStream objects
+        :return: None
+        """
+        self.metrics.live_streams.add(len(streams))
+        for stream in streams:
+            self.announced_store.touch(stream.id)
+            await self.activity.observe_live(stream)
+            if self.poll_index.subscriptions(stream.user_id) and \
+                    self.__poll_tier(stream.user_id) != TIER_EVENTSUB:
+                self.poll_index.set_tier(stream.user_id, TIER_HOT)
+
+    def __eventsub_is_active(self):
+        return self.eventsub_receiver is not None and self.eventsub_receiver.is_running
+
+    async def __start_eventsub(self):
+        """
+        Start the EventSub webhook receiver and subscription manager if EventSub mode is enabled.
+        :return: None
+        """
+        await self.__stop_eventsub()
+
+        callback_url = self.eventsub_config_cache.get('callback_url')
+        secret = self.eventsub_config_cache.get('secret')
+
+        if not self.eventsub_config_cache.get('enabled') or not self.__twitch_is_init() or not callback_url:
+            return
+
+        receiver = EventSubReceiver(secret=secret, handler=self.__handle_eventsub, logger=self.logger,
+                                    port=self.eventsub_config_cache.get('port', self.EVENTSUB_DEFAULT_PORT))
+        try:
+            await receiver.start()
+        except OSError as e:
+            self.logger.error(f"Could not start the EventSub receiver. Falling back to polling. {e}")
+            return
+
+        self.eventsub_receiver = receiver
+        # subscriptions belong to a Twitch application, so they are always managed with the primary credentials
+        self.eventsub_manager = EventSubSubscriptionManager(twitch_api=self.twitch_api.primary,
+                                                            callback_url=callback_url, secret=secret,
+                                                            logger=self.logger)
+        self.eventsub_reconcile.set()
+
+    async def __stop_eventsub(self):
+        receiver, self.eventsub_receiver, self.eventsub_manager = self.eventsub_receiver, None, None
+        if receiver is not None:
+            await receiver.stop()
+            # every streamer is back on the polling schedule of their activity
+            self.__refresh_tiers()
+
+    async def __reconcile_eventsub_loop(self):
+        """
+        Reconcile the EventSub subscriptions with the announced streamers whenever announcements change,
+        and periodically to recover revoked or failed subscriptions.
+        """
         await self.bot.wait_until_ready()
 
         while self == self.bot.get_cog(self.__class__.__name__):
+            try:
+                await asyncio.wait_for(self.eventsub_reconcile.wait(), timeout=self.EVENTSUB_RECONCILE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.eventsub_reconcile.clear()
+
+            manager = self.eventsub_manager
+            if manager is None:
+                continue
+
+            try:
+                created, deleted = await manager.reconcile(self.poll_index.user_ids)
+                self.logger.info(f"Reconciled EventSub subscriptions. Created: {created} | Deleted: {deleted} | "
+                                 f"Streamers covered: {len(manager.subscribed_user_ids)}/{len(self.poll_index)}")
+            except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(f"Error reconciling EventSub subscriptions: {e}")
+
+            # only the covered streamers move to the fallback sweep. The rest keep their normal schedule.
+            self.__refresh_tiers()
+
+    async def __handle_eventsub(self, message_type: str, subscription: dict, event: dict):
+        """
+        Handle an EventSub notification or revocation from the receiver.
+        :param message_type: EventSub message type
+        :param subscription: Subscription the message was delivered for
+        :param event: Event data of a notification
+        :return: None
+        """
+        if message_type == EventSubReceiver.TYPE_REVOCATION:
+            self.logger.warning(f"EventSub subscription {subscription.get('type')} for "
+                                f"{subscription.get('condition')} was revoked: {subscription.get('status')}")
+            self.eventsub_reconcile.set()
+            return
+
+        sub_type = subscription.get('type')
+        user_id = str(event.get('broadcaster_user_id'))
+
+        if sub_type == "stream.offline":
+            self.logger.info(f"Streamer {event.get('broadcaster_user_login')} went offline.")
+            self.live_cache.discard(user_id)
+            self.__end_sessions(self.sessions.end_user(user_id))
+            return
+
+        if sub_type != "stream.online" or event.get('type') != "live":
+            return
+
+        # the notification has no title or thumbnail, so look the stream up
+        for attempt in range(1, self.ONLINE_LOOKUP_ATTEMPTS + 1):
+            streams = await self.__get_streams_batch([user_id])
+            live = [stream for stream in streams or [] if stream.is_live]
+
+            if live:
+                self.live_cache.observe(live)
+                self.__end_sessions(self.sessions.observe_poll([user_id], live))
+                await self.__observe_live(live)
+                return await self.__announce_streams(live)
+
+            if attempt < self.ONLINE_LOOKUP_ATTEMPTS:
+                await asyncio.sleep(self.ONLINE_LOOKUP_DELAY)
+
+        self.logger.warning(f"Stream of {event.get('broadcaster_user_login')} was not found after its "
+                            f"stream.online notification. The next poll will pick it up.")
+
+    async def __get_streams_batch(self, user_ids: Sequence[str],
+                                  client: Optional[TwitchApi] = None) -> Optional[List[TwitchStream]]:
+        """
+        Get the streams for a batch of up to 100 user IDs, logging and swallowing API errors
+        so that one failed batch does not hold up the rest of the poll.
+        :param user_ids: List of Twitch user IDs
+        :param client: Client of the pool to request the batch with. Defaults to the clients the users belong to.
+        :return: List of TwitchStream objects, or None if the request failed.
+        """
+        try:
+            return await (client or self.twitch_api).get_streams_for_multiple(list(user_ids))
+        except TwitchCircuitOpenError:
+            # the outage is logged once, when the circuit opens
+            return None
+        except TwitchApiError as e:
+            self.logger.error(f"Error response from the Twitch API: {e}")
+            return None
+        except (aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error("Error connecting to the Twitch API.")
+            self.logger.error(e, exc_info=True)
+            return None
+
+    def __helix_requests(self) -> int:
+        if not self.__twitch_is_init():
+            return 0
+        return sum(client.metrics.requests.total for client in self.twitch_api.clients)
 
-            work_list = dict()
-            batch_size = 100
-            to_announce = []
+    def __poll_gauges(self) -> Dict[str, Tuple[str, float]]:
+        """
+        :return: dict of gauge name -> (help text, value) of the monitor's current state.
+        """
+        tiers = self.poll_index.tier_sizes()
+        return {
+            'streamers': ("Streamers polled.", len(self.poll_index)),
+            'streamers_hot': ("Streamers in the hot polling tier.", tiers.get(TIER_HOT, 0)),
+            'streamers_warm': ("Streamers in the warm polling tier.", tiers.get(TIER_WARM, 0)),
+            'streamers_cold': ("Streamers in the cold polling tier.", tiers.get(TIER_COLD, 0)),
+            'streamers_eventsub': ("Streamers covered by EventSub, polled as a fallback sweep.",
+                                   tiers.get(TIER_EVENTSUB, 0)),
+            'announced_streams': ("Streams remembered as announced.", len(self.announced_store)),
+            'eventsub_active': ("1 if EventSub notifications are active.", 1 if self.__eventsub_is_active() else 0),
+            'stream_sessions': ("Announced streams tracked until they end.", len(self.sessions)),
+            'edit_queue': ("Announcement edits waiting to be made.", len(self.edit_queue)),
+        }
 
-            # we'll batch the calls into groups of 100 (since the API allows us to ask for a max of 100 streams)
-            # combine everything into one giant list of dicts
-            for guild_id, guild_dict in self.announce_cache.items():
-                for user_id, metadata in guild_dict.items():
-                    if user_id not in work_list:
-                        work_list[user_id] = {
-                            'metadata': []
-                        }
-                    work_list[user_id]['metadata'].append(
-                        {
-                            'guild_id': guild_id,
-                            'role_id': metadata.get('role_id'),
-                            'channel_id': metadata.get('channel_id'),
-                            'twitch_name': metadata.get('twitch_name'),
-                            'user_login': metadata.get('user_login'),
-                            'user_thumbnail': metadata.get('user_thumbnail')
-                        }
-                    )
+    async def __get_games(self, streams: List[TwitchStream]) -> Dict[str, Optional[TwitchGame]]:
+        """
+        Get the games of the streams. Games are cached for a day, so this only makes requests, batched by up to
+        100 IDs, for games not seen recently. Errors are logged and swallowed; the announcements then go out
+        without their game.
+        :param streams: List of TwitchStream objects
+        :return: dict of game ID -> TwitchGame, or None if the game is unknown.
+        """
+        if not self.__twitch_is_init():
+            return {}
 
-            for i in range(0, len(work_list), batch_size):
-                batch_user_ids = list(work_list.keys())[i:i+batch_size]
+        try:
+            return await self.twitch_api.get_games_for_ids([stream.game_id for stream in streams])
+        except TwitchCircuitOpenError:
+            return {}
+        except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Error getting games from the Twitch API: {e}")
+            return {}
 
-                # get streams for these user_ids
-                try:
-                    streams = await self.twitch_api.get_streams_for_multiple(batch_user_ids)
-                except aiohttp.client_exceptions.ClientError as e:
-                    self.logger.error("Error connecting to the Twitch API.")
-                    self.logger.error(e, exc_info=True)
-                    continue
+    def __log_circuit_changes(self, previous_states: Dict[str, str]) -> Dict[str, str]:
+        """
+        Log when the circuit breaker of a Twitch API client opens or closes, rather than every failed request.
+        :param previous_states: dict of client ID -> circuit state at the previous check
+        :return: dict of client ID -> current circuit state
+        """
+        states = {}
+
+        for client in self.twitch_api.clients:
+            breaker = client.circuit_breaker
+            state = states[client.client_id] = breaker.state
+            previous_state = previous_states.get(client.client_id, CircuitBreaker.CLOSED)
+
+            if state == CircuitBreaker.OPEN and previous_state != CircuitBreaker.OPEN:
+                self.logger.error(f"Twitch API is failing for client {client.client_id}. Its streamers are polled "
+                                  f"by the other clients, if any, for {breaker.retry_after:.0f} seconds after "
+                                  f"{breaker.consecutive_failures} consecutive failures. "
+                                  f"Last error: {breaker.last_error}")
+            elif state == CircuitBreaker.CLOSED and previous_state != CircuitBreaker.CLOSED:
+                self.logger.info(f"Twitch API has recovered for client {client.client_id}.")
+        return states
+
+    async def __monitor_streams(self):
+        await self.bot.wait_until_ready()
+
+        # make the first cycle poll every hot streamer right away
+        last_poll = time.monotonic() - self.MONITOR_PROCESS_INTERVAL
+        last_tier_refresh = time.monotonic()
+        circuit_states = {}
+
+        while self == self.bot.get_cog(self.__class__.__name__):
 
-                for stream in streams:
-                    should_announce = stream.is_live and \
-                                      work_list.get(stream.user_id) and \
-                                      stream.id not in self.already_announced_cache
+            now = time.monotonic()
+            if now - last_tier_refresh >= self.TIER_REFRESH_INTERVAL:
+                self.__refresh_tiers()
+                last_tier_refresh = now
+
+            # the poll index keeps the user IDs split into batches of 100 (the most the API allows per request)
+            # and maps each user ID back to the guilds announcing them, so nothing is rebuilt per cycle.
+            # The scheduler picks the batches due in this cycle: every hot batch, and a slice of the slower tiers.
+            # Streamers covered by EventSub are in their own tier, swept every EVENTSUB_FALLBACK_INTERVAL.
+            # They are requested at once. TwitchApi paces them against the Helix rate limit, so a poll takes
+            # about one round trip while there is budget left and slows down on its own when there isn't.
+            #
+            # With several credential sets, the batches are regrouped by the client each user ID hashes to, so
+            # every client spends its own rate budget on its share of the streamers. A failing client's circuit
+            # breaker opens and its streamers move to the other clients until a probe batch succeeds again.
+            # Streamers with no closed client to fall to wait for the next cycle instead, which is after the probe
+            # either closed the circuit or opened it again.
+            # If every client is failing, skip the cycle rather than rotating the scheduler past batches which
+            # would not be polled.
+            if self.__twitch_is_init() and not self.twitch_api.available:
+                circuit_states = self.__log_circuit_changes(circuit_states)
+                await asyncio.sleep(self.MONITOR_PROCESS_INTERVAL)
+                continue
+
+            cycle_started = time.monotonic()
+            requests_before = self.__helix_requests()
+
+            due_batches = self.poll_scheduler.next_batches(self.poll_index, elapsed=now - last_poll)
+            last_poll = now
+            shards, deferred = self.twitch_api.shard_batches(due_batches) if self.__twitch_is_init() else ([], [])
+            self.poll_scheduler.defer(deferred)
+            batch_streams = await asyncio.gather(*(self.__get_streams_batch(batch, client)
+                                                   for client, batch in shards))
+            if self.__twitch_is_init():
+                circuit_states = self.__log_circuit_changes(circuit_states)
+
+            # keep the latest snapshot of every polled streamer for the `live` command, and edit the announcements
+            # of streams which ended
+            for (_, batch), streams in zip(shards, batch_streams):
+                if streams is not None:
+                    self.live_cache.update_batch(batch, streams)
+                    self.__end_sessions(self.sessions.observe_poll(batch, streams))
+
+            for session in self.sessions.expire():
+                await self.sessions.forget(session.stream_id, session.messages)
+
+            live = []
+            for streams in batch_streams:
+                for stream in streams or []:
+                    if stream.is_live:
+                        live.append(stream)
+            await self.__observe_live(live)
+
+            # expiring entries of ended streams is only safe when every batch was polled successfully.
+            # The slowest tier is swept well within AnnouncedStore.ENDED_GRACE.
+            if self.__twitch_is_init() and None not in batch_streams:
+                await self.announced_store.prune()
+
+            announced = await self.__announce_streams(live)
+            self.metrics.observe_cycle(duration=time.monotonic() - cycle_started, batches=len(shards),
+                                       failed_batches=batch_streams.count(None),
+                                       requests=self.__helix_requests() - requests_before, live=len(live),
+                                       announced=announced)
 
-                    if should_announce:
-                        announce_data = work_list[stream.user_id]['metadata']  # type: List[Dict[str, Any]]
+            await asyncio.sleep(self.MONITOR_PROCESS_INTERVAL)
 
-                        for info_dict in announce_data:
-                            info_dict['stream_title'] = stream.title
-                            info_dict['stream_url'] = "https://twitch.tv/{}".format(info_dict.get('user_login'))
-                            info_dict['stream_id'] = stream.id
-                            info_dict['stream_thumbnail'] = stream.thumbnail_url
+    async def __announce_streams(self, streams: List[TwitchStream]):
+        """
+        Announce live streams in every guild which announces the streamer and has not announced the stream yet.
+        The announcements are marked as sent before fanning out, so a stream reported by both EventSub and a poll
+        is only announced once. Sent announcements are persisted together once the fan-out finishes; ones which
+        failed with a transient error are unmarked, so the next cycle retries them.
+        :param streams: List of live TwitchStream objects
+        :return: Number of announcements sent
+        """
+        games = await self.__get_games(streams)
 
-                        to_announce += announce_data
-                await asyncio.sleep(self.TWITCH_API_THROTTLE)
+        async with self.announce_lock:
+            to_announce = []
 
-            # process the announcement list
-            for data in to_announce:
+            for stream in streams:
+                # the embed is rendered once per stream and shared by every guild announcing it. Guilds only
+                # get their own if they stored different details for the streamer.
+                embeds = {}
+                game = games.get(str(stream.game_id))
+
+                for guild_id, metadata in self.poll_index.subscriptions(stream.user_id).items():
+                    if self.announced_store.contains(guild_id, stream.id):
+                        continue
+
+                    # streams outside of the chosen games are skipped without marking them, so they are announced
+                    # if the streamer switches to one of the games later in the stream
+                    game_ids = metadata.get('game_ids')
+                    if game_ids and str(stream.game_id) not in game_ids:
+                        continue
+
+                    embed_key = (metadata.get('twitch_name'), metadata.get('user_login'),
+                                 metadata.get('user_thumbnail'))
+
+                    announcement = StreamAnnouncement(
+                        target=self.announce_targets.get(guild_id, metadata.get('role_id'),
+                                                         metadata.get('channel_id')),
+                        guild_id=guild_id,
+                        role_id=metadata.get('role_id'),
+                        channel_id=metadata.get('channel_id'),
+                        twitch_name=metadata.get('twitch_name'),
+                        user_login=metadata.get('user_login'),
+                        user_thumbnail=metadata.get('user_thumbnail'),
+                        stream_title=stream.title,
+                        stream_url="https://twitch.tv/{}".format(metadata.get('user_login')),
+                        stream_id=stream.id,
+                        stream_thumbnail=stream.thumbnail_url,
+                        embed=embeds.get(embed_key),
+                        game_name=game.name if game is not None else None,
+                        game_box_art=game.get_box_art() if game is not None else None
+                    )
 
-                announcement = StreamAnnouncement(bot=self.bot, **data)
+                    if not announcement.is_valid:
+                        self.logger.error("Announcement is not valid. g:{}|c:{}|s:{}".format(
+                            announcement.guild_id, announcement.channel_id, announcement.twitch_name
+                        ))
+                        continue
+
+                    self.announced_store.mark(guild_id, stream.id)
+                    embeds[embed_key] = announcement.embed
+                    to_announce.append(announcement)
+
+        if not to_announce:
+            return 0
+
+        results = await self.announcer.send_all(to_announce)
+
+        streams_by_id = {stream.id: stream for stream in streams}
+        sent_at = time.time()
+        sent = 0
+        messages = defaultdict(list)  # type: Dict[str, List[StreamAnnouncement]]
+
+        persist = []
+        for announcement, result in results.items():
+            if result == AnnouncementFanout.SENT:
+                sent += 1
+                messages[announcement.stream_id].append(announcement)
+                started_at = streams_by_id[announcement.stream_id].started_at
+                if started_at is not None:
+                    self.metrics.announce_delay_seconds.observe(sent_at - started_at.timestamp())
+            else:
+                self.metrics.announcement_failures.add()
+
+            if result == AnnouncementFanout.FAILED_TRANSIENT:
+                self.announced_store.unmark(announcement.guild_id, announcement.stream_id)
+            else:
+                persist.append((announcement.guild_id, announcement.stream_id))
+
+        self.metrics.announcements.add(sent)
+        await self.announced_store.persist(persist)
+
+        # track the sent messages, to edit them once the stream ends
+        for stream_id, announcements in messages.items():
+            first = announcements[0]
+            await self.sessions.record(
+                sent=[(a.guild_id, a.channel_id, a.message_id) for a in announcements],
+                stream=streams_by_id[stream_id], twitch_name=first.twitch_name, stream_url=first.stream_url,
+                user_thumbnail=first.user_thumbnail
+            )
+        return sent
+
+    def __end_sessions(self, sessions: List[StreamSession]):
+        for session in sessions:
+            self.logger.info(f"Stream of {session.twitch_name} ended. Editing {len(session.messages)} announcement(s).")
+            self.edit_queue.put(session)
+
+    async def __edit_ended_announcements(self):
+        """
+        Edit the announcements of ended streams into a summary, as paced by the edit queue.
+        :return: None
+        """
+        await self.bot.wait_until_ready()
 
-                if not announcement.is_valid:
-                    self.logger.error("Announcement is not valid. g:{}|c:{}|s:{}".format(
-                        announcement.guild.id, announcement.channel.id, announcement.twitch_name
-                    ))
-                    continue
+        while self == self.bot.get_cog(self.__class__.__name__):
+            job = await self.edit_queue.get(timeout=self.MONITOR_PROCESS_INTERVAL)
+            if job is None:
+                continue
 
-                await self.__add_already_announced(guild=announcement.guild, stream_id=announcement.stream_id)
-                self.logger.info("Announcing streamer {}. Guild: {} | Channel: {}".format(
-                    announcement.twitch_name, announcement.guild.id, announcement.channel.id
-                ))
-                await announcement.channel.send(content=announcement.message_content, embed=announcement.embed)
+            session, guild_id, attempt = job
+            result = await self.edit_queue.edit(session, guild_id)
 
-            await asyncio.sleep(self.MONITOR_PROCESS_INTERVAL)
+            if result == AnnouncementEditQueue.FAILED and self.edit_queue.retry(session, guild_id, attempt):
+                continue
+            if result == AnnouncementEditQueue.EDITED:
+                self.metrics.announcement_edits.add()
+            await self.sessions.forget(session.stream_id, [guild_id])
 
     @staticmethod
     async def __check_announce_permissions(channel: discord.TextChannel, role: discord.Role) -> Tuple[bool, str]:
@@ -220,6 +722,40 @@ class TwitchLive(BaseSepCog, commands.Cog):
         """
         return discord.utils.get(guild.roles, id=role_id)
 
+    # Keep the resolved announcement targets current
+    async def on_guild_available(self, guild: discord.Guild):
+        self.announce_targets.refresh_guild(guild.id)
+
+    async def on_guild_unavailable(self, guild: discord.Guild):
+        self.announce_targets.refresh_guild(guild.id)
+
+    async def on_guild_join(self, guild: discord.Guild):
+        self.announce_targets.refresh_guild(guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.announce_targets.refresh_guild(guild.id)
+
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        self.announce_targets.refresh_guild(after.id)
+
+    async def on_guild_role_create(self, role: discord.Role):
+        self.announce_targets.refresh_guild(role.guild.id)
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.announce_targets.refresh_guild(role.guild.id)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.announce_targets.refresh_guild(after.guild.id)
+
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        self.announce_targets.refresh_guild(channel.guild.id)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.announce_targets.refresh_guild(channel.guild.id)
+
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        self.announce_targets.refresh_guild(after.guild.id)
+
     @commands.group(name="twitchlive", aliases=['tl'], invoke_without_command=True)
     @checks.is_owner()
     async def _twitchlive(self, ctx: Context):
@@ -227,12 +763,17 @@ class TwitchLive(BaseSepCog, commands.Cog):
 
     @_twitchlive.command(name="configure")
     @checks.is_owner()
-    async def _configure(self, ctx: Context, client_id: str, client_secret: str):
+    async def _configure(self, ctx: Context, client_id: str, client_secret: str, *more_credentials: str):
         """
         Configures the TwitchLive cog to use the specified client ID and client secret for the Twitch API.
 
+        Each Twitch application has its own API rate budget. To track more streamers, give the client IDs and
+        secrets of several applications, eg. `configure id1 secret1 id2 secret2`. The streamers are split across
+        them, and move to the others while one is failing.
+
         :param client_id: Twitch application Client ID
         :param client_secret: Twitch application Client Secret
+        :param more_credentials: Client IDs and secrets of more Twitch applications, in pairs.
         """
 
         if ctx.guild is not None and not isinstance(ctx.channel, discord.DMChannel):
@@ -242,10 +783,20 @@ class TwitchLive(BaseSepCog, commands.Cog):
             await ctx.channel.delete_messages([ctx.message])
             return await ErrorReply("For security purposes, this command must be run via whisper/DM to me.").send(ctx)
 
-        new_config = {
-            'client_id': client_id,
-            'client_secret': client_secret
-        }
+        if len(more_credentials) % 2:
+            return await ErrorReply("Every client ID needs a client secret. No changes made.").send(ctx)
+
+        credentials = [(client_id, client_secret)] + list(zip(more_credentials[::2], more_credentials[1::2]))
+        if len({cred_id for cred_id, _ in credentials}) != len(credentials):
+            return await ErrorReply("The same client ID was given more than once. No changes made.").send(ctx)
+
+        if len(credentials) == 1:
+            new_config = {
+                'client_id': client_id,
+                'client_secret': client_secret
+            }
+        else:
+            new_config = {'credentials': [[cred_id, cred_secret] for cred_id, cred_secret in credentials]}
         # update the cache
         current_cache = deepcopy(self.twitch_config_cache)
         current_db_config = deepcopy(await self.config.twitch_config())
@@ -261,10 +812,15 @@ class TwitchLive(BaseSepCog, commands.Cog):
         if not success:
             self.twitch_config_cache = current_cache
             await self.config.twitch_config.set(current_db_config)
+            self.__init_twitch_api()
             self.logger.info(exception)
             return await ErrorReply("{}. No changes made.".format(exception)).send(ctx)
 
-        self.logger.info("Twitch API configured for Cog. Client ID: {}".format(client_id))
+        # the EventSub subscription manager uses the API client, so restart it with the new one
+        await self.__start_eventsub()
+
+        self.logger.info("Twitch API configured for Cog. Client IDs: {}".format(
+            ", ".join(cred_id for cred_id, _ in credentials)))
         await ctx.tick()
 
 
@@ -285,17 +841,16 @@ class TwitchLive(BaseSepCog, commands.Cog):
 
         twitch_user = twitch_user.lower()
 
-        users = await self.twitch_api.get_users_by_login(username=twitch_user)
+        try:
+            users = await self.twitch_api.get_users_for_logins([twitch_user])
+        except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            return await ErrorReply(f"Could not look up the Twitch user: {e}").send(ctx)
+        user = users.get(twitch_user)
 
-        if not users:
+        if user is None:
             return await ErrorReply("That Twitch user was not found").send(ctx)
 
-        user = users[0]
-
-        user_ids = await self.twitch_api.get_user_ids_for_logins([user.login])
-        user_id = user_ids.get(twitch_user)
-
-        curr_for_user = await self.__get_current_announcement(ctx.guild, user_id)
+        curr_for_user = await self.__get_current_announcement(ctx.guild, user.id)
         if curr_for_user:
             role_id = curr_for_user.get('role_id')
             channel_id = curr_for_user.get('channel_id')
@@ -308,6 +863,92 @@ class TwitchLive(BaseSepCog, commands.Cog):
         await self.__add_current_announcement(guild=ctx.guild, role=role, channel=channel, user=user)
         await ctx.tick()
 
+    @_twitchlive.command(name="bulkadd")
+    @commands.guild_only()
+    @checks.is_owner()
+    async def _bulkadd(self, ctx: Context, role: discord.Role, channel: discord.TextChannel, *twitch_users: str):
+        """
+        Adds announcements for many Twitch users at once, all mentioning the same role in the same channel.
+
+        List the Twitch users after the channel, or attach a text file with one user per line (or separated by
+        commas/spaces). Channel URLs like `https://twitch.tv/name` work too. Users which already have an announcement
+        on this server are skipped.
+        """
+        if not self.__twitch_is_init():
+            self.logger.info("Attempted to execute 'bulkadd' command without Twitch API configured.")
+            return await ErrorReply("Twitch API is not initialized. Please run the `configure` sub-command.").send(ctx)
+
+        success, response_msg = await self.__check_announce_permissions(channel=channel, role=role)
+
+        if not success:
+            self.logger.info(f"Bot does not have the proper permissions to announce. c:{channel.id}|{role.id}. Error:"
+                             f"{response_msg}")
+            return await ErrorReply(response_msg).send(ctx)
+
+        text = " ".join(twitch_users)
+        for attachment in ctx.message.attachments:
+            buffer = io.BytesIO()
+            await attachment.save(buffer)
+            text += "\n" + buffer.getvalue().decode('utf-8', errors='ignore')
+
+        logins, invalid = self.__parse_twitch_logins(text)
+
+        if not logins:
+            return await ErrorReply("No valid Twitch users were given. List them after the channel, "
+                                    "or attach a text file.").send(ctx)
+
+        if len(logins) > self.MAX_BULK_ADD:
+            return await ErrorReply(f"At most {self.MAX_BULK_ADD} Twitch users can be added at once. "
+                                    f"Got {len(logins)}.").send(ctx)
+
+        try:
+            async with ctx.typing():
+                users = await self.twitch_api.get_users_for_logins(logins)
+        except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            return await ErrorReply(f"Could not look up the Twitch users: {e}").send(ctx)
+
+        found = [user for user in users.values() if user is not None]
+        not_found = [login for login, user in users.items() if user is None] + invalid
+
+        added, existing = await self.__add_announcements(guild=ctx.guild, role=role, channel=channel, users=found)
+        self.logger.info(f"Bulk added {len(added)} announcements. g:{ctx.guild.id}|c:{channel.id}|r:{role.id}")
+
+        message = f"Added **{len(added)}** announcements for role `{role.name}` in {channel.mention}."
+        if existing:
+            message += f"\n**Already announced on this server ({len(existing)}):** " + \
+                       self.__truncate_list(user.login for user in existing)
+        if not_found:
+            message += f"\n**Not found ({len(not_found)}):** " + self.__truncate_list(not_found)
+
+        await SuccessReply(message).send(ctx)
+
+    @staticmethod
+    def __parse_twitch_logins(text: str) -> Tuple[List[str], List[str]]:
+        """
+        Parse Twitch logins from free text, separated by whitespace or commas.
+        :param text: Text containing logins or twitch.tv channel URLs.
+        :return: Tuple of (unique valid logins in lower case, invalid entries)
+        """
+        logins = []
+        invalid = []
+
+        for entry in re.split(r"[\s,;]+", text):
+            login = entry.strip().rstrip('/').split('/')[-1].lower()
+            if not login:
+                continue
+            if TWITCH_LOGIN_PATTERN.match(login):
+                logins.append(login)
+            else:
+                invalid.append(entry)
+
+        return list(dict.fromkeys(logins)), invalid
+
+    @staticmethod
+    def __truncate_list(items, limit: int = 30) -> str:
+        items = list(items)
+        text = ", ".join(f"`{item}`" for item in items[:limit])
+        return text + (f" and {len(items) - limit} more" if len(items) > limit else "")
+
     @_twitchlive.command(name="remove")
     @commands.guild_only()
     @checks.is_owner()
@@ -318,7 +959,10 @@ class TwitchLive(BaseSepCog, commands.Cog):
 
         twitch_user = twitch_user.lower()
 
-        user_ids = await self.twitch_api.get_user_ids_for_logins([twitch_user])
+        try:
+            user_ids = await self.twitch_api.get_user_ids_for_logins([twitch_user])
+        except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            return await ErrorReply(f"Could not look up the Twitch user: {e}").send(ctx)
         user_id = user_ids.get(twitch_user)
 
         if not user_id:
@@ -332,3 +976,269 @@ class TwitchLive(BaseSepCog, commands.Cog):
         role = self.__get_role_by_id(ctx.guild, int(role_id))
         await self.__remove_current_announcement(guild=ctx.guild, user_id=user_id)
         await SuccessReply(f"Removed Announcement. It was assigned to Role: `{role.name}`").send(ctx)
+
+    @_twitchlive.command(name="games")
+    @commands.guild_only()
+    @checks.is_owner()
+    async def _games(self, ctx: Context, twitch_user: str, *games: str):
+        """
+        Only announces a streamer while they stream one of the given games or categories.
+
+        Game names must match Twitch's exactly; quote names with spaces, eg. `games shroud "Just Chatting" VALORANT`.
+        Give no games to announce every stream of the streamer again.
+        """
+        if not self.__twitch_is_init():
+            self.logger.info("Attempted to execute 'games' command without Twitch API configured.")
+            return await ErrorReply("Twitch API is not initialized. Please run the `configure` sub-command.").send(ctx)
+
+        twitch_user = twitch_user.lower()
+
+        try:
+            user_ids = await self.twitch_api.get_user_ids_for_logins([twitch_user])
+            found = await self.twitch_api.get_games_for_names(list(games)) if games else {}
+        except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+            return await ErrorReply(f"Could not look up the Twitch user or games: {e}").send(ctx)
+        user_id = user_ids.get(twitch_user)
+
+        if not user_id:
+            return await ErrorReply("That Twitch user was not found").send(ctx)
+        if not await self.__get_current_announcement(ctx.guild, user_id):
+            return await ErrorReply("An announcement does not exist for that Twitch user.").send(ctx)
+
+        missing = [name for name, game in found.items() if game is None]
+        if missing:
+            return await ErrorReply(f"Games not found on Twitch: {self.__truncate_list(missing)}").send(ctx)
+
+        await self.__set_game_filter(ctx.guild, user_id, list(found.values()))
+        if not found:
+            return await SuccessReply(f"Announcing every stream of `{twitch_user}`.").send(ctx)
+        names = ", ".join(f"`{game.name}`" for game in found.values())
+        await SuccessReply(f"Only announcing `{twitch_user}` while streaming: {names}").send(ctx)
+
+    @commands.command(name="livenow")
+    @commands.guild_only()
+    @checks.mod_or_permissions(manage_guild=True)
+    async def _livenow(self, ctx: Context):
+        """
+        Shows the streamers announced in this server who are live right now.
+
+        The list is taken from the latest poll of each streamer, so it makes no Twitch API requests.
+        """
+        announcements = self.announce_cache.get(ctx.guild.id) or {}
+        streams = self.live_cache.live(announcements.keys())
+
+        if not streams:
+            return await InfoReply("None of the streamers announced in this server are live right now.").send(ctx)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        entries = []
+        for stream in streams:
+            metadata = announcements.get(str(stream.user_id), {})
+            name = metadata.get('twitch_name') or stream.user_name
+            login = metadata.get('user_login') or (stream.user_name or "").lower()
+            title = stream.title or ""
+            if len(title) > self.LIVE_TITLE_LIMIT:
+                title = title[:self.LIVE_TITLE_LIMIT - 1] + "…"
+
+            uptime = "unknown"
+            if stream.started_at is not None:
+                uptime = StreamAnnouncement.format_duration(max((now - stream.started_at).total_seconds(), 0))
+
+            # only games already cached by the polls, this command makes no requests
+            game = self.twitch_api.get_cached_game(stream.game_id) if self.__twitch_is_init() else None
+            playing = f" | {game.name}" if game is not None else ""
+
+            entries.append(f"**[{name}](https://twitch.tv/{login})**{playing} | "
+                           f"{stream.viewer_count or 0} viewers | up {uptime}\n{title}")
+
+        pages = []
+        page_count = (len(entries) + self.LIVE_PAGE_SIZE - 1) // self.LIVE_PAGE_SIZE
+        for page in range(page_count):
+            chunk = entries[page * self.LIVE_PAGE_SIZE:(page + 1) * self.LIVE_PAGE_SIZE]
+            embed = InfoReply(f"**Live now:** {len(entries)} streamer(s)\n\n" + "\n\n".join(chunk)).build()
+            embed.set_footer(text=f"Page {page + 1}/{page_count}")
+            pages.append(embed)
+
+        if len(pages) == 1:
+            return await ctx.send(embed=pages[0])
+        await menu(ctx, pages, DEFAULT_CONTROLS)
+
+    @_twitchlive.command(name="status")
+    @checks.is_owner()
+    async def _status(self, ctx: Context):
+        """
+        Shows the health of the Twitch API connection.
+
+        While Twitch is failing, polling pauses with an increasing backoff and resumes on its own once a probe
+        request succeeds.
+        """
+        if not self.__twitch_is_init():
+            return await ErrorReply("Twitch API is not initialized. Please run the `configure` sub-command.").send(ctx)
+
+        # how many streamers each client polls right now, including the ones it took over from failing clients
+        shares = defaultdict(int)
+        for user_id in self.poll_index.user_ids:
+            shares[self.twitch_api.client_for(user_id).client_id] += 1
+
+        lines = []
+        for client in self.twitch_api.clients:
+            breaker = client.circuit_breaker
+            state = breaker.state
+
+            lines.append(f"**Client `{client.client_id[:8]}…`:** circuit `{state}` | "
+                         f"polling {shares[client.client_id]} streamers")
+            lines.append(f"Consecutive failures: {breaker.consecutive_failures} | "
+                         f"Times opened: {breaker.times_opened}")
+            if state == CircuitBreaker.OPEN:
+                lines.append(f"Next probe in: {breaker.retry_after:.0f}s")
+            if breaker.last_error is not None:
+                ago = time.time() - breaker.last_failure_at
+                lines.append(f"Last error ({ago:.0f}s ago): `{breaker.last_error}`")
+        lines.append(f"**Streamers polled:** {len(self.poll_index)}")
+        lines.append(f"**EventSub:** {'active' if self.__eventsub_is_active() else 'inactive'}")
+
+        healthy = all(client.circuit_breaker.state == CircuitBreaker.CLOSED for client in self.twitch_api.clients)
+        reply = SuccessReply if healthy else ErrorReply
+        await reply("\n".join(lines)).send(ctx)
+
+    @_twitchlive.group(name="stats", invoke_without_command=True)
+    @checks.is_owner()
+    async def _stats(self, ctx: Context):
+        """
+        Shows recent poll cycle, announcement and Twitch API metrics.
+        """
+        metrics = self.metrics
+        gauges = self.__poll_gauges()
+
+        def fmt_seconds(histogram: RollingHistogram) -> str:
+            return " / ".join(PollMetrics.format_seconds(histogram.percentile(p), histogram) for p in (50, 95, 99))
+
+        def fmt_count(histogram: RollingHistogram) -> str:
+            values = (histogram.percentile(p) for p in (50, 95, 99))
+            return " / ".join("n/a" if value is None else f"> {histogram.bounds[-1]:g}" if value == float('inf')
+                              else f"<= {value:g}" for value in values)
+
+        lines = [f"**Last {int(metrics.cycles.window // 60)} minutes** (p50 / p95 / p99)",
+                 f"Poll cycles: {metrics.cycles.recent()} | batches: {metrics.batches.recent()} | "
+                 f"failed batches: {metrics.failed_batches.recent()}",
+                 f"Cycle duration: {fmt_seconds(metrics.cycle_duration_seconds)}",
+                 f"Helix requests per cycle: {fmt_count(metrics.cycle_requests)}",
+                 f"Announcements: {metrics.announcements.recent()} sent | "
+                 f"{metrics.announcement_failures.recent()} failed",
+                 f"Announce delay after going live: {fmt_seconds(metrics.announce_delay_seconds)}",
+                 f"Ended streams: {metrics.announcement_edits.recent()} announcements edited | "
+                 f"{gauges['edit_queue'][1]} queued | {gauges['stream_sessions'][1]} streams tracked"]
+
+        last_cycle = metrics.last_cycle
+        if last_cycle:
+            lines.append(f"**Last cycle** ({time.time() - last_cycle['finished_at']:.0f}s ago): "
+                         f"{last_cycle['duration']:.2f}s | {last_cycle['batches']} batches | "
+                         f"{last_cycle['requests']} requests | {last_cycle['live']} live | "
+                         f"{last_cycle['announced']} announced")
+
+        if self.__twitch_is_init():
+            for client in self.twitch_api.clients:
+                client_metrics, limiter = client.metrics, client.rate_limiter
+                latency = client_metrics.request_latency
+                errors = sum(counter.recent() for counter in (client_metrics.client_errors,
+                                                              client_metrics.server_errors,
+                                                              client_metrics.connection_errors))
+
+                lines.append(f"**Client `{client.client_id[:8]}…`:** {client_metrics.requests.recent()} requests | "
+                             f"{client_metrics.rate_limited.recent()} rate limited | {errors} errors")
+                lines.append(f"Rate limit: {max(limiter.tokens, 0.0):.0f} / {limiter.limit} points left | "
+                             f"latency p95: {PollMetrics.format_seconds(latency.percentile(95), latency)}")
+
+        lines.append(f"**Streamers:** {gauges['streamers'][1]} (hot {gauges['streamers_hot'][1]} / "
+                     f"warm {gauges['streamers_warm'][1]} / cold {gauges['streamers_cold'][1]} / "
+                     f"EventSub {gauges['streamers_eventsub'][1]})")
+
+        await InfoReply("\n".join(lines)).send(ctx)
+
+    @_stats.command(name="export")
+    @checks.is_owner()
+    async def _stats_export(self, ctx: Context, export_format: str = "prometheus"):
+        """
+        Uploads the poll and Twitch API metrics as a file.
+
+        Formats: `prometheus` (text exposition format) or `json`.
+        """
+        export_format = export_format.lower()
+        gauges = self.__poll_gauges()
+        clients = self.twitch_api.clients if self.__twitch_is_init() else []
+
+        if export_format == "prometheus":
+            data = self.metrics.render_prometheus(gauges, clients)
+            filename = "twitchlive.prom"
+        elif export_format == "json":
+            data = json.dumps(self.metrics.export(gauges, clients), indent=2)
+            filename = "twitchlive.json"
+        else:
+            return await ErrorReply(f"Unknown export format `{export_format}`. Use `prometheus` or `json`.").send(ctx)
+
+        await ctx.send(file=discord.File(io.BytesIO(data.encode('utf-8')), filename=filename))
+
+    @_twitchlive.group(name="eventsub", invoke_without_command=True)
+    @checks.is_owner()
+    async def _eventsub(self, ctx: Context):
+        """
+        Push mode. Twitch notifies the bot when streamers go live, instead of the bot polling every streamer.
+
+        Polling continues as a slow fallback sweep for the streamers EventSub covers. Streamers whose
+        subscriptions could not be created are polled as usual.
+        """
+        await ctx.send_help()
+
+    @_eventsub.command(name="enable")
+    @checks.is_owner()
+    async def _eventsub_enable(self, ctx: Context, callback_url: str, port: int = EVENTSUB_DEFAULT_PORT):
+        """
+        Enables EventSub. The bot listens for webhooks on the given port.
+
+        :param callback_url: Public HTTPS URL which forwards to the bot's port, eg. `https://bot.example.com/eventsub`
+        :param port: Local port for the webhook receiver to listen on.
+        """
+        if not self.__twitch_is_init():
+            self.logger.info("Attempted to execute 'eventsub enable' command without Twitch API configured.")
+            return await ErrorReply("Twitch API is not initialized. Please run the `configure` sub-command.").send(ctx)
+
+        if not callback_url.startswith("https://"):
+            return await ErrorReply("Twitch only delivers EventSub webhooks to HTTPS callback URLs.").send(ctx)
+
+        self.eventsub_config_cache = {
+            'enabled': True,
+            'callback_url': callback_url,
+            'port': port,
+            'secret': secrets.token_hex(32)
+        }
+        await self.config.eventsub.set(self.eventsub_config_cache)
+        await self.__start_eventsub()
+
+        if not self.__eventsub_is_active():
+            return await ErrorReply(f"Could not listen on port `{port}`. Check the logs for more details. "
+                                    f"Polling remains active.").send(ctx)
+
+        self.logger.info(f"EventSub enabled. Callback: {callback_url} | Port: {port}")
+        await SuccessReply(f"EventSub enabled. Subscribing to {len(self.poll_index)} streamers via "
+                           f"`{callback_url}`.").send(ctx)
+
+    @_eventsub.command(name="disable")
+    @checks.is_owner()
+    async def _eventsub_disable(self, ctx: Context):
+        """
+        Disables EventSub, deletes its subscriptions and goes back to polling every streamer.
+        """
+        manager = self.eventsub_manager
+
+        self.eventsub_config_cache = {}
+        await self.config.eventsub.set({})
+        await self.__stop_eventsub()
+
+        if manager is not None:
+            try:
+                await manager.reconcile([])
+            except (TwitchApiError, aiohttp.client_exceptions.ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(f"Error deleting EventSub subscriptions: {e}")
+
+        self.logger.info("EventSub disabled.")
+        await ctx.tick()